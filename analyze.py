@@ -1,131 +1,324 @@
-from blinkit import extract_image_urls_from_url, modify_image_url, open_image_from_url
-import google.generativeai as genai
+from blinkit import scrape_product, modify_image_url
+from images import download_image_parts, prepare_uploads
 import os
-from dotenv import load_dotenv
+import contextvars
 import json
-from prompts import analyze_food_prompt, extract_ingredients_and_nutrition_prompt
+import queue
+import threading
+import time
+from prompts import analyze_food_prompt, extract_ingredients_and_nutrition_prompt, extraction_prompt_version
+from cache import CACHE_DIR, DiskCache, stable_hash
 from flask import jsonify
-import PIL.Image
-import pandas as pd
-from googli import analyze_google_sync
-from mistralai import Mistral
+from googli import analyze_google
+from pipeline import Stage, StageGraph
+from safety_index import build_safety_index, NO_CLASSIFICATION
+from ingredients import parse_ingredients, iter_components, search_terms
+from refdata import load_reference_data
+from fuzzy import FuzzyIndex
+from metrics import PROMPT_TOKENS, get_logger, span
+from compaction import PROMPT_COMPACTION, compact_product_data
+from nutrition import score_label, with_nutrition_facts
+from providers import get_provider
+from resilience import call_provider, request_deadline
+
+MODEL_CACHE_TTL = int(os.getenv("MODEL_CACHE_TTL", str(30 * 24 * 60 * 60)))
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "10000"))
+
+# Default timeouts in seconds of the analysis pipeline stages
+STAGE_TIMEOUTS = {
+    "reference": 120,
+    "scrape": 120,
+    "images": 60,
+    "extract": 180,
+    "parse": 10,
+    "safety": 30,
+    "search": 60,
+    "product": 10,
+    "analysis": 180,
+}
+
+logger = get_logger("analyze")
+
+_safety_index = None
+_fuzzy_index = None
+_model_cache = None
+
+def get_safety_index():
+    """Return the SafetyIndex for the current reference artifact, rebuilding it only if the artifact changed"""
+    global _safety_index
+    reference_data = load_reference_data()
+    if _safety_index is None or _safety_index.reference_data is not reference_data:
+        _safety_index = build_safety_index(reference_data)
+    return _safety_index
+
+def get_fuzzy_index():
+    """Return the FuzzyIndex for the current reference artifact"""
+    global _fuzzy_index
+    reference_data = load_reference_data()
+    if _fuzzy_index is None or _fuzzy_index.reference_data is not reference_data:
+        _fuzzy_index = FuzzyIndex(reference_data)
+    return _fuzzy_index
+
+def lookup_ingredient_safety(ingredient_name, cas_number, reference_data=None):
+    """Look up safety information for an ingredient across reference databases"""
+    safety_index = build_safety_index(reference_data) if reference_data is not None else get_safety_index()
+    return safety_index.lookup(ingredient_name, cas_number)
+
+def lookup_ingredients_safety(ingredients, parsed_ingredients=None, fuzzy_threshold=None, fuzzy_top_k=None):
+    """
+    Look up safety information for a whole ingredient list in one batched call
+
+    Ingredients with no match as a whole string are looked up component by
+    component, using the CAS numbers resolved from their INS codes. Components
+    that still have no match are fuzzy matched against every reference name in
+    one batch, which catches spelling variants and OCR slips.
+    """
+    safety_index = get_safety_index()
+    if parsed_ingredients is None:
+        parsed_ingredients = parse_ingredients(ingredients)
+
+    safety_data = safety_index.lookup_many(ingredients)
+    unmatched = {}
+    for ingredient, parsed in zip(ingredients, parsed_ingredients):
+        if safety_data[ingredient] != [NO_CLASSIFICATION]:
+            continue
+        component_info = []
+        for component in iter_components(parsed):
+            if component is not parsed:
+                name = component.get("substance") or component["name"]
+                for info in safety_index.lookup(name, component.get("cas")):
+                    if info != NO_CLASSIFICATION and f"{name}: {info}" not in component_info:
+                        component_info.append(f"{name}: {info}")
+            if not component_info and component["kind"] != "statement":
+                unmatched.setdefault(ingredient, []).append(component.get("substance") or component["name"])
+        if component_info:
+            safety_data[ingredient] = component_info
+            unmatched.pop(ingredient, None)
+
+    names = sorted({name for component_names in unmatched.values() for name in component_names if name})
+    if names:
+        started = time.perf_counter()
+        fuzzy_matches = dict(zip(names, get_fuzzy_index().match_many(names, fuzzy_threshold, fuzzy_top_k)))
+        logger.info("Fuzzy matched names", names=len(names), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        for ingredient, component_names in unmatched.items():
+            fuzzy_info = []
+            for name in component_names:
+                for match in fuzzy_matches.get(name, []):
+                    infos = safety_index.lookup_entry(match["table"], match["row"])
+                    for info in infos:
+                        entry = f"{name} (closest match: {match['name']}, similarity {match['score']:.2f}): {info}"
+                        if entry not in fuzzy_info:
+                            fuzzy_info.append(entry)
+                    if infos:
+                        break
+            if fuzzy_info:
+                safety_data[ingredient] = fuzzy_info
+    return safety_data
+
+def get_model_cache():
+    """Return the cache of Gemini extraction and Mistral analysis results shared by all workers"""
+    global _model_cache
+    if _model_cache is None:
+        _model_cache = DiskCache(
+            os.path.join(CACHE_DIR, "model_results.sqlite3"), ttl=MODEL_CACHE_TTL, max_entries=MODEL_CACHE_MAX_ENTRIES
+        )
+    return _model_cache
+
+
+def extract_product_data(gemini_model, images):
+    """
+    Extract ingredients and nutrition data from preprocessed image parts with Gemini
+
+    Results are cached by the hash of the image bytes and the extraction prompt
+    version, so the same label images are only sent to the model once.
+    """
+    cache_key = "extraction:" + stable_hash(
+        gemini_model.model_name, str(extraction_prompt_version), *(image["data"] for image in images)
+    )
+    extracted_data = get_model_cache().get(cache_key)
+    if extracted_data is not None:
+        logger.info("Using cached extraction result")
+        return extracted_data
+
+    contents = [extract_ingredients_and_nutrition_prompt] + images
+    with span("gemini.generate", images=len(images)):
+        extraction_response = call_provider(
+            "gemini", lambda timeout: gemini_model.generate_content(contents, timeout=timeout)
+        )
+    logger.debug("Raw extraction response", text=extraction_response.text)
+    extracted_data = json.loads(extraction_response.text.strip().strip("```json").strip())
+    get_model_cache().set(cache_key, extracted_data)
+    return extracted_data
+
+
+def analyze_extracted_data(mistral_client, extracted_data):
+    """
+    Ask Mistral for the nutritional analysis of extracted product data
+
+    The data is compacted to the prompt token budget first (see compaction.py).
+    The computed nutrition facts are added to the returned nutritional_summary.
+    Results are cached by the hash of the canonical JSON of the data sent and
+    of the analysis prompt.
+    """
+    if PROMPT_COMPACTION:
+        prompt_data, stats = compact_product_data(extracted_data)
+        PROMPT_TOKENS.observe(stats["original_tokens"], data="original")
+        PROMPT_TOKENS.observe(stats["compacted_tokens"], data="compacted")
+        logger.info("Compacted analysis prompt", **stats)
+    else:
+        prompt_data = extracted_data
+    cache_key = "analysis:" + stable_hash(mistral_client.model_name, analyze_food_prompt, prompt_data)
+    analysis = get_model_cache().get(cache_key)
+    if analysis is not None:
+        logger.info("Using cached analysis result")
+        return with_nutrition_facts(analysis, extracted_data.get("nutrition_facts"))
+
+    analysis_messages = [
+        {"role": "system", "content": analyze_food_prompt},
+        {"role": "user", "content": f"Analyze this product data:\n{json.dumps(prompt_data, ensure_ascii=False)}"}
+    ]
+    with span("mistral.chat"):
+        analysis_response = call_provider("mistral", lambda timeout: mistral_client.complete(
+            analysis_messages, response_format={"type": "json_object"}, timeout=timeout
+        ))
+    analysis_text = analysis_response.choices[0].message.content
+    analysis = json.loads(analysis_text.strip().strip("```json").strip())
+    get_model_cache().set(cache_key, analysis)
+    return with_nutrition_facts(analysis, extracted_data.get("nutrition_facts"))
+
+
+def configure_clients():
+    """Return the process-wide Gemini and Mistral clients, created on first use"""
+    return {"gemini": get_provider("gemini"), "mistral": get_provider("mistral")}
+
+def assemble_product_data(extracted, parsed_ingredients, safety, search_results, product_name=None, include_name=True):
+    """Combine extraction, parsing, safety and search results into the data sent for analysis"""
+    extracted_data = dict(extracted)
+    if include_name:
+        extracted_data["product_name"] = product_name
+    extracted_data["parsed_ingredients"] = parsed_ingredients
+    extracted_data["safety_classifications"] = safety
+    extracted_data["ingredient_search_results"] = search_results
+    extracted_data["nutrition_facts"] = score_label(extracted.get("nutritional label"))
+    return extracted_data
+
+def stage_timeout(name):
+    """Timeout in seconds for a pipeline stage, overridable with STAGE_TIMEOUT_<NAME>"""
+    return float(os.getenv(f"STAGE_TIMEOUT_{name.upper()}", STAGE_TIMEOUTS[name]))
+
+def build_analysis_graph(source, is_url=True, scrape=None):
+    """
+    Build the stage graph of one product analysis
+
+    URL and uploaded image analyses share every stage after the images are
+    loaded. Reference data loading overlaps the scrape, and
+    the local safety lookup overlaps the Google searches, since both only
+    need the parsed ingredient list. Images are preprocessed as each download
+    finishes, and the photos of an upload are preprocessed concurrently;
+    extraction still waits for all of them because Gemini reads them in a
+    single request.
+    """
+    def run_scrape():
+        return scrape if scrape is not None else scrape_product(source)
+
+    def load_url_images(scrape):
+        return download_image_parts(scrape["image_urls"])
+
+    def load_uploaded_images():
+        return prepare_uploads(source if isinstance(source, list) else [source])
+
+    def extract(images):
+        if not images:
+            raise ValueError("No product images could be loaded")
+        extracted_data = extract_product_data(get_provider("gemini"), images)
+        logger.info(
+            "Extracted data", ingredients=extracted_data["ingredients"],
+            nutrition=extracted_data["nutritional label"],
+        )
+        return extracted_data
 
-def load_reference_data():
-    """Load and prepare reference data from CSV files"""
-    try:
-        # Load CSV files
-        scogs_df = pd.read_csv('data/FDA--SCOGS.csv')
-        monographs_df = pd.read_csv('data/monographs.csv')
-        roc_df = pd.read_csv('data/roc15_casrn_index.csv')
-        fda_substances_df = pd.read_csv('data/FDA--FoodSubstances.csv')
+    def parse(extract):
+        return parse_ingredients(extract["ingredients"])
 
-        return {
-            'scogs': scogs_df,
-            'monographs': monographs_df,
-            'roc': roc_df,
-            'fda_substances': fda_substances_df
-        }
-    except Exception as e:
-        print(f"Error loading reference data: {e}")
-        return None
+    def safety(extract, parse, reference):
+        return lookup_ingredients_safety(extract["ingredients"], parse)
 
-def lookup_ingredient_safety(ingredient_name, cas_number, reference_data):
-    """Look up safety information for an ingredient across reference databases"""
-    safety_info = []
+    async def search(parse):
+        # Additives resolved from their INS codes are answered locally
+        return await analyze_google(search_terms(parse))
 
-    # Check SCOGS database
-    scogs_match = reference_data['scogs'][
-        (reference_data['scogs']['GRAS Substance'].str.contains(ingredient_name, case=False, na=False)) |
-        (reference_data['scogs']['CAS Reg. No. or other ID CODE'] == cas_number)
-    ]
-    if not scogs_match.empty:
-        safety_info.append(f"FDA SCOGS Status: {scogs_match.iloc[0]['SCOGS Type of Conclusion']}")
+    def product(extract, parse, safety, search, **scraped):
+        product_name = scraped["scrape"]["product_name"] if "scrape" in scraped else None
+        return assemble_product_data(extract, parse, safety, search, product_name, include_name=is_url)
 
-    # Check IARC Monographs
-    monographs_match = reference_data['monographs'][
-        (reference_data['monographs']['Agent'].str.contains(ingredient_name, case=False, na=False)) |
-        (reference_data['monographs']['CAS No.'] == cas_number)
-    ]
-    if not monographs_match.empty:
-        safety_info.append(f"IARC Classification: Group {monographs_match.iloc[0]['Group']}")
+    def analysis(product):
+        return analyze_extracted_data(get_provider("mistral"), product)
 
-    # Check ROC listing
-    roc_match = reference_data['roc'][
-        (reference_data['roc']['NAME OR SYNONYM'].str.contains(ingredient_name, case=False, na=False)) |
-        (reference_data['roc']['CASRN'] == cas_number)
+    stages = [Stage("reference", get_safety_index, timeout=stage_timeout("reference"))]
+    if is_url:
+        stages += [
+            Stage("scrape", run_scrape, timeout=stage_timeout("scrape")),
+            Stage("images", load_url_images, deps=["scrape"], timeout=stage_timeout("images")),
+        ]
+    else:
+        stages.append(Stage("images", load_uploaded_images, timeout=stage_timeout("images")))
+    stages += [
+        Stage("extract", extract, deps=["images"], timeout=stage_timeout("extract")),
+        Stage("parse", parse, deps=["extract"], timeout=stage_timeout("parse")),
+        Stage("safety", safety, deps=["extract", "parse", "reference"], timeout=stage_timeout("safety")),
+        Stage("search", search, deps=["parse"], timeout=stage_timeout("search"), default={}),
+        Stage(
+            "product", product,
+            deps=["extract", "parse", "safety", "search"] + (["scrape"] if is_url else []),
+            timeout=stage_timeout("product"),
+        ),
+        Stage("analysis", analysis, deps=["product"], timeout=stage_timeout("analysis")),
     ]
-    if not roc_match.empty:
-        safety_info.append(f"Report on Carcinogens Status: {roc_match.iloc[0]['Listing in the 15th RoC']}")
-
-    return safety_info if safety_info else ["No safety classification found in reference databases"]
+    return StageGraph(stages)
 
-def analyze_product_image(image_path):
+def describe_source(source, is_url=True):
+    """Short name of an analysis source for logs"""
+    if is_url:
+        return source
+    if isinstance(source, list):
+        return ", ".join(describe_source(upload, is_url) for upload in source)
+    return f"upload ({len(source)} bytes)" if isinstance(source, bytes) else os.path.basename(source)
+
+def run_analysis(source, is_url=True, scrape=None, on_result=None):
+    """
+    Analyze a product page URL or an uploaded label image
+
+    Args:
+        source (str, bytes or list): Product URL, or the label images of one product as file paths
+            or uploaded bytes; a list of images is read in a single extraction request
+        is_url (bool): Whether source is a URL
+        scrape (dict): Result of blinkit.scrape_product for the URL, if the caller already has it
+        on_result (callable): Called with (stage name, result) as each stage finishes
+
+    Returns:
+        dict: {"success": True, "data": {...}} or {"success": False, "error": ...}
+    """
     try:
-        print("\n=== Starting Image Analysis ===")
-
-        # Setup both APIs
-        print("\n1. Configuring APIs...")
-        load_dotenv()
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY_2"))
-        gemini_model = genai.GenerativeModel("gemini-1.5-pro")
-        mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-
-        # Load reference data
-        reference_data = load_reference_data()
-        if not reference_data:
-            raise Exception("Failed to load reference data")
-
-        # Load and process image
-        print("\n2. Processing image...")
-        image = PIL.Image.open(image_path)
-
-        # Extract ingredients and nutrition data
-        print("\n3. Extracting ingredients and nutrition data...")
-        extraction_response = gemini_model.generate_content([extract_ingredients_and_nutrition_prompt, image])
-        print("Raw extraction response:", extraction_response.text)
-
-        extracted_data = json.loads(extraction_response.text.strip().strip("```json").strip())
-        print("\nExtracted Data:")
-        print("Ingredients:", extracted_data["ingredients"])
-        print("Nutrition:", extracted_data["nutritional label"])
-
-        # After extracting ingredients, look up safety information
-        print("\n4. Looking up ingredient safety information...")
-        safety_data = {}
-        for ingredient in extracted_data["ingredients"]:
-            safety_info = lookup_ingredient_safety(ingredient, None, reference_data)
-            safety_data[ingredient] = safety_info
-        extracted_data["safety_classifications"] = safety_data
-
-        # Add Google search results for ingredients
-        print("\n5. Adding Google search results for ingredients...")
-        google_results = analyze_google_sync(extracted_data["ingredients"])
-        extracted_data["ingredient_search_results"] = google_results
-
-        # Analyze the data
-        print("\n6. Analyzing nutritional data...")
-        analysis_messages = [
-            {"role": "system", "content": analyze_food_prompt},
-            {"role": "user", "content": f"Analyze this product data:\n{json.dumps(extracted_data)}"}
-        ]
-
-        analysis_response = mistral_client.chat.complete(
-            model="mistral-large-latest",
-            messages=analysis_messages,
-            response_format={"type": "json_object"}
+        logger.info("Starting analysis", source=describe_source(source, is_url), kind="url" if is_url else "image")
+        started = time.perf_counter()
+        with request_deadline():
+            results, timings = build_analysis_graph(source, is_url, scrape).run_sync(on_result)
+        logger.debug("Analysis results", analysis=results["analysis"])
+        logger.info(
+            "Analysis finished",
+            stage_seconds={name: round(seconds, 3) for name, seconds in timings.items()},
+            total_seconds=round(time.perf_counter() - started, 3),
         )
-        analysis_text = analysis_response.choices[0].message.content
-        analysis_response_cleaned = json.loads(analysis_text.strip().strip("```json").strip())
-
-        print("\n=== Analysis Results ===")
-        print(analysis_response_cleaned)
 
+        data = {
+            "extracted_data": results["product"],
+            "analysis": results["analysis"]
+        }
+        if is_url:
+            data = {"product_name": results["scrape"]["product_name"], **data}
         return {
             "success": True,
-            "data": {
-                "extracted_data": extracted_data,
-                "analysis": analysis_response_cleaned
-            }
+            "data": data
         }
     except Exception as e:
         return {
@@ -133,97 +326,61 @@ def analyze_product_image(image_path):
             "error": str(e)
         }
 
-# Update the original analyze_product function to handle both URLs and images
-def analyze_product(source, is_url=True):
-    if is_url:
-        # Existing URL analysis code
-        return analyze_product_url(source)
-    else:
-        # New image analysis code
-        return analyze_product_image(source)
-
-# Rename the original function to be more specific
-def analyze_product_url(url):
-    try:
-        print("\n=== Starting Product Analysis ===")
-
-        # Setup APIs
-        print("\n1. Configuring APIs...")
-        load_dotenv()
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY_2"))
-        gemini_model = genai.GenerativeModel("gemini-1.5-pro")
-        mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-
-        # Load reference data
-        print("\n2. Loading reference data...")
-        reference_data = load_reference_data()
-        if not reference_data:
-            raise Exception("Failed to load reference data")
-
-        # Extract images and product info
-        print("\n3. Extracting images from URL...")
-        product_name, image_urls = extract_image_urls_from_url(url)
-
-        # Process images
-        print("\n4. Processing images...")
-        image_list = [
-            open_image_from_url(image_url)
-            for image_url in image_urls
-            if open_image_from_url(image_url) is not None
-        ]
+def iter_analysis_events(source, is_url=True, scrape=None):
+    """
+    Run an analysis in the background and yield partial results as stages finish
+
+    Yields dicts with an "event" member, in this order when they apply:
+    "product" (name and image URLs, URL analyses only), "extracted"
+    (ingredients and nutrition), "safety" (parsed ingredients and safety
+    classifications), "analysis" (the Mistral analysis) and finally "result",
+    the same payload /api/analyze returns.
+    """
+    events = queue.Queue()
+    parsed = {}
+
+    def on_result(stage, value):
+        if stage == "parse":
+            parsed["ingredients"] = value
+        elif stage == "scrape":
+            events.put({"event": "product", "product_name": value["product_name"], "image_urls": value["image_urls"]})
+        elif stage == "extract":
+            events.put({"event": "extracted", "extracted_data": value})
+        elif stage == "safety":
+            events.put({"event": "safety", "parsed_ingredients": parsed["ingredients"], "safety_classifications": value})
+        elif stage == "analysis":
+            events.put({"event": "analysis", "analysis": value})
+
+    def run():
+        try:
+            events.put(dict(run_analysis(source, is_url, scrape, on_result), event="result"))
+        finally:
+            events.put(None)
+
+    # The analysis thread keeps the request's id and profiler
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="analysis-stream", daemon=True).start()
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        yield event
 
-        print("\n5. Extracting ingredients and nutrition data...")
-        extraction_response = gemini_model.generate_content([extract_ingredients_and_nutrition_prompt] + image_list)
-        extracted_data = json.loads(extraction_response.text.strip().strip("```json").strip())
-        extracted_data["product_name"] = product_name
-        print("\nExtracted Data:")
-        print("Product:", extracted_data["product_name"])
-        print("Ingredients:", extracted_data["ingredients"])
-        print("Nutrition:", extracted_data["nutritional label"])
-
-        # Look up safety information
-        print("\n6. Looking up ingredient safety information...")
-        safety_data = {}
-        for ingredient in extracted_data["ingredients"]:
-            safety_info = lookup_ingredient_safety(ingredient, None, reference_data)
-            safety_data[ingredient] = safety_info
-        extracted_data["safety_classifications"] = safety_data
-
-        # Add Google search results for ingredients
-        print("\n7. Adding Google search results for ingredients...")
-        google_results = analyze_google_sync(extracted_data["ingredients"])
-        extracted_data["ingredient_search_results"] = google_results
-
-        # Analyze the data
-        print("\n8. Analyzing nutritional data...")
-        analysis_messages = [
-            {"role": "system", "content": analyze_food_prompt},
-            {"role": "user", "content": f"Analyze this product data:\n{json.dumps(extracted_data)}"}
-        ]
+def analyze_product_image(image_path):
+    return run_analysis(image_path, is_url=False)
 
-        analysis_response = mistral_client.chat.complete(
-            model="mistral-large-latest",
-            messages=analysis_messages,
-            response_format={"type": "json_object"}
-        )
-        analysis_text = analysis_response.choices[0].message.content
-        analysis_response_cleaned = json.loads(analysis_text.strip().strip("```json").strip())
+def analyze_product(source, is_url=True, scrape=None):
+    return run_analysis(source, is_url, scrape)
 
-        print("\n=== Analysis Results ===")
-        print(analysis_response_cleaned)
+def analyze_product_url(url, scrape=None):
+    """
+    Analyze a Blinkit product page
 
-        return {
-            "success": True,
-            "data": {
-                "extracted_data": extracted_data,
-                "analysis": analysis_response_cleaned
-            }
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
+    Args:
+        url (str): Product URL
+        scrape (dict): Result of blinkit.scrape_product for url, if the caller already has it
+    """
+    return run_analysis(url, is_url=True, scrape=scrape)
 
 if __name__ == "__main__":
     url = "https://blinkit.com/prn/cadbury-gems-duo-pack-chocolate/prid/110655"
@@ -1,11 +1,64 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from analyze import analyze_product
+from analyze import analyze_product, get_model_cache, iter_analysis_events
+import json
+import threading
+import time
+from io import BytesIO
+from batch import BATCH_MAX_ITEMS, analyze_batch
+from jobs import QueueFull, get_job_queue, submit_image, submit_url
 import os
-from werkzeug.utils import secure_filename
-from blinkit import extract_image_urls_from_url
+from werkzeug.exceptions import RequestEntityTooLarge
+from blinkit import driver_pool_stats, scrape_stats
+from googli import get_search_cache, search_client_stats
+from providers import check_providers, provider_stats, warm_providers
+from resilience import breaker_stats
+from images import ImageTooLarge, InvalidImage, validate_image
+from metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    PROFILING_ENABLED,
+    finish_profiling,
+    get_logger,
+    render_metrics,
+    set_request_id,
+    start_profiling,
+)
+
+# Largest request body accepted, for all the uploaded files of a request together
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+# Photos of one product (front, back, sides) analyzed together, and their combined size
+UPLOAD_MAX_IMAGES = int(os.getenv("UPLOAD_MAX_IMAGES", "6"))
+UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(30 * 1024 * 1024)))
+
+
+class InMemoryRequest(Request):
+    """Keeps uploaded files in memory instead of spooling larger ones to temporary files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Bounded by MAX_CONTENT_LENGTH, which is checked before the body is read
+        return BytesIO()
+
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUEST_BYTES
+logger = get_logger("api")
+
+_providers_warmed = False
+_providers_warmed_lock = threading.Lock()
+
+
+def warm_providers_once():
+    """Create the model and search clients once per worker, on startup or its first request, not on import"""
+    global _providers_warmed
+    if _providers_warmed:
+        return
+    with _providers_warmed_lock:
+        if not _providers_warmed:
+            warm_providers()
+            _providers_warmed = True
 
 # Update CORS configuration
 CORS(app, resources={
@@ -17,14 +70,42 @@ CORS(app, resources={
             "http://localhost:3000"
         ],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Origin", "Accept"],
+        "allow_headers": ["Content-Type", "Authorization", "Origin", "Accept", "X-Request-ID"],
+        "expose_headers": ["X-Request-ID"],
         "max_age": 3600
     }
 })
 
+@app.before_request
+def before_request():
+    warm_providers_once()
+    # Reuse the caller's request id so logs can be joined across services
+    g.request_id = set_request_id(request.headers.get('X-Request-ID'))
+    g.started = time.perf_counter()
+    g.profiling = PROFILING_ENABLED and request.headers.get('X-Profile') == '1'
+    if g.profiling:
+        start_profiling()
+    HTTP_IN_FLIGHT.inc()
+
 # Update the after_request handler
 @app.after_request
 def after_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - g.started
+    HTTP_SECONDS.observe(elapsed, route=route, method=request.method)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    response.headers['X-Request-ID'] = g.request_id
+    # Streamed responses do their work after this point, so only whole responses are profiled
+    if g.profiling and not response.is_streamed:
+        profile_path = finish_profiling(g.request_id)
+        if profile_path:
+            response.headers['X-Profile-Path'] = profile_path
+    if route != '/metrics':
+        logger.info(
+            "Request handled", method=request.method, route=route,
+            status=response.status_code, duration_ms=round(elapsed * 1000, 1),
+        )
+
     origin = request.headers.get('Origin')
     allowed_origins = [
         'https://foodxray.netlify.app',
@@ -35,22 +116,90 @@ def after_request(response):
 
     if origin in allowed_origins:
         response.headers.add('Access-Control-Allow-Origin', origin)
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Origin, Accept')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Origin, Accept, X-Request-ID')
+        response.headers.add('Access-Control-Expose-Headers', 'X-Request-ID')
         response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         response.headers.add('Access-Control-Max-Age', '3600')
     return response
 
+@app.teardown_request
+def teardown_request(exception=None):
+    HTTP_IN_FLIGHT.dec()
+
 # Configure upload settings
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Create uploads directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def read_upload(file):
+    """
+    The bytes of an uploaded image, checked against the byte and pixel limits
+
+    Uploads are never written to disk, so concurrent uploads with the same
+    file name can't interfere.
+
+    Raises:
+        ImageTooLarge, InvalidImage: Answered with 413 and 400 by the error handlers below
+    """
+    data = file.stream.getvalue() if isinstance(file.stream, BytesIO) else file.read()
+    validate_image(data)
+    return data
+
+def read_product_uploads(files):
+    """
+    The bytes of the uploaded photos of one product, within the count and total size limits
+
+    Returns:
+        tuple: (list of image bytes, None), or (None, error response) if the files can't be analyzed
+    """
+    if not files:
+        return None, (jsonify({
+            "success": False,
+            "error": "No image file provided"
+        }), 400)
+    if any(file.filename == '' for file in files):
+        return None, (jsonify({
+            "success": False,
+            "error": "No selected file"
+        }), 400)
+    if len(files) > UPLOAD_MAX_IMAGES:
+        return None, (jsonify({
+            "success": False,
+            "error": f"At most {UPLOAD_MAX_IMAGES} images per product"
+        }), 400)
+    if not all(allowed_file(file.filename) for file in files):
+        return None, (jsonify({
+            "success": False,
+            "error": "Invalid file type"
+        }), 400)
+    uploads = [read_upload(file) for file in files]
+    total = sum(len(upload) for upload in uploads)
+    if total > UPLOAD_MAX_TOTAL_BYTES:
+        raise ImageTooLarge(f"{total} bytes of images exceeds the {UPLOAD_MAX_TOTAL_BYTES} byte limit per product")
+    return uploads, None
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({
+        "success": False,
+        "error": f"Request body is larger than {UPLOAD_MAX_REQUEST_BYTES} bytes"
+    }), 413
+
+@app.errorhandler(ImageTooLarge)
+def image_too_large(e):
+    return jsonify({
+        "success": False,
+        "error": f"Image too large: {str(e)}"
+    }), 413
+
+@app.errorhandler(InvalidImage)
+def invalid_image(e):
+    return jsonify({
+        "success": False,
+        "error": f"Invalid image: {str(e)}"
+    }), 400
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze():
     if request.method == 'OPTIONS':
@@ -66,52 +215,191 @@ def analyze():
                 "error": "URL is required"
             }), 400
 
-        # Get product name and image URLs
-        product_name, image_urls = extract_image_urls_from_url(data['url'])
+        # The pipeline scrapes the page once and reports the product name itself
         result = analyze_product(data['url'], is_url=True)
+        return jsonify(result)
 
-        if result["success"]:
-            result["data"]["product_name"] = product_name
+    # Handle image upload analysis: one or more "image" files showing the same product
+    uploads, error = read_product_uploads(request.files.getlist('image'))
+    if error is not None:
+        return error
 
-        return jsonify(result)
+    # All photos go to the model in one extraction request, straight from memory
+    result = analyze_product(uploads, is_url=False)
+    return jsonify(result)
+
+@app.route('/api/analyze/batch', methods=['POST', 'OPTIONS'])
+def analyze_batch_route():
+    """
+    Analyze several products at once: a JSON body {"urls": [...]} and/or
+    multipart "images" files (with optional "urls" form fields)
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'success': True})
+        return response
 
-    # Handle image upload analysis
-    if 'image' not in request.files:
+    if request.is_json:
+        urls = (request.get_json() or {}).get('urls') or []
+        files = []
+    else:
+        urls = request.form.getlist('urls')
+        files = request.files.getlist('images')
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
         return jsonify({
             "success": False,
-            "error": "No image file provided"
+            "error": "urls must be a list of strings"
         }), 400
-
-    file = request.files['image']
-    if file.filename == '':
+    if not urls and not files:
         return jsonify({
             "success": False,
-            "error": "No selected file"
+            "error": "Provide urls and/or images"
+        }), 400
+    if len(urls) + len(files) > BATCH_MAX_ITEMS:
+        return jsonify({
+            "success": False,
+            "error": f"At most {BATCH_MAX_ITEMS} products per batch"
+        }), 400
+    if any(file.filename == '' or not allowed_file(file.filename) for file in files):
+        return jsonify({
+            "success": False,
+            "error": "Invalid file type"
         }), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    items = [{"url": url} for url in urls]
+    for file in files:
+        # A file that fails validation only fails its own entry
+        try:
+            items.append({"image": read_upload(file), "filename": file.filename})
+        except (ImageTooLarge, InvalidImage) as e:
+            items.append({"error": f"Invalid image: {str(e)}", "filename": file.filename})
+    batch = analyze_batch(items)
 
-        # Analyze the uploaded image
-        result = analyze_product(filepath, is_url=False)
+    return jsonify({
+        "success": True,
+        **batch
+    })
 
-        # Clean up uploaded file
-        os.remove(filepath)
+@app.route('/api/analyze/stream', methods=['POST', 'OPTIONS'])
+def analyze_stream():
+    """
+    Same input as /api/analyze, but streams newline-delimited JSON events as
+    the pipeline progresses: product, extracted, safety, analysis and result
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'success': True})
+        return response
 
-        return jsonify(result)
+    if request.is_json:
+        data = request.get_json()
+        if not data or 'url' not in data:
+            return jsonify({
+                "success": False,
+                "error": "URL is required"
+            }), 400
+        source, is_url = data['url'], True
+    else:
+        uploads, error = read_product_uploads(request.files.getlist('image'))
+        if error is not None:
+            return error
+        source, is_url = uploads, False
+
+    def generate():
+        for event in iter_analysis_events(source, is_url=is_url):
+            yield json.dumps(event) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def submit_job():
+    """Queue an analysis and return its job id without waiting for it"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'success': True})
+        return response
+
+    try:
+        if request.is_json:
+            data = request.get_json()
+            if not data or 'url' not in data:
+                return jsonify({
+                    "success": False,
+                    "error": "URL is required"
+                }), 400
+            job, created = submit_url(data['url'])
+        else:
+            file = request.files.get('image')
+            if file is None or file.filename == '':
+                return jsonify({
+                    "success": False,
+                    "error": "No image file provided"
+                }), 400
+            if not allowed_file(file.filename):
+                return jsonify({
+                    "success": False,
+                    "error": "Invalid file type"
+                }), 400
+            job, created = submit_image(read_upload(file), file.filename.rsplit('.', 1)[1].lower())
+    except QueueFull as e:
+        response = jsonify({
+            "success": False,
+            "error": f"Too many analyses queued, try again later ({str(e)})"
+        })
+        response.headers['Retry-After'] = '30'
+        return response, 503
 
     return jsonify({
-        "success": False,
-        "error": "Invalid file type"
-    }), 400
+        "success": True,
+        "job": job,
+        "duplicate": not created
+    }), 202 if created else 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Unknown job"
+        }), 404
+    return jsonify({
+        "success": True,
+        "job": job
+    })
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"})
+    # ?deep=1 also calls each provider, which costs a request to each service
+    if request.args.get('deep') == '1':
+        providers = check_providers()
+        status = "healthy" if all(check["ok"] for check in providers.values()) else "degraded"
+    else:
+        providers = provider_stats()
+        status = "healthy"
+    breakers = breaker_stats()
+    if any(breaker["state"] != "closed" for breaker in breakers.values()):
+        status = "degraded"
+    return jsonify({
+        "status": status,
+        "providers": providers,
+        "circuit_breakers": breakers,
+        "driver_pool": driver_pool_stats(),
+        "scrapes": scrape_stats(),
+        "model_cache": get_model_cache().stats(),
+        "search_cache": get_search_cache().stats(),
+        "search_client": search_client_stats(),
+        "jobs": get_job_queue().stats(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms, error counts and in-flight gauges of this worker process"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    warm_providers_once()
     app.run(debug=True, port=5000)
 
 # python api.py
@@ -0,0 +1,154 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analyze import (
+    analyze_extracted_data,
+    assemble_product_data,
+    configure_clients,
+    extract_product_data,
+    get_safety_index,
+    lookup_ingredients_safety,
+)
+from blinkit import scrape_product
+from googli import analyze_google_sync, normalize_query
+from images import download_image_parts, prepare_upload
+from ingredients import parse_ingredients, search_terms
+from metrics import get_logger
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+# Items scraped, extracted and analyzed at once; browser fallbacks still queue on the driver pool
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+logger = get_logger("batch")
+
+
+def _extract_item(item, clients):
+    if "error" in item:
+        raise ValueError(item["error"])
+    if "url" in item:
+        scrape = scrape_product(item["url"])
+        images = download_image_parts(scrape["image_urls"])
+        product_name = scrape["product_name"]
+    else:
+        images = [prepare_upload(item["image"])]
+        product_name = None
+    if not images:
+        raise ValueError("No product images could be loaded")
+    return {"product_name": product_name, "extracted": extract_product_data(clients["gemini"], images)}
+
+
+def _ingredient_data(ingredients, search_stats=None):
+    """
+    Parse, safety-check and search a list of ingredient strings, each only once
+
+    Search results are keyed by normalize_query(term): search_terms keeps the
+    first spelling it sees, which need not be the spelling of every product.
+    """
+    ingredients = list(dict.fromkeys(ingredients))
+    parsed = dict(zip(ingredients, parse_ingredients(ingredients)))
+    safety = lookup_ingredients_safety(ingredients, [parsed[ingredient] for ingredient in ingredients])
+    terms = search_terms(parsed.values())
+    search_results = analyze_google_sync(terms, search_stats) if terms else {}
+    return {
+        "parsed": parsed,
+        "safety": safety,
+        "terms": terms,
+        "search_results": {normalize_query(term): results for term, results in search_results.items()},
+    }
+
+
+def _item_ingredients(entry):
+    return [ingredient for ingredient in entry["extracted"].get("ingredients", []) if isinstance(ingredient, str)]
+
+
+def analyze_batch(items, concurrency=BATCH_CONCURRENCY):
+    """
+    Analyze many products, sharing the ingredient work between them
+
+    Every item is scraped and extracted first. Then the ingredient strings of
+    the whole batch are parsed, safety-checked and searched once each, however
+    many products contain them. Finally every product gets its own analysis.
+    A failing item only fails its own entry; if the shared ingredient work
+    fails, every item falls back to handling its own ingredients.
+
+    Args:
+        items (list): {"url": ...} or {"image": path or bytes, "filename": optional name} dicts;
+            an item with an "error" instead (e.g. a rejected upload) fails with that error
+
+    Returns:
+        dict: {"results": [{"success", "data" or "error"} per item, in order], "stats": {...}}
+    """
+    started = time.perf_counter()
+    results = [None] * len(items)
+    clients = configure_clients()
+    get_safety_index()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        futures = [executor.submit(_extract_item, item, clients) for item in items]
+        extracted = {}
+        for index, future in enumerate(futures):
+            try:
+                extracted[index] = future.result()
+            except Exception as e:
+                results[index] = {"success": False, "error": str(e)}
+
+        # Ingredient strings shared by several products are only handled once
+        all_ingredients = list(dict.fromkeys(
+            ingredient for entry in extracted.values() for ingredient in _item_ingredients(entry)
+        ))
+        search_stats = {}
+        try:
+            shared = _ingredient_data(all_ingredients, search_stats)
+        except Exception as e:
+            logger.error("Shared ingredient lookup failed, handling items separately", error=str(e))
+            shared = None
+        else:
+            logger.info(
+                "Batch ingredients deduplicated", items=len(items),
+                unique_ingredients=len(all_ingredients), unique_search_terms=len(shared["terms"]),
+            )
+
+        def analyze_item(index):
+            entry = extracted[index]
+            ingredients = _item_ingredients(entry)
+            data = shared if shared is not None else _ingredient_data(ingredients)
+            parsed = [data["parsed"][ingredient] for ingredient in ingredients]
+            search_results = data["search_results"]
+            product_data = assemble_product_data(
+                entry["extracted"],
+                parsed,
+                {ingredient: data["safety"][ingredient] for ingredient in ingredients},
+                {
+                    term: search_results[normalize_query(term)]
+                    for term in search_terms(parsed) if normalize_query(term) in search_results
+                },
+                entry["product_name"],
+                include_name="url" in items[index],
+            )
+            data = {"extracted_data": product_data, "analysis": analyze_extracted_data(clients["mistral"], product_data)}
+            if "url" in items[index]:
+                data = {"product_name": entry["product_name"], **data}
+            return {"success": True, "data": data}
+
+        futures = {index: executor.submit(analyze_item, index) for index in extracted}
+        for index, future in futures.items():
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"success": False, "error": str(e)}
+
+    for item, result in zip(items, results):
+        image = item.get("image")
+        result["source"] = item.get("url") or item.get("filename") or (os.path.basename(image) if isinstance(image, str) else "")
+    elapsed = time.perf_counter() - started
+    stats = {
+        "items": len(items),
+        "succeeded": sum(result["success"] for result in results),
+        "unique_ingredients": len(all_ingredients),
+        "unique_search_terms": len(shared["terms"]) if shared is not None else None,
+        "search_cache_hits": search_stats.get("cache_hits", 0),
+        "seconds": round(elapsed, 2),
+    }
+    logger.info("Batch finished", **stats)
+    return {"results": results, "stats": stats}
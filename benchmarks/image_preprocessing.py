@@ -0,0 +1,89 @@
+"""
+Compare what is sent to Gemini with and without image preprocessing.
+
+"before" is what the SDK uploads for a plain PIL image (lossless WebP of the
+full image); "after" is the output of images.preprocess_image.
+
+    python benchmarks/image_preprocessing.py label1.jpg https://cdn.grofers.com/...
+    python benchmarks/image_preprocessing.py --extract label1.jpg label2.jpg
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL.Image  # noqa: E402
+
+from images import IMAGE_JPEG_QUALITY, IMAGE_MAX_EDGE, fetch_image_bytes, image_part, preprocess_image  # noqa: E402
+
+
+def load_bytes(source):
+    if source.startswith(("http://", "https://")):
+        return fetch_image_bytes(source)
+    with open(source, "rb") as image_file:
+        return image_file.read()
+
+
+def unprocessed_upload(data):
+    """Bytes the Gemini SDK sends for a PIL image that isn't backed by a file"""
+    output = BytesIO()
+    PIL.Image.open(BytesIO(data)).save(output, format="webp", lossless=True)
+    return output.getvalue()
+
+
+def time_extraction(model, prompt, parts, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model.generate_content([prompt] + parts)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="Image files or URLs")
+    parser.add_argument("--max-edge", type=int, default=IMAGE_MAX_EDGE)
+    parser.add_argument("--quality", type=int, default=IMAGE_JPEG_QUALITY)
+    parser.add_argument("--trim-borders", action="store_true")
+    parser.add_argument("--extract", action="store_true", help="Also time a Gemini extraction call before and after")
+    parser.add_argument("--repeat", type=int, default=3, help="Extraction calls per variant (median is reported)")
+    args = parser.parse_args()
+
+    originals = [load_bytes(source) for source in args.sources]
+    before_parts = []
+    after_parts = []
+    print(f"{'image':<40} {'source':>10} {'before':>10} {'after':>10} {'prep ms':>8}")
+    for source, data in zip(args.sources, originals):
+        before = unprocessed_upload(data)
+        started = time.perf_counter()
+        after = preprocess_image(data, args.max_edge, args.quality, args.trim_borders)
+        elapsed = (time.perf_counter() - started) * 1000
+        before_parts.append({"mime_type": "image/webp", "data": before})
+        after_parts.append(image_part(after))
+        print(f"{os.path.basename(source)[-40:]:<40} {len(data):>10} {len(before):>10} {len(after):>10} {elapsed:>8.1f}")
+
+    total_before = sum(len(part["data"]) for part in before_parts)
+    total_after = sum(len(part["data"]) for part in after_parts)
+    print(f"\nBytes sent: {total_before} before, {total_after} after ({total_after / total_before:.1%})")
+
+    if args.extract:
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+
+        from prompts import extract_ingredients_and_nutrition_prompt
+
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY_2"))
+        model = genai.GenerativeModel("gemini-1.5-pro")
+        before_latency = time_extraction(model, extract_ingredients_and_nutrition_prompt, before_parts, args.repeat)
+        after_latency = time_extraction(model, extract_ingredients_and_nutrition_prompt, after_parts, args.repeat)
+        print(f"Extraction latency (median of {args.repeat}): {before_latency:.2f}s before, {after_latency:.2f}s after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,576 @@
+"""
+Benchmark the analysis pipeline offline, against local stand-ins for every external service.
+
+Blinkit pages and CDN images are served by a fake transport mounted on the
+real HTTP sessions, stand-in Gemini and Mistral providers return the
+recorded payloads in benchmarks/fixtures, and Custom Search answers from a
+fixture as well. Each
+fake sleeps for a configurable latency, so the numbers show what the
+pipeline itself costs and how it overlaps the waiting. Fakes can also fail
+a share of their calls, to see how timeouts, hedging and circuit breakers
+hold up.
+
+Every product gets its own page and label images, so scrape, image and model
+caches start cold for each request; ingredient searches are shared between
+products as they are in production.
+
+    python benchmarks/pipeline.py --requests 40 --concurrency 8
+    python benchmarks/pipeline.py --latency-scale 0.1 --save-baseline baseline.json
+    python benchmarks/pipeline.py --latency-scale 0.1 --baseline baseline.json --threshold 0.15
+    python benchmarks/pipeline.py --latency-scale 0.1 --errors google=0.5 --errors mistral=0.05
+
+The run exits with status 1 when a scenario regresses beyond the threshold
+against the baseline.
+"""
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, ROOT)
+
+# Must be set before the app modules read their configuration
+_scratch = tempfile.mkdtemp(prefix="foodlabel-bench-")
+os.environ.setdefault("CACHE_DIR", os.path.join(_scratch, "cache"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("GOOGLE_SEARCH_QPM", "100000")
+os.environ.setdefault("GOOGLE_SEARCH_BURST", "1000")
+os.environ.setdefault("BLINKIT_HTTP_FAST_PATH", "1")
+
+import PIL.Image  # noqa: E402
+import PIL.ImageDraw  # noqa: E402
+import requests  # noqa: E402
+from requests.adapters import BaseAdapter  # noqa: E402
+from requests.structures import CaseInsensitiveDict  # noqa: E402
+
+import analyze  # noqa: E402
+import blinkit  # noqa: E402
+import googli  # noqa: E402
+import images  # noqa: E402
+import providers  # noqa: E402
+import resilience  # noqa: E402
+
+SCENARIOS = ("url", "image", "api-url", "api-image")
+DEFAULT_LATENCIES = {"blinkit": 0.25, "image": 0.15, "gemini": 2.0, "mistral": 1.5, "google": 0.3}
+# Relative change of each reported figure that counts as a regression, and which direction is worse
+REGRESSION_CHECKS = {
+    "p50_ms": "higher",
+    "p95_ms": "higher",
+    "p99_ms": "higher",
+    "throughput_rps": "lower",
+    "cpu_ms_per_request": "higher",
+    "peak_memory_mb": "higher",
+}
+
+_product_url_pattern = re.compile(r"/prid/(\d+)")
+_image_key_pattern = re.compile(r"/bench/([\w-]+)\.jpg")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as fixture:
+        return fixture.read()
+
+
+class Latencies:
+    """Injected latency and error rate of each fake service, scaled and jittered with a fixed seed"""
+
+    def __init__(self, base, scale=1.0, jitter=0.2, seed=0, errors=None):
+        self.base = base
+        self.scale = scale
+        self.jitter = jitter
+        self.errors = errors or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(self, service):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.base[service] * self.scale * factor)
+
+    def fails(self, service):
+        """Whether this call of service should fail, at the service's error rate"""
+        rate = self.errors.get(service, 0)
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def sleep(self, service, timeout=None):
+        """Wait like the service would, raising TimeoutError past timeout and on injected errors"""
+        seconds = self.get(service)
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake {service} did not answer within {timeout:g}s")
+        time.sleep(seconds)
+        if self.fails(service):
+            raise RuntimeError(f"Injected {service} failure")
+
+
+class FakeWeb:
+    """Product pages and label images for a fixed set of fake products"""
+
+    def __init__(self, latencies, products, images_per_product, image_size):
+        self.latencies = latencies
+        self.page_template = string.Template(load_fixture("blinkit_product.html"))
+        self.product_names = {}
+        self.images = {}
+        jobs = []
+        for index in range(products):
+            product_id = str(100000 + index)
+            self.product_names[product_id] = f"Benchmark Fruit Cake {index}"
+            jobs += [(f"{product_id}-{k}", image_size) for k in range(images_per_product)]
+        with ThreadPoolExecutor() as executor:
+            self.images.update(zip((key for key, _ in jobs), executor.map(lambda job: label_image(*job), jobs)))
+
+    def product_url(self, index):
+        return f"https://blinkit.com/prn/benchmark-fruit-cake-{index}/prid/{100000 + index}"
+
+    def image_url(self, key):
+        return f"https://cdn.grofers.com/cdn-cgi/image/f=auto,fit=scale-down,q=70,metadata=none,w=1800/app/bench/{key}.jpg"
+
+    def respond(self, url):
+        """(status, content type, body) for a GET of url"""
+        image = _image_key_pattern.search(url)
+        if image:
+            time.sleep(self.latencies.get("image"))
+            if self.latencies.fails("image"):
+                return 503, "text/plain", b"Injected failure"
+            data = self.images.get(image.group(1))
+            return (200, "image/jpeg", data) if data else (404, "text/plain", b"Not found")
+        product = _product_url_pattern.search(url)
+        time.sleep(self.latencies.get("blinkit"))
+        if self.latencies.fails("blinkit"):
+            return 503, "text/html", b"<html><body>Injected failure</body></html>"
+        if not product or product.group(1) not in self.product_names:
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+        product_id = product.group(1)
+        image_urls = [self.image_url(key) for key in sorted(self.images) if key.startswith(product_id + "-")]
+        page = self.page_template.substitute(
+            name=self.product_names[product_id], url=url, product_id=product_id,
+            first_image=image_urls[0], images=json.dumps(image_urls),
+        )
+        return 200, "text/html; charset=utf-8", page.encode()
+
+
+class FakeTransport(BaseAdapter):
+    """requests transport that answers from a FakeWeb instead of the network"""
+
+    def __init__(self, web):
+        super().__init__()
+        self.web = web
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        status, content_type, body = self.web.respond(request.url)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type, "Content-Length": str(len(body))})
+        response.raw = BytesIO(body)
+        response.encoding = "utf-8" if content_type.startswith("text/") else None
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def label_image(key, size):
+    """A JPEG label photo whose pixels, and so whose hash, are unique to key"""
+    seed = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    width, height = size, size * 4 // 3
+    image = PIL.Image.new("RGB", (width, height), (rng.randint(200, 255), rng.randint(200, 255), rng.randint(180, 230)))
+    draw = PIL.ImageDraw.Draw(image)
+    draw.text((40, 40), f"NUTRITION INFORMATION {key}", fill=(20, 20, 20))
+    for row in range(60):
+        y = 90 + row * (height - 120) // 60
+        draw.line((40, y, width - 40, y), fill=(120, 120, 120), width=2)
+        draw.text((50, y + 6), f"INGREDIENT {rng.randint(100, 999)} ({rng.randint(100, 999)})", fill=(30, 30, 30))
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + 12, y + 12), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+class FakeGemini:
+    """Gemini provider answering with the recorded extraction"""
+
+    model_name = "fake-gemini"
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.extraction = json.loads(load_fixture("gemini_extraction.json"))
+
+    def generate_content(self, contents, timeout=None):
+        self.latencies.sleep("gemini", timeout)
+        parts = [part for part in contents if isinstance(part, dict)]
+        digest = hashlib.sha256(b"".join(part["data"] for part in parts)).hexdigest()
+        data = dict(self.extraction)
+        # One product-specific ingredient, so every product needs one fresh search and fuzzy lookup
+        data["ingredients"] = self.extraction["ingredients"] + [f"NATURAL FLAVOUR {digest[:6].upper()}"]
+        return types.SimpleNamespace(text="```json\n" + json.dumps(data, indent=4) + "\n```")
+
+    def check(self):
+        pass
+
+
+class FakeMistral:
+    """Mistral provider answering with the recorded analysis"""
+
+    model_name = "fake-mistral"
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.analysis = load_fixture("mistral_analysis.json")
+
+    def complete(self, messages, response_format=None, timeout=None):
+        self.latencies.sleep("mistral", timeout)
+        message = types.SimpleNamespace(content=self.analysis)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    def check(self):
+        pass
+
+
+def fake_search(latencies):
+    template = json.loads(load_fixture("google_search.json"))
+
+    async def fetch_search_results(session, ingredient):
+        await asyncio.sleep(latencies.get("google"))
+        if latencies.fails("google"):
+            raise googli.RetryableSearchError("HTTP 503: injected failure")
+        slug = re.sub(r"[^a-z0-9]+", "-", ingredient.lower()).strip("-")
+        return [
+            {key: string.Template(item[key]).safe_substitute(query=ingredient, slug=slug) for key in ("title", "snippet", "link")}
+            for item in template["items"]
+        ]
+
+    return fetch_search_results
+
+
+class StageRecorder:
+    """Wall and CPU time of every stage, recorded by wrapping the stages of each analysis graph"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, wall, cpu):
+        with self._lock:
+            self.samples.setdefault(stage, []).append((wall, cpu))
+
+    def reset(self):
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        return samples
+
+    def wrap(self, name, func):
+        # CPU is that of the thread running the stage; async stages only count the pipeline loop's share
+        if inspect.iscoroutinefunction(func):
+            async def timed(**kwargs):
+                wall, cpu = time.perf_counter(), time.thread_time()
+                try:
+                    return await func(**kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - wall, time.thread_time() - cpu)
+        else:
+            def timed(**kwargs):
+                wall, cpu = time.perf_counter(), time.thread_time()
+                try:
+                    return func(**kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - wall, time.thread_time() - cpu)
+        return timed
+
+    def instrument(self, build_graph):
+        def build_instrumented_graph(*args, **kwargs):
+            graph = build_graph(*args, **kwargs)
+            for stage in graph.stages.values():
+                stage.func = self.wrap(stage.name, stage.func)
+            return graph
+
+        return build_instrumented_graph
+
+
+def install_fakes(web, latencies, recorder):
+    """Route every external call of the app to the fakes"""
+    transport = FakeTransport(web)
+    for session in (blinkit.get_http_session(), images.get_image_session()):
+        session.mount("https://", transport)
+        session.mount("http://", transport)
+    providers.set_provider("gemini", FakeGemini(latencies), "fake")
+    providers.set_provider("mistral", FakeMistral(latencies), "fake")
+    # The real search client still runs, so its rate limiting and retries are measured
+    googli.fetch_search_results = fake_search(latencies)
+    analyze.build_analysis_graph = recorder.instrument(analyze.build_analysis_graph)
+
+
+def worker_cpu_seconds():
+    """CPU used so far by the image preprocessing pool's worker processes (Linux only)"""
+    pool = images._process_pool
+    total = 0.0
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    for pid in getattr(pool, "_processes", None) or {}:
+        try:
+            with open(f"/proc/{pid}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def make_request(scenario, index, web, uploads, client_factory):
+    """Run one analysis of the scenario and return whether it succeeded"""
+    if scenario == "url":
+        return analyze.analyze_product(web.product_url(index), is_url=True)["success"]
+    if scenario == "image":
+        return analyze.analyze_product(uploads[index], is_url=False)["success"]
+    client = client_factory()
+    if scenario == "api-url":
+        response = client.post("/api/analyze", json={"url": web.product_url(index)})
+    else:
+        files = []
+        for path in uploads[index]:
+            with open(path, "rb") as upload:
+                files.append((BytesIO(upload.read()), os.path.basename(path)))
+        response = client.post("/api/analyze", data={"image": files}, content_type="multipart/form-data")
+    return response.status_code == 200 and response.get_json()["success"]
+
+
+def run_scenario(scenario, indexes, concurrency, web, uploads, client_factory, recorder, trace_memory):
+    recorder.reset()
+    latencies = []
+    failures = []
+
+    def timed_request(index):
+        started = time.perf_counter()
+        try:
+            ok = make_request(scenario, index, web, uploads, client_factory)
+        except Exception as e:
+            ok, error = False, str(e)
+        else:
+            error = None if ok else "analysis failed"
+        latencies.append(time.perf_counter() - started)
+        if not ok:
+            failures.append(error)
+
+    if trace_memory:
+        tracemalloc.start()
+    cpu_started, workers_started = time.process_time(), worker_cpu_seconds()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed_request, indexes))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started + worker_cpu_seconds() - workers_started
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    stages = {}
+    for stage, samples in recorder.reset().items():
+        stages[stage] = {
+            "calls": len(samples),
+            "wall_p50_ms": round(percentile([wall for wall, _ in samples], 0.5) * 1000, 1),
+            "cpu_mean_ms": round(statistics.fmean(cpu for _, cpu in samples) * 1000, 2),
+        }
+    result = {
+        "requests": len(indexes),
+        "failures": len(failures),
+        "throughput_rps": round(len(indexes) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "cpu_ms_per_request": round(cpu / len(indexes) * 1000, 1),
+        "peak_memory_mb": round(traced_peak if trace_memory else peak_rss_mb(), 1),
+        "stages": stages,
+    }
+    if failures:
+        result["first_error"] = failures[0]
+    unhealthy = {name: breaker["state"] for name, breaker in resilience.breaker_stats().items() if breaker["state"] != "closed"}
+    if unhealthy:
+        result["circuit_breakers"] = unhealthy
+    return result
+
+
+def print_report(results, trace_memory):
+    memory = "traced MB" if trace_memory else "peak RSS MB"
+    print(f"\n{'scenario':<10} {'reqs':>5} {'fail':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'CPU ms/req':>11} {memory:>12}")
+    for scenario, result in results.items():
+        print(
+            f"{scenario:<10} {result['requests']:>5} {result['failures']:>5} {result['throughput_rps']:>7.2f} "
+            f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} "
+            f"{result['cpu_ms_per_request']:>11.1f} {result['peak_memory_mb']:>12.1f}"
+        )
+        if "first_error" in result:
+            print(f"  first error: {result['first_error']}")
+        if "circuit_breakers" in result:
+            print(f"  circuit breakers at the end: {', '.join(f'{k} {v}' for k, v in result['circuit_breakers'].items())}")
+    for scenario, result in results.items():
+        print(f"\n{scenario} stages{'':<5} {'calls':>6} {'wall p50 ms':>12} {'CPU ms':>8}")
+        for stage, figures in result["stages"].items():
+            print(f"  {stage:<14} {figures['calls']:>6} {figures['wall_p50_ms']:>12.1f} {figures['cpu_mean_ms']:>8.2f}")
+
+
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for scenario, result in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if previous is None:
+            continue
+        if result["failures"] > previous["failures"]:
+            regressions.append(f"{scenario}: {result['failures']} failures (baseline {previous['failures']})")
+        for metric, worse in REGRESSION_CHECKS.items():
+            old, new = previous.get(metric), result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (worse == "higher" and change > threshold) or (worse == "lower" and -change > threshold):
+                regressions.append(f"{scenario}: {metric} {old:g} -> {new:g} ({change:+.1%})")
+    return regressions
+
+
+def parse_errors(overrides):
+    errors = {}
+    for override in overrides:
+        service, _, rate = override.partition("=")
+        if service not in DEFAULT_LATENCIES:
+            raise SystemExit(f"Unknown service {service!r}; expected one of {', '.join(DEFAULT_LATENCIES)}")
+        errors[service] = float(rate)
+    return errors
+
+
+def parse_latencies(overrides):
+    latencies = dict(DEFAULT_LATENCIES)
+    for override in overrides:
+        service, _, seconds = override.partition("=")
+        if service not in latencies:
+            raise SystemExit(f"Unknown service {service!r}; expected one of {', '.join(latencies)}")
+        latencies[service] = float(seconds)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=40, help="Analyses per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--images-per-product", type=int, default=2, help="Label photos per product page and per upload")
+    parser.add_argument("--image-size", type=int, default=1800, help="Width of the fake label images in pixels")
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SECONDS",
+                        help=f"Override a fake's latency ({', '.join(f'{k}={v:g}' for k, v in DEFAULT_LATENCIES.items())})")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every latency, e.g. 0.1 for quick runs")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction applied to each latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--errors", action="append", default=[], metavar="SERVICE=RATE",
+                        help="Make a fake fail this share of its calls, e.g. google=0.5")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Report tracemalloc peaks per scenario instead of the process peak RSS (slower)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative change that counts as a regression")
+    parser.add_argument("--save-baseline", help="Write this run's results as JSON")
+    args = parser.parse_args()
+
+    latencies = Latencies(parse_latencies(args.latency), args.latency_scale, args.jitter, args.seed)
+    print("Generating fixtures...")
+    url_scenarios = [scenario for scenario in args.scenarios if scenario.endswith("url")]
+    image_scenarios = [scenario for scenario in args.scenarios if scenario.endswith("image")]
+    # Each scenario gets its own products, so none of them starts with warm caches
+    products = args.requests * len(url_scenarios)
+    # One extra product warms up the whole pipeline before anything is measured
+    web = FakeWeb(latencies, products + 1, args.images_per_product, args.image_size)
+    upload_dir = os.path.join(_scratch, "uploads")
+    os.makedirs(upload_dir)
+    # Each uploaded product has as many photos as a scraped one, sent in one request
+    uploads = []
+    with ThreadPoolExecutor() as executor:
+        keys = [f"upload-{i}-{k}" for i in range(args.requests * len(image_scenarios)) for k in range(args.images_per_product)]
+        paths = []
+        for key, data in zip(keys, executor.map(lambda key: label_image(key, args.image_size), keys)):
+            paths.append(os.path.join(upload_dir, f"{key}.jpg"))
+            with open(paths[-1], "wb") as upload:
+                upload.write(data)
+        uploads = [paths[i:i + args.images_per_product] for i in range(0, len(paths), args.images_per_product)]
+
+    recorder = StageRecorder()
+    install_fakes(web, latencies, recorder)
+    import api
+
+    client_factory = api.app.test_client
+    # Start the process pool, search client and caches and load the reference data outside the measurements
+    if not analyze.analyze_product(web.product_url(products), is_url=True)["success"]:
+        raise SystemExit("The warm-up analysis failed")
+    recorder.reset()
+    # Errors are only injected once the warm-up has passed
+    latencies.errors = parse_errors(args.errors)
+
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            group = url_scenarios if scenario in url_scenarios else image_scenarios
+            offset = group.index(scenario) * args.requests
+            indexes = range(offset, offset + args.requests)
+            print(f"Running {scenario}: {args.requests} requests, concurrency {args.concurrency}")
+            results[scenario] = run_scenario(
+                scenario, indexes, args.concurrency, web, uploads, client_factory, recorder, args.trace_memory
+            )
+    finally:
+        shutil.rmtree(_scratch, ignore_errors=True)
+
+    print_report(results, args.trace_memory)
+    config = {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "threshold")}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as output:
+            json.dump({"config": config, "results": results}, output, indent=2)
+        print(f"\nSaved results to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != config:
+            print("\nWarning: the baseline was recorded with different options")
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
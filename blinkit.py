@@ -4,51 +4,86 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 
 import google.generativeai as genai
 
 import os
 from dotenv import load_dotenv
 import json
-import PIL.Image
 import requests
-from io import BytesIO
+from requests.adapters import HTTPAdapter
 import re
+import html
+import threading
 
 
 from prompts import analyze_food_prompt
+from driver_pool import create_pool
+from cache import CACHE_DIR, DiskCache
+from images import IMAGE_MAX_EDGE, download_image_parts, fetch_image
+from metrics import get_logger, span
+from resilience import bounded, get_breaker
 load_dotenv()
 
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", str(24 * 60 * 60)))
+BLINKIT_HTTP_FAST_PATH = os.getenv("BLINKIT_HTTP_FAST_PATH", "1") != "0"
+BLINKIT_HTTP_TIMEOUT = float(os.getenv("BLINKIT_HTTP_TIMEOUT", "10"))
+_product_id_pattern = re.compile(r"/prid/(\d+)")
+_json_ld_pattern = re.compile(
+    r"<script[^>]+type=[\"']application/ld\+json[\"'][^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL
+)
+_meta_pattern = re.compile(r"<meta\s[^>]*>", re.IGNORECASE)
+_attribute_pattern = re.compile(r"([\w:-]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-IN,en;q=0.9",
+}
+
+logger = get_logger("blinkit")
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+_scrape_cache = None
+_http_session = None
+_http_session_lock = threading.Lock()
+_scrape_stats = {"http": 0, "browser_fallback": 0}
+_scrape_stats_lock = threading.Lock()
+
 
 def setup_driver():
-    print("Setting up the Chrome driver...")
+    logger.info("Setting up the Chrome driver")
     chrome_options = Options()
     service = Service(os.getenv("CHROMEDRIVER_PATH"))
     driver = webdriver.Chrome(service=service, options=chrome_options)
     driver.set_window_size(1920, 1080)
-    print("Chrome driver setup complete.")
+    logger.info("Chrome driver setup complete")
     return driver
 
 
 def close_popup(driver):
-    print("Attempting to close the popup...")
+    logger.debug("Attempting to close the popup")
     try:
         close_button = WebDriverWait(driver, 5).until(
             EC.presence_of_element_located((By.XPATH, "//img[@alt='Close Slider']"))
         )
         close_button.click()
-        print("Popup closed successfully.")
+        logger.debug("Popup closed")
     except TimeoutException:
-        print("No popup found or popup didn't appear within the timeout.")
+        logger.debug("No popup appeared within the timeout")
     except NoSuchElementException:
-        print("Close button not found. Popup may not be present.")
+        logger.debug("Popup close button not found")
     except Exception as e:
-        print(f"An error occurred while trying to close the popup: {str(e)}")
+        logger.error("Error closing the popup", error=str(e))
 
 
 def extract_product_info(driver):
-    print("Extracting product name...")
+    logger.debug("Extracting product name")
     try:
         product_name = (
             WebDriverWait(driver, 10)
@@ -60,15 +95,15 @@ def extract_product_info(driver):
             )
             .text
         )
-        print(f"Product name extracted: {product_name}")
+        logger.info("Product name extracted", product_name=product_name)
         return product_name
     except Exception as e:
-        print(f"Error extracting product name: {str(e)}")
+        logger.error("Error extracting product name", error=str(e))
         return None
 
 
 def extract_image_urls(driver, url):
-    print(f"Navigating to URL: {url}")
+    logger.info("Navigating to product page", url=url)
     driver.get(url)
 
     close_popup(driver)
@@ -77,49 +112,241 @@ def extract_image_urls(driver, url):
     product_name = extract_product_info(driver)
 
     image_selector = ".ProductCarousel__CarouselImage-sc-11ow1fv-4"
-    print("Waiting for product images to load...")
+    logger.debug("Waiting for product images to load")
     try:
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, image_selector))
         )
     except TimeoutException:
-        print("Timed out waiting for product images to load.")
+        logger.warning("Timed out waiting for product images to load", url=url)
         return product_name, []  # Return product name even if no images found
 
     images = driver.find_elements(By.CSS_SELECTOR, image_selector)
     image_urls = [img.get_attribute("src") for img in images if img.get_attribute("src")]
-    print(f"Extracted {len(image_urls)} image URLs.")
+    logger.info("Extracted image URLs in the browser", images=len(image_urls))
 
     return product_name, image_urls
 
 
-def extract_image_urls_from_url(url):
-    driver = setup_driver()
+def get_http_session():
+    """Return the process-wide HTTP session, whose connections to Blinkit are kept alive"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(HTTP_HEADERS)
+            _http_session = session
+    return _http_session
+
+
+def _iter_json_ld(value):
+    if isinstance(value, list):
+        for item in value:
+            yield from _iter_json_ld(item)
+    elif isinstance(value, dict):
+        yield value
+        yield from _iter_json_ld(value.get("@graph", []))
+
+
+def _unique(urls):
+    seen = set()
+    return [url for url in urls if isinstance(url, str) and url and not (url in seen or seen.add(url))]
+
+
+def parse_product_html(page_html):
+    """
+    Read product name and image URLs from server-rendered product page HTML
+
+    Looks at the schema.org Product JSON-LD first and the Open Graph tags second.
+
+    Returns:
+        tuple: (product_name, image_urls), or (None, []) if the page doesn't
+        carry a product name and at least one image
+    """
+    for match in _json_ld_pattern.finditer(page_html):
+        try:
+            data = json.loads(html.unescape(match.group(1).strip()))
+        except ValueError:
+            continue
+        for item in _iter_json_ld(data):
+            types = item.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if "Product" not in types:
+                continue
+            images = item.get("image")
+            images = images if isinstance(images, list) else [images]
+            images = [image.get("url") if isinstance(image, dict) else image for image in images]
+            name, image_urls = item.get("name"), _unique(images)
+            if isinstance(name, str) and name.strip() and image_urls:
+                return html.unescape(name.strip()), image_urls
+
+    meta = {}
+    images = []
+    for tag in _meta_pattern.findall(page_html):
+        attributes = {key.lower(): html.unescape(double or single) for key, double, single in _attribute_pattern.findall(tag)}
+        key = attributes.get("property") or attributes.get("name")
+        if key and "content" in attributes:
+            meta.setdefault(key, attributes["content"])
+            if key in ("og:image", "og:image:url", "og:image:secure_url"):
+                images.append(attributes["content"])
+    name = meta.get("og:title", "").strip()
+    image_urls = _unique(images)
+    if name and image_urls:
+        return name, image_urls
+    return None, []
+
+
+def extract_image_urls_http(url):
+    """
+    Fetch a product page without a browser and parse it
+
+    Returns:
+        tuple: (product_name, image_urls) like extract_image_urls, or (None, [])
+        if the page couldn't be parsed or doesn't exist
+
+    Raises:
+        requests.RequestException: On connection errors and 5xx responses,
+            which mean Blinkit itself is failing
+    """
+    logger.info("Fetching product page over HTTP", url=url)
+    timeout = bounded(BLINKIT_HTTP_TIMEOUT)
     try:
-        return extract_image_urls(driver, url)
-    finally:
-        print("Closing the browser...")
-        driver.quit()
+        with span("blinkit.http"):
+            response = get_http_session().get(url, timeout=timeout)
+            response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error("Error fetching product page", url=url, error=str(e))
+        if e.response is None or e.response.status_code >= 500:
+            raise
+        return None, []
+    product_name, image_urls = parse_product_html(response.text)
+    if image_urls:
+        logger.info("Extracted image URLs over HTTP", images=len(image_urls))
+    return product_name, image_urls
 
 
-def open_image_from_url(image_url):
-    print(f"Opening image from URL: {image_url}")
+def _count_scrape(kind):
+    with _scrape_stats_lock:
+        _scrape_stats[kind] += 1
+
+
+def scrape_stats():
+    """Counts of scrapes served over plain HTTP and of fallbacks to the browser"""
+    with _scrape_stats_lock:
+        stats = dict(_scrape_stats)
+    total = stats["http"] + stats["browser_fallback"]
+    stats["fallback_rate"] = stats["browser_fallback"] / total if total else None
+    return stats
+
+
+def get_driver_pool():
+    """Return the process-wide pool of warm Chrome drivers, starting it on first use"""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = create_pool(setup_driver)
+    return _driver_pool
+
+
+def driver_pool_stats():
+    """Stats of the driver pool, or None if no browser has been started in this process"""
+    return _driver_pool.stats() if _driver_pool is not None else None
+
+
+def get_scrape_cache():
+    global _scrape_cache
+    if _scrape_cache is None:
+        _scrape_cache = DiskCache(os.path.join(CACHE_DIR, "scrapes.sqlite3"), ttl=SCRAPE_CACHE_TTL)
+    return _scrape_cache
+
+
+def extract_product_id(url):
+    """Return the Blinkit product id from a /prid/<id> URL, or None"""
+    match = _product_id_pattern.search(url) if isinstance(url, str) else None
+    return match.group(1) if match else None
+
+
+def scrape_product(url):
+    """
+    Scrape product name and image URLs, reusing a cached scrape of the same product
+
+    The page is fetched over plain HTTP first and only rendered in a pooled
+    Chrome driver when the HTML doesn't carry the product name and images.
+
+    The cache is keyed by the /prid/<id> product id, so different URL spellings
+    of one product share an entry. Scrapes that found no images are not cached.
+
+    Connection errors, 5xx responses and browser errors count against the
+    "blinkit" circuit breaker; while it is open, uncached scrapes fail at once
+    with CircuitOpenError. Pages without images (e.g. a wrong product URL) and a
+    busy driver pool say nothing about Blinkit's health and don't count.
+
+    Returns:
+        dict: {"product_id", "product_name", "image_urls", "cached"}
+    """
+    product_id = extract_product_id(url)
+    cache_key = f"blinkit:{product_id}" if product_id else None
+    if cache_key:
+        cached = get_scrape_cache().get(cache_key)
+        if cached is not None:
+            logger.info("Using cached scrape", product_id=product_id)
+            return dict(cached, cached=True)
+
+    breaker = get_breaker("blinkit")
+    breaker.before_call()
+    http_error = None
     try:
-        response = requests.get(image_url)
-        response.raise_for_status()  # Ensure the request was successful
-        image = PIL.Image.open(BytesIO(response.content))
-        print("Image opened successfully.")
-        return image
-    except Exception as e:
-        print(f"Error opening image from URL {image_url}: {str(e)}")
-        return None
+        product_name, image_urls = None, []
+        if BLINKIT_HTTP_FAST_PATH:
+            try:
+                product_name, image_urls = extract_image_urls_http(url)
+            except requests.RequestException as e:
+                # The browser may still get through; if it doesn't, this counts as a failure
+                http_error = e
+        if image_urls:
+            _count_scrape("http")
+        else:
+            logger.warning("Falling back to the browser scraper", url=url)
+            _count_scrape("browser_fallback")
+            with span("blinkit.browser"), get_driver_pool().driver() as driver:
+                product_name, image_urls = extract_image_urls(driver, url)
+    except (WebDriverException, requests.RequestException):
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    if image_urls:
+        breaker.record_success()
+    elif http_error is not None:
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+    scrape = {"product_id": product_id, "product_name": product_name, "image_urls": image_urls}
+    if cache_key and image_urls:
+        get_scrape_cache().set(cache_key, scrape)
+    return dict(scrape, cached=False)
+
+
+def extract_image_urls_from_url(url):
+    scrape = scrape_product(url)
+    return scrape["product_name"], scrape["image_urls"]
+
+
+def open_image_from_url(image_url):
+    logger.debug("Opening image", url=image_url)
+    return fetch_image(image_url)
 
 
 def modify_image_url(url):
-    print(f"Modifying image URL: {url}")
+    logger.debug("Modifying image URL", url=url)
     # Check if url is a string
     if not isinstance(url, str):
-        print(f"Warning: Expected string URL but got {type(url)}. Returning original value.")
+        logger.warning("Expected a string URL, returning the original value", type=type(url).__name__)
         return url
 
     # Pattern to match w, h, and q parameters
@@ -128,11 +355,12 @@ def modify_image_url(url):
     quality_pattern = r",q=\d+"
 
     # Apply the replacements
-    modified_url = re.sub(height_pattern, ",h=1200", url)
-    modified_url = re.sub(width_pattern, ",w=1200", modified_url)
+    # No point fetching more pixels than preprocessing keeps
+    modified_url = re.sub(height_pattern, f",h={IMAGE_MAX_EDGE}", url)
+    modified_url = re.sub(width_pattern, f",w={IMAGE_MAX_EDGE}", modified_url)
     modified_url = re.sub(quality_pattern, ",q=100", modified_url)
 
-    print(f"Modified URL: {modified_url}")
+    logger.debug("Modified image URL", url=modified_url)
     return modified_url
 
 
@@ -146,11 +374,7 @@ if __name__ == "__main__":
     model = genai.GenerativeModel("gemini-1.5-pro")
 
     print("Opening images and generating content...")
-    image_list = [
-        open_image_from_url(image_url)
-        for image_url in modified_image_urls
-        if open_image_from_url(image_url) is not None
-    ]
+    image_list = download_image_parts(modified_image_urls)
     prompt = [analyze_food_prompt]
 
     response = model.generate_content(prompt + image_list)
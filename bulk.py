@@ -0,0 +1,166 @@
+"""
+Analyze products in bulk from a JSONL file.
+
+Each input line is {"url": ...} or {"image": path}, with an optional "id".
+Results are appended to the output JSONL as they finish, one line per
+record with the same id. The output file doubles as the checkpoint: running
+the same command again skips every record that already has a result, so an
+interrupted run resumes where it stopped.
+
+    python bulk.py products.jsonl results.jsonl --concurrency 4
+"""
+import argparse
+import collections
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+FSYNC_EVERY = 20
+
+
+def record_id(record, line_number):
+    return str(record.get("id") or record.get("url") or record.get("image") or f"line:{line_number}")
+
+
+def read_checkpoint(output_path, retry_failed=False):
+    """
+    Return the ids that already have a result in output_path
+
+    A partial last line left by a crash is cut off so appended results start
+    on a fresh line.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as output:
+        data = output.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            output.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        # Skip lines that aren't results of this tool, e.g. from a foreign or hand-edited file
+        if not isinstance(result, dict) or result.get("id") is None:
+            continue
+        if retry_failed and not result.get("success"):
+            continue
+        done.add(result["id"])
+    return done
+
+
+def iter_records(input_path, done):
+    """Yield (id, record) for input records that still need a result, reading lazily"""
+    with open(input_path) as records:
+        for line_number, line in enumerate(records, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record, item_id = {"error": f"Invalid JSON: {str(e)}"}, f"line:{line_number}"
+            else:
+                if isinstance(record, dict):
+                    item_id = record_id(record, line_number)
+                else:
+                    record, item_id = {"error": "Record must be a JSON object"}, f"line:{line_number}"
+            # Unreadable lines get a result too, so a resumed run doesn't report them again
+            if item_id not in done:
+                done.add(item_id)
+                yield item_id, record
+
+
+def process_record(record):
+    from analyze import run_analysis
+
+    if "error" in record:
+        return {"success": False, "error": record["error"]}
+    if record.get("url"):
+        return run_analysis(record["url"], is_url=True)
+    if record.get("image"):
+        return run_analysis(record["image"], is_url=False)
+    return {"success": False, "error": "Record needs a url or an image"}
+
+
+def run(input_path, output_path, concurrency=4, processes=False, retry_failed=False, limit=None):
+    done = read_checkpoint(output_path, retry_failed)
+    skipped = len(done)
+    print(f"Resuming with {skipped} records already done" if skipped else "Starting a new run")
+
+    stats = collections.Counter()
+    errors = collections.Counter()
+    started = time.perf_counter()
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    records = iter_records(input_path, done)
+    pending = {}
+
+    with executor_class(max_workers=concurrency) as executor, open(output_path, "a") as output:
+        def submit_next():
+            if limit is not None and stats["submitted"] >= limit:
+                return False
+            for item_id, record in records:
+                future = executor.submit(process_record, record)
+                pending[future] = (item_id, record, time.perf_counter())
+                stats["submitted"] += 1
+                return True
+            return False
+
+        try:
+            # Keep a bounded number of records in flight so huge inputs aren't read up front
+            while len(pending) < concurrency * 2 and submit_next():
+                pass
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item_id, record, submitted_at = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                    line = {"id": item_id, "input": record, "seconds": round(time.perf_counter() - submitted_at, 2)}
+                    line.update(result)
+                    output.write(json.dumps(line) + "\n")
+                    output.flush()
+                    stats["succeeded" if result.get("success") else "failed"] += 1
+                    if not result.get("success"):
+                        errors[str(result.get("error"))[:120]] += 1
+                    completed = stats["succeeded"] + stats["failed"]
+                    if completed % FSYNC_EVERY == 0:
+                        os.fsync(output.fileno())
+                        rate = completed / (time.perf_counter() - started)
+                        print(f"{completed} done ({stats['failed']} failed), {rate * 60:.1f} items/min")
+                    submit_next()
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for running records; rerun the same command to resume")
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            output.flush()
+            os.fsync(output.fileno())
+
+    elapsed = time.perf_counter() - started
+    completed = stats["succeeded"] + stats["failed"]
+    print("\n=== Bulk Analysis Finished ===")
+    print(f"Processed: {completed} in {elapsed:.1f}s ({completed / elapsed * 60 if elapsed else 0:.1f} items/min)")
+    print(f"Succeeded: {stats['succeeded']}, failed: {stats['failed']}, skipped (already done): {skipped}")
+    if completed:
+        print(f"Failure rate: {stats['failed'] / completed:.1%}")
+    for error, count in errors.most_common(5):
+        print(f"  {count} x {error}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of {\"url\"} or {\"image\"} records")
+    parser.add_argument("output", help="JSONL file results are appended to (and resumed from)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--processes", action="store_true", help="Run records in worker processes instead of threads")
+    parser.add_argument("--retry-failed", action="store_true", help="Redo records whose previous result failed")
+    parser.add_argument("--limit", type=int, help="Stop after this many new records")
+    args = parser.parse_args()
+    run(args.input, args.output, args.concurrency, args.processes, args.retry_failed, args.limit)
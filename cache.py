@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import CACHE_LOOKUPS
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# Writes per process between eviction passes
+CACHE_EVICT_EVERY = int(os.getenv("CACHE_EVICT_EVERY", "100"))
+# Reads refresh an entry's last-read time at most this often, in seconds
+CACHE_ACCESS_RESOLUTION = float(os.getenv("CACHE_ACCESS_RESOLUTION", "60"))
+
+
+def stable_hash(*parts):
+    """SHA-256 hex digest of strings, bytes and JSON-serializable values, independent of dict order"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = json.dumps(part, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    JSON key/value cache in a local SQLite file.
+
+    Every Flask worker process opens the same file, so an entry written by one
+    worker is visible to all of them. SQLite's WAL mode lets readers proceed
+    while another process writes. Entries carry an optional expiry time and
+    expired ones are treated as misses.
+
+    Every CACHE_EVICT_EVERY writes, a process purges expired entries and, with
+    max_entries set, evicts the least recently read entries beyond it, so the
+    cache can briefly overshoot max_entries between passes. Last-read times
+    are only refreshed every CACHE_ACCESS_RESOLUTION seconds, so most reads
+    don't write.
+
+    Hits and misses are counted in memory per key namespace (the part of the
+    key before the first ":"), so stats() covers this process only; the
+    foodlabel_cache_lookups_total metric has the same counts.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL)"
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(entries)")]
+            if "accessed_at" not in columns:
+                connection.execute("ALTER TABLE entries ADD COLUMN accessed_at REAL")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads or forked processes,
+        # so keep one per thread and reopen after a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, key, hit):
+        namespace = key.split(":", 1)[0]
+        with self._lock:
+            hits, misses = self._counts.get(namespace, (0, 0))
+            self._counts[namespace] = (hits + 1, misses) if hit else (hits, misses + 1)
+        CACHE_LOOKUPS.inc(namespace=namespace, result="hit" if hit else "miss")
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is not None and self.max_entries and (row[2] is None or now - row[2] >= CACHE_ACCESS_RESOLUTION):
+                connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(key, row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % CACHE_EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def evict(self):
+        """Purge expired entries, then the least recently read ones beyond max_entries"""
+        self.purge_expired()
+        if not self.max_entries:
+            return
+        with self._connection() as connection:
+            excess = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+
+    def stats(self):
+        """Entry count plus this process's hits, misses and hit rate per key namespace"""
+        connection = self._connection()
+        stats = {"entries": connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]}
+        with self._lock:
+            counts = dict(self._counts)
+        for namespace, (hits, misses) in counts.items():
+            stats[namespace] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            }
+        return stats
@@ -0,0 +1,273 @@
+"""
+Compact the product data sent to Mistral to fit a token budget.
+
+The full extracted data carries every search result of every ingredient as
+title/snippet/link triples, plus the whole parse tree. For the analysis the
+model only needs the label, what each additive is, the safety
+classifications and a few informative snippets per ingredient, so:
+
+- links and titles are dropped and near-identical snippets are merged
+- snippets are ranked per ingredient by how much health information they
+  carry and capped
+- parsed ingredients are reduced to one line per identified additive
+- safety classifications are deduplicated into one line per classified
+  ingredient
+
+If the result is still over budget, snippets are cut further, then
+shortened, then dropped. Ingredients and their safety classifications are
+never dropped; only when the prompt is over budget even without snippets are
+long classification lines shortened, as a last resort.
+
+    python compaction.py results.jsonl     # report reductions for bulk results or extracted data
+"""
+import json
+import os
+import re
+import sys
+
+from safety_index import NO_CLASSIFICATION
+
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "1") == "1"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_SNIPPETS_PER_INGREDIENT = int(os.getenv("PROMPT_SNIPPETS_PER_INGREDIENT", "3"))
+# Word-set similarity (0-1) above which two snippets count as the same
+SNIPPET_SIMILARITY = float(os.getenv("SNIPPET_SIMILARITY", "0.7"))
+SNIPPET_MAX_CHARS = 160
+# Safety lines are shortened to these lengths, in turn, only if the prompt is still over budget
+SAFETY_MAX_CHARS = (240, 120)
+
+# Words that make a snippet worth more to a health analysis than generic product copy
+HEALTH_TERMS = (
+    "safe", "safety", "risk", "health", "harm", "toxic", "cancer", "carcino", "allerg", "intoler",
+    "side effect", "adi", "daily intake", "acceptable", "limit", "banned", "permitted", "approved",
+    "fssai", "fda", "efsa", "who", "jecfa", "gras", "study", "studies", "research", "evidence",
+    "blood sugar", "diabetes", "heart", "cholesterol", "obesity", "inflammation", "gut", "laxative",
+    "hyperactiv", "children", "pregnan", "kidney", "liver", "sodium", "trans fat",
+)
+
+_token_pattern = re.compile(r"\w+|[^\w\s]")
+_word_pattern = re.compile(r"[a-z0-9]+")
+_date_prefix_pattern = re.compile(r"^(?:[A-Z][a-z]{2} \d{1,2}, \d{4}|\d+ (?:days?|hours?) ago)\s*(?:\.\.\.|—|-)?\s*")
+_space_pattern = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    """
+    Approximate the number of model tokens in text
+
+    Counts words and punctuation marks, with long words counting extra,
+    which tracks BPE tokenizers closely enough to size prompts.
+    """
+    return sum(1 + len(token) // 8 for token in _token_pattern.findall(text))
+
+
+def encode(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def clean_snippet(snippet):
+    """Collapse whitespace and strip the date prefix and ellipses search engines add"""
+    snippet = _space_pattern.sub(" ", snippet or "").strip()
+    snippet = _date_prefix_pattern.sub("", snippet)
+    return snippet.strip(" .…") + "." if snippet else ""
+
+
+def _words(text):
+    return set(_word_pattern.findall(text.lower()))
+
+
+def _similar(words, other):
+    if not words or not other:
+        return False
+    return len(words & other) / len(words | other) >= SNIPPET_SIMILARITY
+
+
+def score_snippet(snippet, query, position):
+    """Rank a snippet by its health terms and query words, preferring higher search positions"""
+    text = snippet.lower()
+    health = sum(term in text for term in HEALTH_TERMS)
+    query_words = _words(query)
+    overlap = len(query_words & _words(text)) / len(query_words) if query_words else 0
+    return 2 * health + overlap - 0.3 * position
+
+
+def rank_snippets(search_results, limit=PROMPT_SNIPPETS_PER_INGREDIENT):
+    """
+    Pick the best distinct snippets of every query, at most limit each
+
+    Near-identical snippets of one query are kept once, as are snippets
+    repeated word for word under several queries. Only snippets that are
+    kept count as seen, so a snippet one query ranked below the limit is
+    still kept under another.
+
+    Returns:
+        tuple: ({query: [snippet, ...]}, number of duplicates removed)
+    """
+    seen_anywhere = set()
+    duplicates = 0
+    ranked = {}
+    for query, results in search_results.items():
+        seen = []
+        candidates = []
+        for position, result in enumerate(results or []):
+            snippet = clean_snippet(result.get("snippet") if isinstance(result, dict) else str(result))
+            if snippet:
+                candidates.append((score_snippet(snippet, query, position), position, snippet))
+        kept = []
+        for _, _, snippet in sorted(candidates, key=lambda candidate: (-candidate[0], candidate[1])):
+            if len(kept) >= limit:
+                break
+            words = _words(snippet)
+            if frozenset(words) in seen_anywhere or any(_similar(words, other) for other in seen):
+                duplicates += 1
+                continue
+            seen.append(words)
+            seen_anywhere.add(frozenset(words))
+            kept.append(snippet)
+        ranked[query] = kept
+    return ranked, duplicates
+
+
+def summarize_safety(safety_classifications, max_chars=None):
+    """
+    One line of distinct classifications per classified ingredient, at most max_chars long if given
+
+    Ingredients without a classification are left out; they are still in the ingredient list.
+    """
+    summary = {}
+    for ingredient, infos in safety_classifications.items():
+        infos = infos if isinstance(infos, list) else [infos]
+        distinct = list(dict.fromkeys(
+            _space_pattern.sub(" ", str(info)).strip() for info in infos if info and info != NO_CLASSIFICATION
+        ))
+        if not distinct:
+            continue
+        line = "; ".join(distinct)
+        if max_chars and len(line) > max_chars:
+            line = line[:max_chars - 1].rstrip() + "…"
+        summary[ingredient] = line
+    return summary
+
+
+def summarize_additives(parsed_ingredients):
+    """One line per identified additive, e.g. "INS 422 Glycerol (Humectant)"; plain ingredients are left out"""
+    lines = []
+
+    def visit(component):
+        if component.get("substance"):
+            line = f"INS {component['ins']} {component['substance']}" if component.get("ins") else component["substance"]
+            if component.get("functional_class"):
+                line += f" ({component['functional_class']})"
+            lines.append(line)
+        for child in component.get("children", []):
+            visit(child)
+
+    for component in parsed_ingredients or []:
+        if isinstance(component, dict):
+            visit(component)
+    return list(dict.fromkeys(lines))
+
+
+def _shorten(snippet, max_chars):
+    return snippet if len(snippet) <= max_chars else snippet[:max_chars - 1].rsplit(" ", 1)[0] + "…"
+
+
+def compact_product_data(product_data, budget=PROMPT_TOKEN_BUDGET, snippets_per_ingredient=PROMPT_SNIPPETS_PER_INGREDIENT):
+    """
+    Shrink product data for the analysis prompt to fit budget tokens where possible
+
+    Returns:
+        tuple: (compacted data, stats dict with "original_tokens",
+        "compacted_tokens", "reduction", "snippets_kept",
+        "duplicates_removed" and "over_budget")
+    """
+    original_tokens = estimate_tokens(encode(product_data))
+    search_results = product_data.get("ingredient_search_results") or {}
+
+    compacted = {key: value for key, value in product_data.items()
+                 if key not in ("parsed_ingredients", "safety_classifications", "ingredient_search_results")}
+    facts = product_data.get("nutrition_facts")
+    if facts:
+        # The label already carries the amounts; the model only needs what was computed from them
+        compacted["nutrition_facts"] = {
+            "daily_value_pct": {name: nutrient["daily_value_pct"] for name, nutrient in facts["nutrients"].items()
+                                if nutrient["daily_value_pct"] is not None},
+            "energy_kcal": facts["energy_kcal"],
+            "energy_split_pct": facts["energy_split_pct"],
+        }
+    additives = summarize_additives(product_data.get("parsed_ingredients"))
+    if additives:
+        compacted["additives"] = additives
+    safety = product_data.get("safety_classifications") or {}
+    if safety:
+        compacted["safety_classifications"] = summarize_safety(safety)
+
+    def with_snippets(limit, max_chars=None):
+        # Ranked again per limit, so a snippet cut from one query can stay under another
+        data = dict(compacted)
+        ranked, duplicates = rank_snippets(search_results, limit=limit)
+        snippets = {
+            query: [_shorten(snippet, max_chars) if max_chars else snippet for snippet in kept]
+            for query, kept in ranked.items() if kept
+        }
+        if snippets:
+            data["ingredient_research"] = snippets
+        return data, duplicates
+
+    # Fewer snippets first, then shorter ones, then none; the label and safety data always stay
+    attempts = [(limit, None) for limit in range(max(snippets_per_ingredient, 0), 0, -1)] + [(1, SNIPPET_MAX_CHARS), (0, None)]
+    for limit, max_chars in attempts:
+        data, duplicates = with_snippets(limit, max_chars)
+        tokens = estimate_tokens(encode(data))
+        if tokens <= budget:
+            break
+    for max_chars in SAFETY_MAX_CHARS:
+        if tokens <= budget or not safety:
+            break
+        data["safety_classifications"] = summarize_safety(safety, max_chars=max_chars)
+        tokens = estimate_tokens(encode(data))
+
+    stats = {
+        "original_tokens": original_tokens,
+        "compacted_tokens": tokens,
+        "reduction": round(1 - tokens / original_tokens, 3) if original_tokens else 0.0,
+        "snippets_kept": sum(len(snippets) for snippets in data.get("ingredient_research", {}).values()),
+        "duplicates_removed": duplicates,
+        "over_budget": tokens > budget,
+    }
+    return data, stats
+
+
+def _iter_product_data(path):
+    """Product data from a JSON file of extracted data or a JSONL file of bulk/job results"""
+    with open(path) as source:
+        text = source.read()
+    try:
+        records = [json.loads(text)]
+    except ValueError:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for record in records:
+        data = record.get("data", record) if isinstance(record, dict) else None
+        product_data = data.get("extracted_data", data) if isinstance(data, dict) else None
+        if isinstance(product_data, dict) and "ingredients" in product_data:
+            yield product_data
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    totals = {"original_tokens": 0, "compacted_tokens": 0, "records": 0, "over_budget": 0}
+    for path in sys.argv[1:]:
+        for product_data in _iter_product_data(path):
+            _, stats = compact_product_data(product_data)
+            totals["records"] += 1
+            totals["original_tokens"] += stats["original_tokens"]
+            totals["compacted_tokens"] += stats["compacted_tokens"]
+            totals["over_budget"] += stats["over_budget"]
+            name = product_data.get("product_name") or f"record {totals['records']}"
+            print(f"{name[:50]:<50} {stats['original_tokens']:>7} -> {stats['compacted_tokens']:>6} tokens "
+                  f"({stats['reduction']:.0%} smaller, {stats['duplicates_removed']} duplicate snippets)")
+    if totals["records"]:
+        reduction = 1 - totals["compacted_tokens"] / totals["original_tokens"] if totals["original_tokens"] else 0
+        print(f"\n{totals['records']} products: {totals['original_tokens']} -> {totals['compacted_tokens']} "
+              f"estimated tokens ({reduction:.0%} smaller), {totals['over_budget']} over the {PROMPT_TOKEN_BUDGET} token budget")
@@ -0,0 +1,191 @@
+import atexit
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+from metrics import get_logger
+
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+DRIVER_MAX_USES = int(os.getenv("DRIVER_MAX_USES", "50"))
+DRIVER_POOL_TIMEOUT = float(os.getenv("DRIVER_POOL_TIMEOUT", "60"))
+
+logger = get_logger("driver_pool")
+
+
+class DriverPoolTimeout(Exception):
+    pass
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+
+class DriverPool:
+    """
+    Bounded pool of pre-started Selenium drivers.
+
+    Callers borrow a driver with `with pool.driver() as driver:` and it is handed
+    back when the block exits. Idle drivers are health-checked before being lent
+    out, and a driver is quit and replaced after max_uses borrows or as soon as a
+    borrower fails with a WebDriverException.
+    """
+
+    def __init__(self, factory, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES, timeout=DRIVER_POOL_TIMEOUT):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._waits = collections.deque(maxlen=1000)
+        self._stats = {"created": 0, "recycled": 0, "crashed": 0, "borrowed": 0, "in_use": 0, "timeouts": 0}
+
+    def start(self):
+        """Start drivers until the pool is full, so the first requests don't pay for a browser launch"""
+        with self._condition:
+            missing = self.size - self._total
+            self._total += missing
+        started = []
+        try:
+            for _ in range(missing):
+                started.append(self._create())
+        except Exception:
+            # Don't leave browsers running for a pool that failed to start
+            for pooled in started:
+                self._quit(pooled)
+            with self._condition:
+                self._total -= missing
+                self._condition.notify_all()
+            raise
+        for pooled in started:
+            self._release(pooled)
+        return self
+
+    def _create(self):
+        pooled = _PooledDriver(self.factory())
+        with self._condition:
+            self._stats["created"] += 1
+        return pooled
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.error("Error quitting driver", error=str(e))
+
+    def _discard(self, pooled, reason):
+        self._quit(pooled)
+        with self._condition:
+            self._stats[reason] += 1
+            self._total -= 1
+            self._condition.notify()
+
+    def _is_healthy(self, pooled):
+        try:
+            pooled.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _acquire(self):
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        while True:
+            pooled = None
+            create = False
+            with self._condition:
+                while not self._idle and self._total >= self.size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise DriverPoolTimeout(f"No browser available after waiting {self.timeout:g}s")
+                    self._condition.wait(remaining)
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    # Reserve the slot before launching the browser outside the lock
+                    self._total += 1
+                    create = True
+
+            if create:
+                try:
+                    pooled = self._create()
+                except Exception:
+                    with self._condition:
+                        self._total -= 1
+                        self._condition.notify()
+                    raise
+                break
+            if self._is_healthy(pooled):
+                break
+            self._discard(pooled, "crashed")
+
+        wait = time.perf_counter() - started
+        with self._condition:
+            self._waits.append(wait)
+            self._stats["borrowed"] += 1
+            self._stats["in_use"] += 1
+        return pooled
+
+    def _release(self, pooled):
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    @contextmanager
+    def driver(self):
+        """Borrow a driver for the duration of a with block"""
+        if self._closed:
+            raise RuntimeError("Driver pool is shut down")
+        pooled = self._acquire()
+        crashed = False
+        try:
+            yield pooled.driver
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            pooled.uses += 1
+            with self._condition:
+                self._stats["in_use"] -= 1
+            if crashed:
+                self._discard(pooled, "crashed")
+            elif self._closed or pooled.uses >= self.max_uses:
+                self._discard(pooled, "recycled")
+            else:
+                self._release(pooled)
+
+    def stats(self):
+        """Pool counters plus queue-wait percentiles (seconds) over the last 1000 borrows"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+            waits = sorted(self._waits)
+        stats["size"] = self.size
+        if waits:
+            stats["wait_p50"] = waits[len(waits) // 2]
+            stats["wait_p95"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+            stats["wait_max"] = waits[-1]
+        return stats
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled, "recycled")
+
+
+def create_pool(factory, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES, timeout=DRIVER_POOL_TIMEOUT):
+    """Create a started pool whose browsers are quit when the process exits"""
+    pool = DriverPool(factory, size=size, max_uses=max_uses, timeout=timeout)
+    atexit.register(pool.shutdown)
+    return pool.start()
@@ -515,6 +515,14 @@ function ProductAnalyzer({
     );
   }
 
+  // Inline spinner for a section whose stream event hasn't arrived yet
+  const PendingSection = ({ label }) => (
+    <Box sx={{ display: 'flex', alignItems: 'center', gap: 1.5, py: 2, color: 'text.secondary' }}>
+      <CircularProgress size={20} />
+      <Typography variant="body2">{label}</Typography>
+    </Box>
+  );
+
   // 2. Define SafetyClassification component
   const SafetyClassification = ({ ingredient, classifications }) => {
     if (!ingredient || !classifications) return null;
@@ -595,22 +603,59 @@ function ProductAnalyzer({
     }));
   };
 
+  // Merge one streamed event into the partial result shown while the analysis runs
+  const applyStreamEvent = (event) => {
+    switch (event.event) {
+      case 'product':
+        setResult((previous) => ({ ...previous, product_name: event.product_name }))
+        break
+      case 'extracted':
+        setResult((previous) => ({
+          ...previous,
+          extracted_data: { ...previous?.extracted_data, ...event.extracted_data },
+        }))
+        break
+      case 'safety':
+        setResult((previous) => ({
+          ...previous,
+          extracted_data: {
+            ...previous?.extracted_data,
+            parsed_ingredients: event.parsed_ingredients,
+            safety_classifications: event.safety_classifications,
+          },
+        }))
+        break
+      case 'analysis':
+        setResult((previous) => ({ ...previous, analysis: event.analysis }))
+        break
+      case 'result':
+        if (!event.success) {
+          throw new Error(event.error)
+        }
+        setResult(event.data)
+        break
+      default:
+        break
+    }
+  }
+
   const analyzeProduct = async (e) => {
     e.preventDefault()
     setLoading(true)
     setError(null)
+    setResult(null)
 
     try {
       let response;
       const API_URL = "http://127.0.0.1:5000"
 
       if (uploadType === 'url') {
-        response = await fetch(`${API_URL}/api/analyze`, {
+        response = await fetch(`${API_URL}/api/analyze/stream`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
             'Origin': 'https://foodxray.netlify.app',
-            'Accept': 'application/json',
+            'Accept': 'application/x-ndjson',
           },
           credentials: 'omit',
           body: JSON.stringify({ url }),
@@ -619,24 +664,40 @@ function ProductAnalyzer({
         const formData = new FormData();
         formData.append('image', selectedFile);
 
-        response = await fetch(`${API_URL}/api/analyze`, {
+        response = await fetch(`${API_URL}/api/analyze/stream`, {
           method: 'POST',
           headers: {
             'Origin': 'https://foodxray.netlify.app',
-            'Accept': 'application/json',
+            'Accept': 'application/x-ndjson',
           },
           credentials: 'omit',
           body: formData,
         });
       }
 
-      const data = await response.json()
-
-      if (!data.success) {
+      if (!response.ok) {
+        const data = await response.json()
         throw new Error(data.error)
       }
 
-      setResult(data.data)
+      // The response is newline-delimited JSON, one event per stage
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffered = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done })
+        const lines = buffered.split('\n')
+        buffered = lines.pop()
+        for (const line of lines) {
+          if (line.trim()) {
+            applyStreamEvent(JSON.parse(line))
+          }
+        }
+        if (done) {
+          break
+        }
+      }
     } catch (err) {
       setError(err.message)
     } finally {
@@ -651,7 +712,7 @@ function ProductAnalyzer({
       label: 'Information',
       icon: <Insights />,
       content: (
-        result?.extracted_data && (
+        (result?.product_name || result?.extracted_data) && (
           <Card sx={{
             width: '100%',
             boxShadow: 'none',
@@ -683,8 +744,12 @@ function ProductAnalyzer({
                 </Box>
               )}
 
+              {!result.extracted_data && loading && (
+                <PendingSection label="Reading the label..." />
+              )}
+
               {/* Ingredients Section */}
-              {result.extracted_data.ingredients?.length > 0 && (
+              {result.extracted_data?.ingredients?.length > 0 && (
                 <Box sx={{ mb: 2.5 }}>
                   <Typography
                     variant="subtitle1"
@@ -715,7 +780,7 @@ function ProductAnalyzer({
               )}
 
               {/* Nutrition Section */}
-              {result.extracted_data['nutritional label'] && (
+              {result.extracted_data?.['nutritional label'] && (
                 <Box>
                   <Typography
                     variant="subtitle1"
@@ -832,7 +897,13 @@ function ProductAnalyzer({
       label: 'Analysis',
       icon: <Assessment />,
       content: (
-        result?.analysis && (
+        !result?.analysis && loading ? (
+          <Card>
+            <CardContent>
+              <PendingSection label="Analyzing ingredients and nutrition..." />
+            </CardContent>
+          </Card>
+        ) : result?.analysis && (
           <Card>
             <CardContent>
               {/* Analysis Sections */}
@@ -1644,7 +1715,7 @@ function ProductAnalyzer({
           )}
 
           {/* Results */}
-          {loading ? (
+          {loading && !result ? (
             <LoadingAnimation />
           ) : (
             result && (
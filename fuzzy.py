@@ -0,0 +1,215 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Name and synonym columns indexed for fuzzy matching, per reference table.
+# List-like cells are split on refdata.VALUE_SEPARATOR so every synonym is its own entry.
+FUZZY_SOURCES = {
+    "scogs": ["GRAS Substance", "Other Names"],
+    "monographs": ["Agent"],
+    "roc": ["NAME OR SYNONYM"],
+    "fda_substances": ["Substance", "Other Names"],
+    "ins": ["Name"],
+}
+
+FUZZY_MATCH_THRESHOLD = float(os.getenv("FUZZY_MATCH_THRESHOLD", "0.7"))
+FUZZY_MATCH_TOP_K = int(os.getenv("FUZZY_MATCH_TOP_K", "3"))
+# Candidates must hit this many of a query's rarest trigrams before being scored
+PREFIX_HITS = 2
+# Names matched together; the candidate arrays of a chunk grow with chunk size x reference entries
+FUZZY_MATCH_CHUNK = int(os.getenv("FUZZY_MATCH_CHUNK", "64"))
+
+_non_alphanumeric_pattern = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_for_matching(name):
+    """Lower-case name and reduce punctuation to single spaces"""
+    return _non_alphanumeric_pattern.sub(" ", name.lower()).strip()
+
+
+def trigram_codes(name):
+    """Return the sorted unique uint32 codes of the word-padded trigrams of name"""
+    codes = set()
+    for word in normalize_for_matching(name).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            codes.add(zlib.crc32(padded[i:i + 3].encode()))
+    return np.array(sorted(codes), dtype=np.uint32)
+
+
+def build_trigram_sections(entries):
+    """
+    Build the trigram index sections stored in the reference artifact
+
+    Args:
+        entries (list): (table code, row, name) tuples
+
+    Returns:
+        dict: Raw bytes for each section. keys are the sorted trigram codes and the
+        postings of keys[i] are postings[offsets[i]:offsets[i + 1]]; the trigrams
+        of entry j, as indices into keys, are entry_keys[entry_offsets[j]:entry_offsets[j + 1]].
+    """
+    entry_codes = [trigram_codes(name) for _, _, name in entries]
+    sizes = np.array([len(codes) for codes in entry_codes], dtype=np.uint32)
+    entry_offsets = np.zeros(len(entries) + 1, dtype=np.uint32)
+    np.cumsum(sizes, out=entry_offsets[1:])
+    all_codes = np.concatenate(entry_codes) if entry_codes else np.array([], dtype=np.uint32)
+    entry_ids = np.repeat(np.arange(len(entries), dtype=np.uint32), sizes)
+
+    order = np.lexsort((entry_ids, all_codes))
+    keys, counts = np.unique(all_codes[order], return_counts=True)
+    offsets = np.zeros(len(keys) + 1, dtype=np.uint32)
+    np.cumsum(counts, out=offsets[1:])
+
+    return {
+        "keys": keys.astype(np.uint32).tobytes(),
+        "offsets": offsets.tobytes(),
+        "postings": entry_ids[order].tobytes(),
+        "entry_offsets": entry_offsets.tobytes(),
+        "entry_keys": np.searchsorted(keys, all_codes).astype(np.uint32).tobytes(),
+        "tables": np.array([table for table, _, _ in entries], dtype=np.uint8).tobytes(),
+        "rows": np.array([row for _, row, _ in entries], dtype=np.uint32).tobytes(),
+    }
+
+
+def _gather_ranges(offsets, indices):
+    """Return (positions, owner) covering offsets[i]:offsets[i + 1] for each i in indices"""
+    starts = offsets[indices].astype(np.int64)
+    lengths = offsets[indices + 1].astype(np.int64) - starts
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+    return positions, np.repeat(np.arange(len(indices)), lengths)
+
+
+class FuzzyIndex:
+    """
+    Trigram candidate index over every reference name and synonym.
+
+    The arrays are read straight out of the mapped artifact. A whole ingredient
+    list is matched in a few batches: candidates come from the postings of each
+    query's rarest trigrams only (prefix filtering: an entry that reaches the
+    Dice threshold must share one of them), and the shared-trigram counts of
+    all candidate pairs are then computed together from the forward index.
+    """
+
+    def __init__(self, reference_data):
+        spec = reference_data.header["fuzzy"]
+        self.reference_data = reference_data
+        self.table_names = spec["tables_order"]
+        self.names = reference_data.column(spec["names"])
+        self.keys = np.frombuffer(reference_data.section(spec["keys"]), dtype=np.uint32)
+        self.offsets = np.frombuffer(reference_data.section(spec["offsets"]), dtype=np.uint32)
+        self.postings = np.frombuffer(reference_data.section(spec["postings"]), dtype=np.uint32)
+        self.entry_offsets = np.frombuffer(reference_data.section(spec["entry_offsets"]), dtype=np.uint32)
+        self.entry_keys = np.frombuffer(reference_data.section(spec["entry_keys"]), dtype=np.uint32)
+        self.tables = np.frombuffer(reference_data.section(spec["tables"]), dtype=np.uint8)
+        self.rows = np.frombuffer(reference_data.section(spec["rows"]), dtype=np.uint32)
+        self.sizes = np.diff(self.entry_offsets)
+        self.frequencies = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def _key_indices(self, codes):
+        positions = np.searchsorted(self.keys, codes)
+        positions[positions == len(self.keys)] = 0
+        return positions, self.keys[positions] == codes
+
+    def _candidate_trigrams(self, codes, threshold):
+        """
+        Return (key indices, required hits) for prefix filtering of one query
+
+        Any entry with Dice >= threshold shares at least `required` trigrams with
+        the query, so it shares at least `hits` of the query's
+        len(codes) - required + hits rarest trigrams.
+        """
+        positions, known = self._key_indices(codes)
+        frequency = np.where(known, self.frequencies[positions], 0)
+        required = max(int(np.ceil(threshold * len(codes) / (2 - threshold) - 1e-9)), 1)
+        hits = min(PREFIX_HITS, required)
+        prefix = np.argsort(frequency, kind="stable")[:len(codes) - required + hits]
+        return positions[prefix][known[prefix]], hits
+
+    def match_many(self, names, threshold=None, top_k=None):
+        """
+        Find the closest reference names for every name, FUZZY_MATCH_CHUNK names per vectorized pass
+
+        Args:
+            names (list): Ingredient or component names
+            threshold (float): Minimum Dice similarity of trigram sets, 0 to 1
+            top_k (int): Maximum number of matches returned per name
+
+        Returns:
+            list: For each name, a list of {"name", "table", "row", "score"} dicts, best first
+        """
+        threshold = FUZZY_MATCH_THRESHOLD if threshold is None else threshold
+        top_k = FUZZY_MATCH_TOP_K if top_k is None else top_k
+        query_codes = [trigram_codes(name) if isinstance(name, str) else np.array([], dtype=np.uint32) for name in names]
+        results = []
+        # Fixed-size chunks keep memory bounded however many names come in at once
+        for start in range(0, len(query_codes), FUZZY_MATCH_CHUNK):
+            results += self._match_chunk(query_codes[start:start + FUZZY_MATCH_CHUNK], threshold, top_k)
+        return results
+
+    def _match_chunk(self, query_codes, threshold, top_k):
+        results = [[] for _ in query_codes]
+        if not len(self) or not any(len(codes) for codes in query_codes):
+            return results
+
+        # Candidate (query, entry) pairs from the prefix trigrams of every query
+        prefixes = [self._candidate_trigrams(codes, threshold) if len(codes) else (np.array([], dtype=np.intp), 1) for codes in query_codes]
+        prefix_keys = np.concatenate([keys for keys, _ in prefixes])
+        prefix_owner = np.repeat(np.arange(len(query_codes)), [len(keys) for keys, _ in prefixes])
+        positions, owner = _gather_ranges(self.offsets, prefix_keys)
+        prefix_hits = np.bincount(prefix_owner[owner] * len(self) + self.postings[positions], minlength=len(query_codes) * len(self))
+        is_candidate = prefix_hits.reshape(len(query_codes), len(self)) >= np.array([hits for _, hits in prefixes])[:, None]
+
+        # Dice >= threshold also bounds the entry size relative to the query size
+        query_sizes = np.array([len(codes) for codes in query_codes], dtype=np.float64)
+        is_candidate &= self.sizes[None, :] >= query_sizes[:, None] * threshold / (2 - threshold) - 1e-9
+        is_candidate &= self.sizes[None, :] * threshold <= query_sizes[:, None] * (2 - threshold) + 1e-9
+        pair_query, pair_entry = np.nonzero(is_candidate)
+        if not len(pair_query):
+            return results
+
+        # Count shared trigrams of every candidate pair against its query's set
+        query_members = np.zeros((len(query_codes), len(self.keys)), dtype=bool)
+        for query, codes in enumerate(query_codes):
+            positions, known = self._key_indices(codes)
+            query_members[query, positions[known]] = True
+        positions, owner = _gather_ranges(self.entry_offsets, pair_entry)
+        shared = np.bincount(owner[query_members[pair_query[owner], self.entry_keys[positions]]], minlength=len(pair_query))
+
+        scores = 2 * shared / (query_sizes[pair_query] + self.sizes[pair_entry])
+        keep = scores >= threshold
+        pair_query, pair_entry, scores = pair_query[keep], pair_entry[keep], scores[keep]
+
+        for index in np.lexsort((pair_entry, -scores, pair_query)):
+            query = int(pair_query[index])
+            if len(results[query]) >= top_k:
+                continue
+            entry = int(pair_entry[index])
+            results[query].append({
+                "name": self.names.value(entry),
+                "table": self.table_names[self.tables[entry]],
+                "row": int(self.rows[entry]),
+                "score": round(float(scores[index]), 3),
+            })
+        return results
+
+
+def collect_entries(cleaned_tables, table_order, separator):
+    """Turn cleaned reference columns into (table code, row, name) fuzzy entries"""
+    entries = []
+    for table, columns in FUZZY_SOURCES.items():
+        code = table_order.index(table)
+        for row in range(len(cleaned_tables[table][columns[0]])):
+            seen = set()
+            for column in columns:
+                for name in cleaned_tables[table][column][row].split(separator):
+                    key = normalize_for_matching(name)
+                    if key and key not in seen:
+                        seen.add(key)
+                        entries.append((code, row, name))
+    return entries
@@ -3,77 +3,346 @@ from dotenv import load_dotenv
 import os
 import asyncio
 import aiohttp
-from urllib.parse import quote
+import json
+import random
+import re
+import threading
+
+from cache import CACHE_DIR, DiskCache
+from metrics import get_logger, get_request_id, set_request_id, span
+from providers import get_provider, peek_provider
+from resilience import DeadlineExceeded, bounded, get_breaker
 
 load_dotenv()
 
 GOOGLE_CUSTOM_SEARCH_API_KEY = os.getenv("GOOGLE_CUSTOM_SEARCH_API_KEY_2")
 GOOGLE_CUSTOM_SEARCH_ENGINE_ID = os.getenv("GOOGLE_CUSTOM_SEARCH_ENGINE_ID_2")
+GOOGLE_SEARCH_CACHE_TTL = int(os.getenv("GOOGLE_SEARCH_CACHE_TTL", str(7 * 24 * 60 * 60)))
+GOOGLE_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("GOOGLE_SEARCH_CACHE_MAX_ENTRIES", "50000"))
+# The Custom Search API allows 100 queries per minute by default; with several
+# worker processes give each one its share
+GOOGLE_SEARCH_QPM = float(os.getenv("GOOGLE_SEARCH_QPM", "100"))
+GOOGLE_SEARCH_BURST = int(os.getenv("GOOGLE_SEARCH_BURST", "10"))
+GOOGLE_SEARCH_CONCURRENCY = int(os.getenv("GOOGLE_SEARCH_CONCURRENCY", "4"))
+GOOGLE_SEARCH_MAX_RETRIES = int(os.getenv("GOOGLE_SEARCH_MAX_RETRIES", "3"))
+GOOGLE_SEARCH_TIMEOUT = float(os.getenv("GOOGLE_SEARCH_TIMEOUT", "10"))
+RETRY_BASE_DELAY = 0.5
+
+logger = get_logger("googli")
+
+_non_word_pattern = re.compile(r"[^\w%]+")
+_search_cache = None
+
+
+class SearchError(Exception):
+    pass
+
+
+class RetryableSearchError(SearchError):
+    """Rate limited (429) or server error (5xx) response, worth trying again"""
 
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
-async def search_ingredient(session, ingredient):
+
+class TokenBucket:
+    """
+    Async token bucket: rate tokens are added per second, up to capacity
+
+    Each search takes one token, so bursts of up to capacity go out at once
+    and the long-run rate stays at the quota.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SearchClient:
+    """
+    Custom Search client that lives for the whole process.
+
+    It owns an event loop running in a background thread and one aiohttp
+    session on it, so connections are reused across requests instead of being
+    rebuilt by asyncio.run on every call. Searches from all requests share a
+    concurrency cap and a token bucket sized to the API quota, and rate
+    limited or failed (429/5xx) searches are retried with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, concurrency=GOOGLE_SEARCH_CONCURRENCY, queries_per_minute=GOOGLE_SEARCH_QPM,
+                 burst=GOOGLE_SEARCH_BURST, max_retries=GOOGLE_SEARCH_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(queries_per_minute / 60, burst)
+        self.stats = {"searches": 0, "retries": 0, "failures": 0}
+        self._session = None
+        self._thread = threading.Thread(target=self.loop.run_forever, name="google-search", daemon=True)
+        self._thread.start()
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=GOOGLE_SEARCH_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def _search(self, query, request_id=None):
+        if request_id:
+            set_request_id(request_id)
+        # A search that fails after all its retries counts once against the breaker
+        breaker = get_breaker("search")
+        breaker.before_call()
+        try:
+            results = await self._search_with_retries(query)
+        except DeadlineExceeded:
+            # The request ran out of time, which says nothing about the search API
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return results
+
+    async def _search_with_retries(self, query):
+        session = await self._get_session()
+        for attempt in range(self.max_retries + 1):
+            async with self.semaphore:
+                await self.bucket.acquire()
+                # Never wait past the request's deadline
+                timeout = bounded(GOOGLE_SEARCH_TIMEOUT)
+                self.stats["searches"] += 1
+                try:
+                    with span("google.search"):
+                        return await asyncio.wait_for(fetch_search_results(session, query), timeout)
+                except (RetryableSearchError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        self.stats["failures"] += 1
+                        raise
+                    retry_after = getattr(e, "retry_after", None)
+                    delay = retry_after if retry_after is not None else random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+                    logger.warning(
+                        "Retrying search", query=query, attempt=attempt + 1,
+                        delay_s=round(delay, 2), error=str(e) or type(e).__name__,
+                    )
+                except Exception:
+                    self.stats["failures"] += 1
+                    raise
+            self.stats["retries"] += 1
+            # Back off outside the semaphore so other searches can use the slot
+            await asyncio.sleep(delay)
+
+    async def search(self, query):
+        """Search on the client's loop, whichever loop the caller is running on"""
+        if asyncio.get_running_loop() is self.loop:
+            return await self._search(query)
+        # Carry the caller's request id over to the client's loop so its logs stay attributed
+        coroutine = self._search(query, get_request_id())
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    def run(self, coroutine):
+        """Run a coroutine on the client's loop from synchronous code and return its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def check(self):
+        """Run one real search, raising if the API rejects it"""
+        self.run(self._search("salt"))
+
+    def close(self):
+        if self._session is not None and not self._session.closed:
+            self.run(self._session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def get_search_client():
+    """Return the process-wide search client, starting its loop on first use and after a fork"""
+    return get_provider("search")
+
+
+def get_search_cache():
+    """Return the search result cache shared by all workers"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = DiskCache(
+            os.path.join(CACHE_DIR, "google_search.sqlite3"),
+            ttl=GOOGLE_SEARCH_CACHE_TTL,
+            max_entries=GOOGLE_SEARCH_CACHE_MAX_ENTRIES,
+        )
+    return _search_cache
+
+
+def normalize_query(ingredient):
+    """Cache key form of an ingredient: lower case, punctuation and extra spaces removed"""
+    return " ".join(_non_word_pattern.sub(" ", ingredient.lower()).split())
+
+
+def search_client_stats():
+    """Search, retry and failure counts of this process, or None if it hasn't searched yet"""
+    client = peek_provider("search")
+    return dict(client.stats) if client is not None else None
+
+
+async def fetch_search_results(session, ingredient):
+    """
+    Search for a single ingredient, raising SearchError if the API reports an error
+
+    Quota errors come back as JSON with an "error" member, so they are raised
+    too rather than being mistaken for an empty result.
+    """
+    # Construct the API URL
+    url = f"https://www.googleapis.com/customsearch/v1"
+    params = {
+        "key": GOOGLE_CUSTOM_SEARCH_API_KEY,
+        "cx": GOOGLE_CUSTOM_SEARCH_ENGINE_ID,
+        "q": f"{ingredient} health analysis",
+        "num": 10,
+    }
+
+    async with session.get(url, params=params) as response:
+        try:
+            data = json.loads(await response.text())
+        except ValueError:
+            data = {}
+        if response.status != 200 or "error" in data:
+            error = data.get("error")
+            message = f"HTTP {response.status}: {(error.get('message') if isinstance(error, dict) else None) or 'search failed'}"
+            if response.status == 429 or response.status >= 500:
+                retry_after = response.headers.get("Retry-After")
+                raise RetryableSearchError(message, float(retry_after) if retry_after and retry_after.isdigit() else None)
+            raise SearchError(message)
+
+        # Extract relevant information from search results
+        search_results = []
+        for item in data.get("items", []):
+            search_results.append(
+                {
+                    "title": item.get("title"),
+                    "snippet": item.get("snippet"),
+                    "link": item.get("link"),
+                }
+            )
+
+        return search_results
+
+
+async def search_ingredient(ingredient):
     """
     Perform async search for a single ingredient
     """
     try:
-        # Construct the API URL
-        query = quote(f"{ingredient} health analysis")
-        url = f"https://www.googleapis.com/customsearch/v1"
-        params = {
-            "key": GOOGLE_CUSTOM_SEARCH_API_KEY,
-            "cx": GOOGLE_CUSTOM_SEARCH_ENGINE_ID,
-            "q": f"{ingredient} health analysis",
-            "num": 10,
-        }
-
-        async with session.get(url, params=params) as response:
-            data = await response.json()
-
-            # Extract relevant information from search results
-            search_results = []
-            for item in data.get("items", []):
-                search_results.append(
-                    {
-                        "title": item.get("title"),
-                        "snippet": item.get("snippet"),
-                        "link": item.get("link"),
-                    }
-                )
-
-            return ingredient, search_results
-
+        return ingredient, await get_search_client().search(ingredient)
     except Exception as e:
-        print(f"Error searching for {ingredient}: {str(e)}")
+        logger.error("Search failed", query=ingredient, error=str(e))
         return ingredient, []
 
 
-async def analyze_google(ingredients):
+def _read_cached(queries):
+    """Cached search results of the given normalized queries, skipping misses"""
+    cache = get_search_cache()
+    results_by_query = {}
+    for query in queries:
+        cached = cache.get(f"google:{query}")
+        if cached is not None:
+            results_by_query[query] = cached
+    return results_by_query
+
+
+async def _search_and_cache(client, query):
+    try:
+        search_results = await client.search(query)
+    except Exception as e:
+        logger.error("Search failed", query=query, error=str(e))
+        return []
+    await asyncio.get_running_loop().run_in_executor(None, get_search_cache().set, f"google:{query}", search_results)
+    return search_results
+
+
+async def analyze_google(ingredients, stats=None):
     """
     Asynchronously search for health analysis of each ingredient using Google Custom Search API
 
+    Ingredients are looked up in the shared search cache by their normalized
+    name first, and names that normalize to the same query are searched once.
+    Failed searches are not cached. Cache reads and writes are blocking SQLite
+    calls, so they run in the loop's executor; this coroutine may be running on
+    the search client's loop, which every request shares.
+
     Args:
         ingredients (list): List of ingredient names
+        stats (dict): If given, filled with "requested", "cache_hits", "fetched",
+            "skipped" (while the search circuit breaker is open) and
+            "queries_saved" counts for this call
 
     Returns:
         dict: Dictionary with ingredients as keys and their search results as values
     """
-    async with aiohttp.ClientSession() as session:
-        # Create tasks for all ingredients
-        tasks = [search_ingredient(session, ingredient) for ingredient in ingredients]
+    queries = {ingredient: normalize_query(ingredient) for ingredient in ingredients}
+    results_by_query = await asyncio.get_running_loop().run_in_executor(
+        None, _read_cached, list(dict.fromkeys(queries.values()))
+    )
+    cache_hits = len(results_by_query)
+
+    missing = [query for query in dict.fromkeys(queries.values()) if query not in results_by_query]
+    skipped = []
+    if missing and not get_breaker("search").available():
+        # Search is optional: while it keeps failing, answer from the cache alone
+        logger.warning("Search unavailable, using cached results only", skipped=len(missing))
+        results_by_query.update((query, []) for query in missing)
+        skipped, missing = missing, []
+    if missing:
+        client = get_search_client()
+        # Create tasks for the queries that aren't cached; the client limits how many run at once
+        tasks = [_search_and_cache(client, query) for query in missing]
 
         # Wait for all tasks to complete
-        results = await asyncio.gather(*tasks)
+        results_by_query.update(zip(missing, await asyncio.gather(*tasks)))
 
-        # Convert results to dictionary
-        return dict(results)
+    requested = len(queries)
+    logger.info(
+        "Google search", requested=requested, cache_hits=cache_hits,
+        fetched=len(missing), skipped=len(skipped), queries_saved=requested - len(missing) - len(skipped),
+    )
+    if stats is not None:
+        stats.update({
+            "requested": requested,
+            "cache_hits": cache_hits,
+            "fetched": len(missing),
+            "skipped": len(skipped),
+            "queries_saved": requested - len(missing) - len(skipped),
+        })
+    return {ingredient: results_by_query[query] for ingredient, query in queries.items()}
 
 
 # Helper function to run async code from sync context
-def analyze_google_sync(ingredients):
+def analyze_google_sync(ingredients, stats=None):
     """
-    Synchronous wrapper for analyze_google
+    Synchronous wrapper for analyze_google, run on the search client's long-lived loop
     """
-    return asyncio.run(analyze_google(ingredients))
+    return get_search_client().run(analyze_google(ingredients, stats))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+import contextvars
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageOps
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import get_logger, span
+from resilience import bounded
+
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "8"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "15"))
+# Largest image accepted by width x height, checked from the header before anything is decoded
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+# Formats accepted for uploads; MPO is what many phones write for JPEG photos
+UPLOAD_FORMATS = {"JPEG", "MPO", "PNG", "GIF"}
+
+# Preprocessing applied before images are sent to the extraction model
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "1") != "0"
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_TRIM_BORDERS = os.getenv("IMAGE_TRIM_BORDERS", "0") == "1"
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
+# How far (0-255) a pixel may be from the border colour and still count as border
+BORDER_TOLERANCE = 12
+
+logger = get_logger("images")
+
+_session = None
+_executor = None
+_process_pool = None
+_lock = threading.Lock()
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def get_image_session():
+    """Return the shared session whose keep-alive connections are reused across downloads"""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=IMAGE_DOWNLOAD_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS, thread_name_prefix="image-download")
+    return _executor
+
+
+def fetch_image_bytes(image_url, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """
+    Download one image, enforcing a size limit and a deadline for the whole transfer
+
+    Raises:
+        ImageTooLarge: If the body is larger than max_bytes
+        requests.RequestException: On HTTP errors, timeouts and connection failures
+        DeadlineExceeded: If the request's time budget is already spent
+    """
+    timeout = bounded(timeout)
+    deadline = time.monotonic() + timeout
+    with span("image.download"), get_image_session().get(image_url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ImageTooLarge(f"{length} bytes exceeds the {max_bytes} byte limit")
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            if len(body) > max_bytes:
+                raise ImageTooLarge(f"More than {max_bytes} bytes")
+            if time.monotonic() > deadline:
+                raise requests.Timeout(f"Download took longer than {timeout:g}s")
+    return bytes(body)
+
+
+def decode_image(data):
+    """Decode image bytes into a fully loaded PIL image"""
+    image = PIL.Image.open(BytesIO(data))
+    image.load()
+    return image
+
+
+def fetch_image(image_url, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """Download and decode one image, returning None if either step fails"""
+    try:
+        return decode_image(fetch_image_bytes(image_url, max_bytes, timeout))
+    except Exception as e:
+        logger.error("Error opening image", url=image_url, error=str(e))
+        return None
+
+
+def _get_process_pool():
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # Forking a server with live request threads can copy held locks into the child
+            _process_pool = ProcessPoolExecutor(
+                max_workers=IMAGE_PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _process_pool
+
+
+def _trim_borders(image, tolerance=BORDER_TOLERANCE):
+    background = PIL.Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    difference = PIL.ImageChops.difference(image, background).convert("L")
+    box = difference.point(lambda value: 255 if value > tolerance else 0).getbbox()
+    if box and box != (0, 0) + image.size:
+        return image.crop(box)
+    return image
+
+
+def preprocess_image(data, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY, trim_borders=IMAGE_TRIM_BORDERS):
+    """
+    Normalize an encoded image for the extraction model
+
+    Applies the EXIF orientation, flattens transparency onto white, optionally
+    trims a uniform border, shrinks the long edge to max_edge and re-encodes
+    as JPEG. Runs in the preprocessing process pool, so it takes and returns bytes.
+
+    Returns:
+        bytes: JPEG data
+    """
+    image = PIL.Image.open(BytesIO(data))
+    if max_edge:
+        # Let the JPEG decoder skip detail that the resize would throw away
+        image.draft("RGB", (max_edge, max_edge))
+    image = PIL.ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        flattened = PIL.Image.new("RGB", image.size, (255, 255, 255))
+        flattened.paste(image, mask=image.getchannel("A"))
+        image = flattened
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    if trim_borders:
+        image = _trim_borders(image)
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), PIL.Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def image_part(data):
+    """
+    Wrap encoded image bytes as a content part for the Gemini SDK
+
+    Passing bytes avoids the SDK re-encoding PIL images as lossless WebP.
+    """
+    mime_type = PIL.Image.open(BytesIO(data)).get_format_mimetype()
+    return {"mime_type": mime_type, "data": data}
+
+
+def prepare_image(data):
+    """Preprocess image bytes (in the process pool when enabled) and return a Gemini content part"""
+    if IMAGE_PREPROCESS:
+        try:
+            with span("image.preprocess"):
+                data = _get_process_pool().submit(preprocess_image, data).result()
+        except Exception as e:
+            logger.error("Error preprocessing image, sending it unchanged", error=str(e))
+    return image_part(data)
+
+
+def validate_image(data, max_bytes=IMAGE_MAX_BYTES, max_pixels=IMAGE_MAX_PIXELS):
+    """
+    Check an uploaded image's size, format and dimensions without decoding its pixels
+
+    Raises:
+        ImageTooLarge: If it has more than max_bytes bytes or max_pixels pixels
+        InvalidImage: If it isn't an image in one of UPLOAD_FORMATS
+    """
+    if len(data) > max_bytes:
+        raise ImageTooLarge(f"{len(data)} bytes exceeds the {max_bytes} byte limit")
+    try:
+        # Only the header is read here; pixels are decoded later, in draft mode where possible
+        image = PIL.Image.open(BytesIO(data))
+    except (PIL.Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage("Not a readable image") from e
+    if image.format not in UPLOAD_FORMATS:
+        raise InvalidImage(f"Unsupported image format {image.format}")
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"{width}x{height} pixels exceeds the {max_pixels} pixel limit")
+
+
+def prepare_image_file(image_path):
+    """Read and check an image file and return it as a preprocessed Gemini content part"""
+    with open(image_path, "rb") as image_file:
+        data = image_file.read()
+    validate_image(data)
+    return prepare_image(data)
+
+
+def prepare_upload(upload):
+    """
+    Preprocess an uploaded image given as bytes or as a file path
+
+    Bytes are expected to have passed validate_image already, as they do in
+    the API, and are used as they are without being copied to disk.
+    """
+    return prepare_image(upload) if isinstance(upload, bytes) else prepare_image_file(upload)
+
+
+def prepare_uploads(uploads):
+    """
+    Preprocess several uploaded images of one product concurrently
+
+    Returns:
+        list: Gemini content parts in the order of uploads
+    """
+    if len(uploads) == 1:
+        return [prepare_upload(uploads[0])]
+    started = time.perf_counter()
+    executor = _get_executor()
+    futures = [executor.submit(contextvars.copy_context().run, prepare_upload, upload) for upload in uploads]
+    parts = [future.result() for future in futures]
+    logger.info("Prepared uploads", images=len(parts), seconds=round(time.perf_counter() - started, 2))
+    return parts
+
+
+def _fetch_and_prepare(image_url, max_bytes, timeout):
+    try:
+        return prepare_image(fetch_image_bytes(image_url, max_bytes, timeout))
+    except Exception as e:
+        logger.error("Error preparing image", url=image_url, error=str(e))
+        return None
+
+
+def _run_concurrently(image_urls, worker, max_bytes, timeout):
+    unique_urls = list(dict.fromkeys(url for url in image_urls if isinstance(url, str) and url))
+    if not unique_urls:
+        return []
+    started = time.perf_counter()
+    executor = _get_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, worker, url, max_bytes, timeout) for url in unique_urls
+    ]
+    results = [future.result() for future in futures]
+    results = [result for result in results if result is not None]
+    logger.info(
+        "Downloaded images", downloaded=len(results), requested=len(unique_urls),
+        seconds=round(time.perf_counter() - started, 2),
+    )
+    return results
+
+
+def download_images(image_urls, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """
+    Download and decode images concurrently
+
+    Duplicate URLs are fetched once. Download and decoding both happen in the
+    worker threads, so the whole batch takes about as long as the slowest image.
+
+    Returns:
+        list: PIL images in the order of their first URL, skipping failed ones
+    """
+    return _run_concurrently(image_urls, fetch_image, max_bytes, timeout)
+
+
+def download_image_parts(image_urls, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """
+    Download images concurrently and preprocess them for the extraction model
+
+    Returns:
+        list: Gemini content parts in the order of their first URL, skipping failed ones
+    """
+    return _run_concurrently(image_urls, _fetch_and_prepare, max_bytes, timeout)
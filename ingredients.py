@@ -0,0 +1,257 @@
+import re
+
+from refdata import load_reference_data
+
+_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_CLOSERS = set(_OPENERS.values())
+
+# Words that mark a functional class ("EMULSIFIERS (472(e), 489 & 435)") rather
+# than an ingredient with sub-ingredients ("FRUIT PRODUCTS [...]")
+_CLASS_WORDS = [
+    "ACIDITY REGULATOR", "ACIDIFIER", "ACIDULANT", "ANTICAKING AGENT", "ANTI-CAKING AGENT",
+    "ANTIFOAMING AGENT", "ANTIOXIDANT", "BLEACHING AGENT", "CARRIER", "COLOR", "COLOUR",
+    "EMULSIFIER", "EMULSIFYING AGENT", "FIRMING AGENT", "FLAVOR", "FLAVOUR", "FLOUR TREATMENT AGENT",
+    "GELLING AGENT", "GLAZING AGENT", "HUMECTANT", "IMPROVER", "LEAVENING AGENT", "PRESERVATIVE",
+    "RAISING AGENT", "SEQUESTRANT", "STABILISER", "STABILIZER", "SWEETENER", "THICKENER",
+]
+_class_pattern = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in _CLASS_WORDS) + r")S?\b")
+
+# INS / E numbers: "330", "E330", "INS 330", "472e", "160a(ii)", "450(i)"
+_ins_pattern = re.compile(r"^(?:E|INS)?[\s\-]?(\d{3,4})\s*([a-f])?\s*(?:\(\s*([ivx]+)\s*\))?$", re.IGNORECASE)
+_ins_suffix_pattern = re.compile(r"^(?:[a-f]|[ivx]+)$", re.IGNORECASE)
+_percentage_pattern = re.compile(r"(\d+(?:[.,]\d+)?)\s*%")
+_statement_pattern = re.compile(r"^CONTAINS\b|\bMAY (?:CONTAIN|HAVE)\b|^ALLERG(?:EN|Y)\b", re.IGNORECASE)
+_contains_prefix_pattern = re.compile(r"^(?:CONTAINS\s+)?(?:PERMITTED\s+)?", re.IGNORECASE)
+_and_pattern = re.compile(r"\s(?:AND)\s", re.IGNORECASE)
+
+_ins_table = None
+
+
+def _parse_sequence(text, position, closer):
+    """
+    Split text into top-level items until closer, recursing into brackets.
+
+    Each item is (text outside brackets, [bracketed sub-sequences]). Unbalanced
+    closing brackets end the current sequence instead of raising, since label
+    text from OCR is often not well formed.
+    """
+    items = []
+    chunks = []
+    groups = []
+
+    def flush():
+        if "".join(chunks).strip() or groups:
+            items.append(("".join(chunks), list(groups)))
+        chunks.clear()
+        groups.clear()
+
+    while position < len(text):
+        char = text[position]
+        if char in _OPENERS:
+            group, position = _parse_sequence(text, position + 1, _OPENERS[char])
+            groups.append(group)
+            continue
+        if char == closer or char in _CLOSERS:
+            position += 1
+            break
+        if char in ",;&":
+            flush()
+            position += 1
+            continue
+        separator = _and_pattern.match(text, position - 1) if position else None
+        if separator and not "".join(chunks).rstrip().endswith("-"):
+            flush()
+            position = separator.end()
+            continue
+        chunks.append(char)
+        position += 1
+
+    flush()
+    return items, position
+
+
+def normalize_ins_code(text):
+    """Return the canonical INS code for text ("E-472 e" -> "472e"), or None"""
+    match = _ins_pattern.match(text.strip())
+    if not match:
+        return None
+    number, letter, roman = match.groups()
+    code = number + (letter or "").lower()
+    if roman:
+        code += f"({roman.lower()})"
+    return code
+
+
+def get_ins_table():
+    """Return a dict of INS code -> substance details from the reference artifact"""
+    global _ins_table
+    reference_data = load_reference_data()
+    if _ins_table is None or _ins_table[0] is not reference_data:
+        table = reference_data["ins"]
+        codes = table["INS No."].values()
+        names = table["Name"].values()
+        cas_numbers = table["CAS No."].values()
+        classes = table["Functional class"].values()
+        entries = {}
+        for code, name, cas_number, functional_class in zip(codes, names, cas_numbers, classes):
+            entries[normalize_ins_code(code)] = {
+                "substance": name,
+                "cas": cas_number or None,
+                "functional_class": functional_class,
+            }
+        _ins_table = (reference_data, entries)
+    return _ins_table[1]
+
+
+def resolve_ins_code(code, ins_table=None):
+    """
+    Resolve a canonical INS code to its substance.
+
+    Falls back from the exact code to its parent ("471(i)" -> "471") and to the
+    first sub-entry ("322" -> "322(i)"), matching how labels abbreviate codes.
+    """
+    ins_table = ins_table if ins_table is not None else get_ins_table()
+    base = code.split("(")[0]
+    number = base.rstrip("abcdef")
+    for candidate in (code, base, number, base + "(i)", number + "(i)"):
+        if candidate in ins_table:
+            return dict(ins_table[candidate], ins=candidate)
+    return None
+
+
+def _clean_name(text):
+    return " ".join(text.replace("*", " ").split()).strip(" .:-")
+
+
+def _build_node(text, groups, ins_table, parent_is_class=False):
+    name = _clean_name(text)
+    node = {
+        "name": name,
+        "kind": "ingredient",
+        "percentage": None,
+        "children": [],
+    }
+
+    percentage = _percentage_pattern.search(name)
+    if percentage:
+        node["percentage"] = float(percentage.group(1).replace(",", "."))
+        name = _clean_name(_percentage_pattern.sub(" ", name))
+
+    groups = list(groups)
+    code = normalize_ins_code(name) if name else None
+    # "472(e)" parses as "472" followed by the group "(e)"
+    if code and groups and len(groups[0]) == 1 and not groups[0][0][1]:
+        suffix = _clean_name(groups[0][0][0])
+        if _ins_suffix_pattern.match(suffix):
+            name = f"{name}({suffix})"
+            code = normalize_ins_code(name.replace(f"({suffix})", suffix) if suffix.lower() in "abcdef" else name)
+            groups.pop(0)
+
+    children = []
+    for group in groups:
+        if len(group) == 1 and not group[0][1] and _percentage_pattern.fullmatch(_clean_name(group[0][0])):
+            node["percentage"] = float(_percentage_pattern.fullmatch(_clean_name(group[0][0])).group(1).replace(",", "."))
+            continue
+        children.extend(group)
+
+    if code and (parent_is_class or not children):
+        node["name"] = name
+        node["kind"] = "additive"
+        node["ins"] = code
+        resolved = resolve_ins_code(code, ins_table)
+        if resolved:
+            node.update(resolved)
+        return node
+
+    name = _contains_prefix_pattern.sub("", name) if children else name
+    is_class = bool(_class_pattern.search(name.upper()))
+    child_nodes = [
+        _build_node(child_text, child_groups, ins_table, parent_is_class=is_class)
+        for child_text, child_groups in children
+    ]
+    child_nodes = [child for child in child_nodes if child["name"] or child["children"]]
+    if any(child["kind"] == "additive" for child in child_nodes):
+        is_class = True
+
+    node["name"] = name
+    if is_class:
+        node["kind"] = "class"
+        node["children"] = child_nodes
+    elif len(child_nodes) == 1 and child_nodes[0]["kind"] == "ingredient" and not child_nodes[0]["children"]:
+        # "REFINED WHEAT FLOUR (MAIDA)" names the same thing twice
+        node["aliases"] = [child_nodes[0]["name"]]
+    else:
+        node["children"] = child_nodes
+    return node
+
+
+def parse_ingredient(text, ins_table=None):
+    """
+    Parse one extracted ingredient string into a tree of components
+
+    Args:
+        text (str): Ingredient as extracted, e.g. "EMULSIFIERS (472(e), 489 & 435)"
+
+    Returns:
+        dict: Node with "name", "kind" ("ingredient", "class", "additive" or
+        "statement"), "percentage", "children" and, for additives, the resolved
+        "ins", "substance", "cas" and "functional_class"
+    """
+    ins_table = ins_table if ins_table is not None else get_ins_table()
+    text = text if isinstance(text, str) else ""
+    if _statement_pattern.search(text) and not any(opener in text for opener in _OPENERS):
+        return {"name": _clean_name(text), "kind": "statement", "percentage": None, "children": [], "text": text}
+
+    items, _ = _parse_sequence(text, 0, None)
+    if len(items) == 1:
+        node = _build_node(items[0][0], items[0][1], ins_table)
+    else:
+        # Several top-level components in one string: "OIL AND PALM OLEIN OIL"
+        node = {
+            "name": _clean_name(text),
+            "kind": "ingredient",
+            "percentage": None,
+            "children": [_build_node(item_text, groups, ins_table) for item_text, groups in items],
+        }
+    node["text"] = text
+    return node
+
+
+def parse_ingredients(ingredients):
+    """Parse a whole extracted ingredient list"""
+    ins_table = get_ins_table()
+    return [parse_ingredient(ingredient, ins_table) for ingredient in ingredients]
+
+
+def iter_components(node):
+    """Yield the leaf components of a parsed ingredient"""
+    if node["kind"] == "statement":
+        return
+    if node["kind"] == "class" and not any(child["kind"] == "additive" for child in node["children"]):
+        # "ADDED FLAVOURS [NATURE IDENTICAL AND ARTIFICIAL]" only qualifies the class
+        yield node
+        return
+    if not node["children"]:
+        yield node
+        return
+    for child in node["children"]:
+        yield from iter_components(child)
+
+
+def search_terms(parsed_ingredients):
+    """
+    Return the deduplicated component names that still need a web search
+
+    Additives resolved through the INS table are answered locally and skipped.
+    """
+    terms = []
+    seen = set()
+    for node in parsed_ingredients:
+        for component in iter_components(node):
+            if component["kind"] == "additive" and "substance" in component:
+                continue
+            term = component["name"]
+            if term and term.lower() not in seen:
+                seen.add(term.lower())
+                terms.append(term)
+    return terms
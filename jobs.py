@@ -0,0 +1,345 @@
+"""
+Durable local job queue for analyses.
+
+The API enqueues jobs in a SQLite file and returns right away; worker
+processes started with `python jobs.py worker` claim and run them.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from blinkit import extract_product_id
+from metrics import get_logger, set_request_id
+
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.sqlite3")
+JOB_UPLOAD_DIR = os.path.join(JOBS_DIR, "uploads")
+# Queued plus running jobs accepted before submissions are refused
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "500"))
+# A submission matching a job finished this many seconds ago returns that job
+JOB_DEDUPE_WINDOW = int(os.getenv("JOB_DEDUPE_WINDOW", str(60 * 60)))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(7 * 24 * 60 * 60)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+# A running job whose worker hasn't checked in for this long is requeued
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "600"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+HEARTBEAT_INTERVAL = 15
+POLL_INTERVAL = 0.5
+
+logger = get_logger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+def url_dedupe_key(url):
+    """Jobs for the same Blinkit product share a key, whatever the URL spelling"""
+    product_id = extract_product_id(url)
+    return f"blinkit:{product_id}" if product_id else f"url:{url.strip()}"
+
+
+def image_dedupe_key(data):
+    return "image:" + hashlib.sha256(data).hexdigest()
+
+
+class JobQueue:
+    """
+    Jobs table in a SQLite file shared by the API and worker processes.
+
+    Claims happen inside an IMMEDIATE transaction, so two workers never take
+    the same job. Running jobs carry a heartbeat; if a worker dies, its job
+    goes back to the queue once the heartbeat is stale, up to JOB_MAX_ATTEMPTS
+    attempts.
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, source TEXT NOT NULL, dedupe_key TEXT, "
+                "status TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key, created_at)")
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _transaction(self):
+        connection = self._connection()
+        return _Transaction(connection)
+
+    def submit(self, kind, source, dedupe_key=None):
+        """
+        Queue a job, or return the matching job if an identical one is pending or recently finished
+
+        Returns:
+            tuple: (job dict, True if a new job was created)
+
+        Raises:
+            QueueFull: If JOB_QUEUE_MAX_DEPTH jobs are already queued or running
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            if dedupe_key:
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE dedupe_key = ? AND (status IN (?, ?) OR "
+                    "(status = ? AND finished_at >= ?)) ORDER BY created_at DESC LIMIT 1",
+                    (dedupe_key, QUEUED, RUNNING, SUCCEEDED, now - JOB_DEDUPE_WINDOW),
+                ).fetchone()
+                if row is not None:
+                    return self._job(connection, row), False
+            depth = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+            if depth >= JOB_QUEUE_MAX_DEPTH:
+                raise QueueFull(f"{depth} jobs are already waiting")
+            job_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO jobs (id, kind, source, dedupe_key, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, source, dedupe_key, QUEUED, now),
+            )
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._job(connection, row), True
+
+    def _job(self, connection, row):
+        job = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["status"] == QUEUED:
+            job["position"] = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, row["created_at"])
+            ).fetchone()[0]
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if unknown"""
+        connection = self._connection()
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(connection, row) if row is not None else None
+
+    def claim(self):
+        """Take the oldest queued job and mark it running, or return None if the queue is empty"""
+        now = time.time()
+        with self._transaction() as connection:
+            self._requeue_stale(connection, now)
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (RUNNING, now, now, row["id"]),
+            )
+            return {"id": row["id"], "kind": row["kind"], "source": row["source"]}
+
+    def _requeue_stale(self, connection, now):
+        stale = now - JOB_STALE_AFTER
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = 'Worker stopped responding', finished_at = ? "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, now, RUNNING, stale, JOB_MAX_ATTEMPTS),
+        )
+        connection.execute(
+            "UPDATE jobs SET status = ? WHERE status = ? AND heartbeat_at < ?", (QUEUED, RUNNING, stale)
+        )
+
+    def heartbeat(self, job_id):
+        with self._transaction() as connection:
+            connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?", (time.time(), job_id, RUNNING))
+
+    def finish(self, job_id, result=None, error=None):
+        """Store the outcome of a running job"""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    FAILED if error is not None else SUCCEEDED,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def purge_finished(self, older_than=JOB_RETENTION):
+        """Delete finished jobs older than older_than seconds, and uploads no other job needs"""
+        cutoff = time.time() - older_than
+        with self._transaction() as connection:
+            uploads = [row[0] for row in connection.execute(
+                "SELECT DISTINCT source FROM jobs WHERE kind = 'image' AND status IN (?, ?) AND finished_at < ?",
+                (SUCCEEDED, FAILED, cutoff),
+            )]
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (SUCCEEDED, FAILED, cutoff)
+            )
+            uploads = [
+                path for path in uploads
+                if connection.execute("SELECT 1 FROM jobs WHERE source = ? LIMIT 1", (path,)).fetchone() is None
+            ]
+        for path in uploads:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        for status, count in self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        counts["max_depth"] = JOB_QUEUE_MAX_DEPTH
+        return counts
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a with block"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+
+def submit_url(url):
+    return get_job_queue().submit("url", url, url_dedupe_key(url))
+
+
+def submit_image(data, extension):
+    """Store an uploaded image under JOB_UPLOAD_DIR and queue its analysis"""
+    dedupe_key = image_dedupe_key(data)
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(JOB_UPLOAD_DIR, f"{dedupe_key.split(':', 1)[1]}.{extension}")
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as upload:
+            upload.write(data)
+        os.replace(path + ".tmp", path)
+    return get_job_queue().submit("image", path, dedupe_key)
+
+
+def run_job(job):
+    from analyze import run_analysis
+
+    return run_analysis(job["source"], is_url=job["kind"] == "url")
+
+
+def work(stop=None):
+    """Claim and run jobs until stop is set"""
+    from providers import warm_providers
+
+    queue = get_job_queue()
+    queue.purge_finished()
+    warm_providers()
+    logger.info("Job worker started", pid=os.getpid())
+    while stop is None or not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        # Logs and spans of the analysis carry the job id
+        set_request_id(job["id"])
+        logger.info("Running job", kind=job["kind"], source=job["source"])
+        done = threading.Event()
+
+        def beat(job_id=job["id"], done=done):
+            while not done.wait(HEARTBEAT_INTERVAL):
+                queue.heartbeat(job_id)
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            result = run_job(job)
+            if result.get("success"):
+                queue.finish(job["id"], result=result)
+            else:
+                queue.finish(job["id"], error=result.get("error") or "Analysis failed")
+        except Exception as e:
+            queue.finish(job["id"], error=str(e))
+        finally:
+            done.set()
+        logger.info("Job finished")
+
+
+def run_workers(processes=JOB_WORKERS):
+    """Run a pool of worker processes until interrupted"""
+    workers = [multiprocessing.Process(target=work, name=f"job-worker-{i}") for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        while True:
+            for i, worker in enumerate(workers):
+                if not worker.is_alive():
+                    logger.warning("Job worker exited, restarting", pid=worker.pid, exitcode=worker.exitcode)
+                    workers[i] = multiprocessing.Process(target=work, name=worker.name)
+                    workers[i].start()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analysis job queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Run worker processes that drain the queue")
+    worker_parser.add_argument("--processes", type=int, default=JOB_WORKERS)
+    subparsers.add_parser("stats", help="Print job counts by status")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_workers(args.processes)
+    else:
+        print(json.dumps(get_job_queue().stats(), indent=2))
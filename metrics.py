@@ -0,0 +1,317 @@
+"""
+Request ids, structured logging, timing spans and Prometheus-style metrics.
+
+Every span records its duration in a latency histogram, counts errors and
+tracks how many are in flight, and logs one structured line carrying the
+current request id. render_metrics() produces the text exposition format
+served on /metrics; each worker process exports its own counters.
+"""
+import asyncio
+import bisect
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "json" for one JSON object per line, "text" for human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Requests sending "X-Profile: 1" are profiled only when this is enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_profiles = contextvars.ContextVar("profiles", default=None)
+_profiler_lock = threading.Lock()
+_unsafe_file_name_pattern = re.compile(r"[^A-Za-z0-9_-]")
+_logging_configured = False
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(request_id=None):
+    """Set the request id of the current context, generating one if not given"""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    return request_id
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None) or get_request_id()
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        request_id = getattr(record, "request_id", None) or get_request_id()
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{record.levelname[0]} {record.name}"
+        if request_id:
+            line += f" [{request_id}]"
+        line += f" {record.getMessage()}"
+        if fields:
+            line += f" {fields}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Send the app's loggers to stderr in LOG_FORMAT; safe to call more than once"""
+    global _logging_configured
+    if _logging_configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+    logger = logging.getLogger("foodlabel")
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    _logging_configured = True
+
+
+class _Logger:
+    """Thin wrapper so call sites can pass structured fields as keyword arguments"""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"foodlabel.{name}")
+
+    def _log(self, level, message, exc_info, fields):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, message, **fields):
+        self._log(logging.DEBUG, message, None, fields)
+
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, None, fields)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, None, fields)
+
+    def error(self, message, exc_info=None, **fields):
+        self._log(logging.ERROR, message, exc_info, fields)
+
+
+def get_logger(name):
+    configure_logging()
+    return _Logger(name)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+SPAN_SECONDS = _register(Histogram("foodlabel_span_seconds", "Duration of pipeline stages and external calls"))
+SPAN_ERRORS = _register(Counter("foodlabel_span_errors_total", "Pipeline stages and external calls that raised"))
+SPAN_IN_FLIGHT = _register(Gauge("foodlabel_span_in_flight", "Pipeline stages and external calls currently running"))
+HTTP_SECONDS = _register(Histogram("foodlabel_http_request_seconds", "Time to produce an HTTP response"))
+HTTP_REQUESTS = _register(Counter("foodlabel_http_requests_total", "HTTP responses by route and status"))
+HTTP_IN_FLIGHT = _register(Gauge("foodlabel_http_requests_in_flight", "HTTP requests being handled"))
+PROMPT_TOKENS = _register(Histogram(
+    "foodlabel_analysis_prompt_tokens", "Estimated tokens of the analysis prompt's product data", TOKEN_BUCKETS
+))
+BREAKER_OPEN = _register(Gauge("foodlabel_circuit_open", "1 while a provider's circuit breaker is open"))
+HEDGED_CALLS = _register(Counter("foodlabel_hedged_calls_total", "Provider calls that started a hedged second attempt"))
+CACHE_LOOKUPS = _register(Counter("foodlabel_cache_lookups_total", "Disk cache reads by key namespace and result"))
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_span_logger = None
+
+
+@contextmanager
+def span(name, kind="call", **fields):
+    """
+    Time a block, recording it in the span metrics and logging it
+
+    kind separates pipeline stages ("stage") from external calls ("call").
+    """
+    global _span_logger
+    if _span_logger is None:
+        _span_logger = get_logger("span")
+    SPAN_IN_FLIGHT.inc(span=name, kind=kind)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        # Cancelled because a sibling stage failed; not an error of this span
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        SPAN_ERRORS.inc(span=name, kind=kind)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_IN_FLIGHT.dec(span=name, kind=kind)
+        SPAN_SECONDS.observe(elapsed, span=name, kind=kind)
+        _span_logger.info("span", span=name, kind=kind, status=status, duration_ms=round(elapsed * 1000, 1), **fields)
+
+
+def start_profiling():
+    """Collect CPU profiles of the local work done for the current request"""
+    _profiles.set([])
+
+
+def _start_profiler():
+    # Python 3.12+ allows one active profiler per process, so concurrent stages take turns
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception as e:
+        _profiler_lock.release()
+        get_logger("metrics").debug("Could not start the profiler", error=str(e))
+        return None
+    return profiler
+
+
+def profiled(func, *args, **kwargs):
+    """
+    Call func, under cProfile if the current request is being profiled
+
+    Only one call is profiled at a time; calls made while another one is
+    profiled, or when the profiler can't start, run unprofiled, so
+    profiling never fails a stage.
+    """
+    profiles = _profiles.get()
+    profiler = _start_profiler() if profiles is not None else None
+    if profiler is None:
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _profiler_lock.release()
+        profiles.append(profiler)
+
+
+def finish_profiling(name):
+    """Write the collected profiles as one pstats file and return its path, or None"""
+    profiles = _profiles.get()
+    _profiles.set(None)
+    if not profiles:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    # name may come from a client header; keep it to a plain file name inside PROFILE_DIR
+    name = _unsafe_file_name_pattern.sub("_", str(name))[:64] or uuid.uuid4().hex[:16]
+    path = os.path.join(PROFILE_DIR, f"{name}.prof")
+    stats = pstats.Stats(profiles[0])
+    for profiler in profiles[1:]:
+        stats.add(profiler)
+    stats.dump_stats(path)
+    return path
@@ -0,0 +1,280 @@
+"""
+Exact nutrition numbers for an extracted nutritional label.
+
+Label rows are matched to nutrients through a lookup table built once from
+the names and alternate names in daily_values.py. Amounts like "26.5 g",
+"1695 kJ / 405 kcal" or "<0.5mg" are converted to the nutrient's daily
+value unit, and the percentages of the daily values and the split of energy
+between carbohydrate, protein and fat are computed with numpy over the
+whole label at once.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from daily_values import fda_daily_values
+
+# Label rows that aren't in daily_values.py; amounts without a daily value still get converted
+EXTRA_NUTRIENTS = [
+    {"name": "Energy", "alternate_names": ["Calories", "Energy value", "Calorific value"], "daily_value": "2000kcal"},
+    {"name": "Total sugars", "alternate_names": ["Sugars", "Sugar", "Of which sugars"], "daily_value": "0g"},
+    {"name": "Trans fat", "alternate_names": ["Trans fatty acids", "Trans fats", "Trans-fat"], "daily_value": "0g"},
+    {"name": "Monounsaturated fat", "alternate_names": ["Mono unsaturated fatty acids", "MUFA"], "daily_value": "0g"},
+    {"name": "Polyunsaturated fat", "alternate_names": ["Poly unsaturated fatty acids", "PUFA"], "daily_value": "0g"},
+]
+# Aliases of daily_values.py that are a different quantity on real labels: (nutrient, amount factor)
+ALIAS_OVERRIDES = {
+    # "Sugars" on a label is total sugars, not the added sugars the daily value is for
+    "sugars": ("Total sugars", 1.0),
+    "sugar": ("Total sugars", 1.0),
+    # Salt is about 40% sodium by mass
+    "salt": ("Sodium", 0.4),
+}
+# kcal per gram of each energy-providing macronutrient
+MACRONUTRIENT_ENERGY = {"Total carbohydrate": 4.0, "Protein": 4.0, "Fat": 9.0}
+
+# unit -> (dimension, amount in the dimension's base unit: mg for mass, kcal for energy)
+UNITS = {
+    "g": ("mass", 1000.0),
+    "gm": ("mass", 1000.0),
+    "mg": ("mass", 1.0),
+    "mcg": ("mass", 0.001),
+    "µg": ("mass", 0.001),
+    "ug": ("mass", 0.001),
+    "kcal": ("energy", 1.0),
+    "cal": ("energy", 1.0),
+    "kj": ("energy", 1 / 4.184),
+}
+
+_separator_pattern = re.compile(r"[^0-9a-zµ]+")
+_amount_pattern = re.compile(r"(\d+(?:[.,]\d+)*)\s*(kcal|kj|mcg|µg|ug|mg|gm|g|cal)?(?![a-z])", re.IGNORECASE)
+_zero_pattern = re.compile(r"^\s*(nil|none|trace|traces|n/?a|-)\s*$", re.IGNORECASE)
+# Unit given in a row name, e.g. "Energy (kJ)", "Salt (g)" or "Sodium mg"
+_row_unit_pattern = re.compile(
+    r"\(\s*(kcal|kj|mcg|µg|ug|mg|gm|g|cal)\s*\)|[\s_-](kcal|kj|mcg|µg|ug|mg|gm|g|cal)\s*$", re.IGNORECASE
+)
+_per_100_pattern = re.compile(r"100\s*(g|ml)", re.IGNORECASE)
+_column_pattern = re.compile(r"per|serv|portion|100|%|rda|gda", re.IGNORECASE)
+# Words around a row name that don't change which nutrient it is
+_prefixes = ("of which ", "total ", "dietary ")
+_suffixes = (" g", " mg", " mcg", " kcal", " kj", " content")
+
+
+def normalize_nutrient_name(name):
+    name = _separator_pattern.sub(" ", str(name).lower()).strip()
+    return name.replace("fibre", "fiber")
+
+
+def _to_float(number):
+    # "1,200" is a thousands separator, "0,5" a decimal comma
+    if "," in number and "." not in number and not re.fullmatch(r"\d{1,3}(,\d{3})+", number):
+        return float(number.replace(",", "."))
+    return float(number.replace(",", ""))
+
+
+def parse_amount(value):
+    """
+    Return (amount in base units, dimension) for a label value, or None
+
+    Numbers without a unit return dimension None. Energy given in both kJ
+    and kcal uses the kcal figure.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value), None
+    if not isinstance(value, str):
+        return None
+    return _parse_text_amount(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_text_amount(value):
+    if _zero_pattern.match(value):
+        return 0.0, None
+    matches = _amount_pattern.findall(value)
+    if not matches:
+        return None
+    units = [unit.lower() for _, unit in matches]
+    number, unit = matches[units.index("kcal")] if "kcal" in units else matches[0]
+    number = _to_float(number)
+    if not unit:
+        return number, None
+    dimension, factor = UNITS[unit.lower()]
+    return number * factor, dimension
+
+
+def row_unit(name):
+    """Unit named in a label row's name, lower-cased, or None"""
+    match = _row_unit_pattern.search(str(name))
+    return (match.group(1) or match.group(2)).lower() if match else None
+
+
+def _build_tables():
+    nutrients = []
+    aliases = {}
+    for nutrient in fda_daily_values["nutrients"] + EXTRA_NUTRIENTS:
+        amount = parse_amount(nutrient["daily_value"])
+        unit = _amount_pattern.search(nutrient["daily_value"]).group(2).lower()
+        nutrients.append({
+            "name": nutrient["name"],
+            "unit": unit,
+            "dimension": amount[1],
+            "daily_value": amount[0] if amount[0] else np.nan,
+        })
+        for alias in [nutrient["name"]] + nutrient["alternate_names"]:
+            aliases.setdefault(normalize_nutrient_name(alias), (len(nutrients) - 1, 1.0))
+    names = [nutrient["name"] for nutrient in nutrients]
+    for alias, (name, factor) in ALIAS_OVERRIDES.items():
+        aliases[alias] = (names.index(name), factor)
+    return nutrients, aliases
+
+
+NUTRIENTS, ALIASES = _build_tables()
+DAILY_VALUES = np.array([nutrient["daily_value"] for nutrient in NUTRIENTS])
+UNIT_FACTORS = np.array([UNITS[nutrient["unit"]][1] for nutrient in NUTRIENTS])
+_nutrient_index = {nutrient["name"]: index for index, nutrient in enumerate(NUTRIENTS)}
+_macronutrients = np.array([_nutrient_index[name] for name in MACRONUTRIENT_ENERGY])
+_macronutrient_energy = np.array(list(MACRONUTRIENT_ENERGY.values()))
+
+
+@lru_cache(maxsize=4096)
+def find_nutrient(name):
+    """Return (nutrient index, amount factor) for a label row name, or None"""
+    candidate = normalize_nutrient_name(name)
+    for _ in range(3):
+        if candidate in ALIASES:
+            return ALIASES[candidate]
+        if candidate.endswith("s") and candidate[:-1] in ALIASES:
+            return ALIASES[candidate[:-1]]
+        stripped = candidate
+        for prefix in _prefixes:
+            stripped = stripped[len(prefix):] if stripped.startswith(prefix) else stripped
+        for suffix in _suffixes:
+            stripped = stripped[:-len(suffix)] if stripped.endswith(suffix) else stripped
+        if stripped == candidate:
+            break
+        candidate = stripped
+    return None
+
+
+def label_rows(label):
+    """
+    Flatten a nutritional label dict into (row name, value) pairs
+
+    Where a label has several columns (per 100 g and per serving), the
+    per 100 g/ml column is used.
+    """
+    if not isinstance(label, dict):
+        return []
+    columns = [key for key, value in label.items() if isinstance(value, dict)]
+    if columns and len(columns) == len(label) and not any(find_nutrient(key) for key in columns):
+        per_100 = [key for key in columns if _per_100_pattern.search(key)]
+        return label_rows(label[(per_100 or columns)[0]])
+    rows = []
+    for name, value in label.items():
+        if isinstance(value, dict):
+            if find_nutrient(name) is None:
+                # A group of rows, e.g. "Vitamins": {"Vitamin C": ..., "Vitamin D": ...}
+                rows.extend(label_rows(value))
+                continue
+            if not all(_column_pattern.search(str(key)) for key in value):
+                # Sub-rows, e.g. "Carbohydrate": {"Total": "58g", "of which Sugars": "26g"}
+                for sub_name, sub_value in value.items():
+                    sub_name = name if normalize_nutrient_name(sub_name) in ("total", "amount", "") else sub_name
+                    rows.append((sub_name, sub_value))
+                continue
+            per_100 = [key for key in value if _per_100_pattern.search(str(key))]
+            value = value[per_100[0]] if per_100 else next(iter(value.values()), None)
+        rows.append((name, value))
+    return rows
+
+
+def score_label(label):
+    """
+    Convert a nutritional label to exact amounts, %DV and energy split
+
+    Returns:
+        dict: {"nutrients": {name: {"amount", "unit", "daily_value_pct"}},
+        "energy_kcal", "energy_split_pct": {"carbohydrate", "protein", "fat"},
+        "unrecognized": [row names]}; amounts are per the label's basis
+        (per 100 g/ml where the label gives it)
+    """
+    indexes = []
+    amounts = []
+    unrecognized = []
+    for name, value in label_rows(label):
+        match = find_nutrient(name)
+        amount = parse_amount(value)
+        if match is None or amount is None:
+            unrecognized.append(name)
+            continue
+        index, factor = match
+        if index in indexes:
+            continue
+        number, dimension = amount
+        unit = row_unit(name) if dimension is None else None
+        if unit is not None:
+            # A bare number in a row like "Energy (kJ)" is in the row's unit
+            dimension, unit_factor = UNITS[unit]
+            number *= unit_factor
+        elif dimension is None:
+            # Otherwise a bare number is in the nutrient's own unit
+            number *= UNIT_FACTORS[index]
+            dimension = NUTRIENTS[index]["dimension"]
+        if dimension != NUTRIENTS[index]["dimension"]:
+            unrecognized.append(name)
+            continue
+        indexes.append(index)
+        amounts.append(number * factor)
+
+    facts = {"nutrients": {}, "energy_kcal": None, "energy_split_pct": None, "unrecognized": unrecognized}
+    if not indexes:
+        return facts
+    indexes = np.array(indexes)
+    base_amounts = np.array(amounts)
+    display_amounts = base_amounts / UNIT_FACTORS[indexes]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentages = base_amounts / DAILY_VALUES[indexes] * 100
+
+    for index, amount, percentage in zip(indexes.tolist(), display_amounts.tolist(), percentages.tolist()):
+        nutrient = NUTRIENTS[index]
+        facts["nutrients"][nutrient["name"]] = {
+            "amount": round(amount, 3),
+            "unit": nutrient["unit"],
+            "daily_value_pct": None if np.isnan(percentage) else round(percentage, 1),
+        }
+
+    # Energy from each macronutrient: grams are mg / 1000 in the base unit
+    grams = np.full(len(NUTRIENTS), np.nan)
+    grams[indexes] = base_amounts / 1000
+    macro_energy = grams[_macronutrients] * _macronutrient_energy
+    # Only split energy when the label gives all three macronutrients
+    total = macro_energy.sum() if not np.isnan(macro_energy).any() else 0.0
+    if total > 0:
+        split = macro_energy / total * 100
+        facts["energy_split_pct"] = {
+            "carbohydrate": round(float(split[0]), 1),
+            "protein": round(float(split[1]), 1),
+            "fat": round(float(split[2]), 1),
+        }
+    energy = facts["nutrients"].get("Energy")
+    facts["energy_kcal"] = energy["amount"] if energy else (round(float(total), 1) if total > 0 else None)
+    return facts
+
+
+def with_nutrition_facts(analysis, facts):
+    """Copy of the model's analysis with the computed numbers added to its nutritional_summary"""
+    if not facts or not facts["nutrients"]:
+        return analysis
+    analysis = dict(analysis)
+    summary = dict(analysis.get("nutritional_summary") or {})
+    summary["energy_kcal"] = facts["energy_kcal"]
+    summary["energy_split_pct"] = facts["energy_split_pct"]
+    summary["daily_value_pct"] = {
+        name: nutrient["daily_value_pct"]
+        for name, nutrient in facts["nutrients"].items() if nutrient["daily_value_pct"] is not None
+    }
+    analysis["nutritional_summary"] = summary
+    return analysis
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_logger, profiled, span
+from resilience import bounded, remaining
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "16"))
+
+logger = get_logger("pipeline")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class StageError(Exception):
+    """A stage failed or timed out; the original exception is the __cause__"""
+
+    def __init__(self, stage, message):
+        super().__init__(f"{stage}: {message}")
+        self.stage = stage
+
+
+_REQUIRED = object()
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    func receives the results of the stages named in deps as keyword
+    arguments and may be a plain function (run in a worker thread) or a
+    coroutine function (awaited on the pipeline's loop). If default is given,
+    a failure or timeout of this stage is logged and default is used as its
+    result instead of failing the run.
+
+    The timeout of a plain function counts from when a worker thread picks it
+    up, not from when it was queued. Threads can't be interrupted, so a stage
+    that times out keeps its worker busy until func returns; func should pass
+    its own timeout on to the calls it makes.
+    """
+
+    def __init__(self, name, func, deps=(), timeout=None, default=_REQUIRED):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.default = default
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+        return _executor
+
+
+class StageGraph:
+    """
+    Dependency graph of stages.
+
+    Every stage starts as soon as all of its dependencies have finished, so
+    independent stages overlap and the run takes as long as the slowest chain
+    of dependent stages rather than the sum of all of them.
+    """
+
+    def __init__(self, stages):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def _run_stage(self, stage, tasks, results, timings, on_result):
+        for dep in stage.deps:
+            await tasks[dep]
+        kwargs = {dep: results[dep] for dep in stage.deps}
+        started = time.perf_counter()
+        timeout = stage.timeout
+        try:
+            # A stage never runs past the request's overall deadline
+            timeout = bounded(stage.timeout)
+            with span(stage.name, kind="stage"):
+                if inspect.iscoroutinefunction(stage.func):
+                    call = stage.func(**kwargs)
+                else:
+                    call, timeout = await self._start_in_worker(stage, kwargs)
+                value = await asyncio.wait_for(call, timeout)
+        except Exception as e:
+            message = f"timed out after {timeout:g}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            if stage.default is _REQUIRED:
+                raise StageError(stage.name, message) from e
+            logger.warning("Stage failed, continuing without it", stage=stage.name, error=message)
+            value = stage.default
+        timings[stage.name] = time.perf_counter() - started
+        results[stage.name] = value
+        if on_result is not None:
+            on_result(stage.name, value)
+        return value
+
+    @staticmethod
+    async def _start_in_worker(stage, kwargs):
+        """
+        Queue a plain stage function on the worker pool and wait until a worker picks it up
+
+        Only the request deadline limits the time spent in the queue. Returns
+        the future of the running call and the stage's timeout from now on.
+        """
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        # Run in the caller's context so the request id and profiler follow the stage
+        context = contextvars.copy_context()
+
+        def run():
+            loop.call_soon_threadsafe(started.set)
+            return context.run(functools.partial(profiled, stage.func, **kwargs))
+
+        call = loop.run_in_executor(_get_executor(), run)
+        try:
+            await asyncio.wait_for(started.wait(), remaining())
+            return call, bounded(stage.timeout)
+        except BaseException:
+            # A call that hasn't started yet is dropped from the queue
+            call.cancel()
+            raise
+
+    async def run(self, on_result=None):
+        """
+        Run every stage and return (results, timings) dicts keyed by stage name
+
+        on_result(name, value) is called on the loop as each stage finishes.
+        The first required stage to fail cancels the rest and raises StageError.
+        """
+        results = {}
+        timings = {}
+        tasks = {}
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks, results, timings, on_result))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return results, timings
+
+    def run_sync(self, on_result=None):
+        """Run the graph on a fresh event loop from synchronous code"""
+        return asyncio.run(self.run(on_result))
@@ -35,6 +35,8 @@ Provide your analysis in the following JSON format:
     },
     "detailed_analysis": "Comprehensive explanation of all findings and recommendations"
 }
+
+The product data may include "nutrition_facts", computed exactly from the nutritional label: the percent daily value of each nutrient, the energy in kcal and the percentage of energy from carbohydrate, protein and fat. Use these numbers as given instead of calculating your own, and base your assessments on them.
 """
 
 extract_ingredients_and_nutrition_prompt = r"""
@@ -82,4 +84,7 @@ Here is an example of the output format:
         "Energy": "405kcal"
     }
 }
-"""
\ No newline at end of file
+"""
+# Bump when extract_ingredients_and_nutrition_prompt changes in a way that should
+# invalidate cached extraction results
+extraction_prompt_version = 1
@@ -0,0 +1,185 @@
+"""
+Process-wide clients for the model and search providers.
+
+Each kind of provider ("gemini", "mistral", "search") has named backends,
+chosen with GEMINI_BACKEND, MISTRAL_BACKEND and SEARCH_BACKEND. The chosen
+backend's client is created once per process on first use (and again after
+a fork) and then shared by every request, so API keys are read, SDKs are
+configured and HTTP connections are opened once rather than per analysis.
+
+A backend is a factory returning a client with:
+
+    gemini:  model_name, generate_content(contents, timeout=None), check()
+    mistral: model_name, complete(messages, response_format=None, timeout=None), check()
+    search:  search(query) coroutine, run(coroutine), stats, check(), close()
+
+register_backend adds a backend, and set_provider installs a ready-made
+client, e.g. a local stand-in for tests and benchmarks.
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from mistralai import Mistral
+
+from metrics import get_logger
+
+load_dotenv()
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-large-latest")
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google")
+MISTRAL_BACKEND = os.getenv("MISTRAL_BACKEND", "mistral")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "google")
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "10"))
+
+KINDS = ("gemini", "mistral", "search")
+
+logger = get_logger("providers")
+
+
+class GeminiClient:
+    """Gemini SDK configured once, with one GenerativeModel reused by every request"""
+
+    def __init__(self, api_key=None, model_name=GEMINI_MODEL):
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY_2"))
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, contents, timeout=None):
+        request_options = {"timeout": timeout} if timeout is not None else None
+        return self._model.generate_content(contents, request_options=request_options)
+
+    def check(self):
+        genai.get_model(f"models/{self.model_name}", request_options={"timeout": HEALTH_CHECK_TIMEOUT})
+
+
+class MistralClient:
+    """One Mistral client, whose HTTP connection pool is shared by every request"""
+
+    def __init__(self, api_key=None, model_name=MISTRAL_MODEL):
+        self.model_name = model_name
+        self._client = Mistral(api_key=api_key or os.getenv("MISTRAL_API_KEY"))
+
+    def complete(self, messages, response_format=None, timeout=None):
+        return self._client.chat.complete(
+            model=self.model_name, messages=messages, response_format=response_format,
+            timeout_ms=int(timeout * 1000) if timeout is not None else None,
+        )
+
+    def check(self):
+        self._client.models.retrieve(model_id=self.model_name, timeout_ms=int(HEALTH_CHECK_TIMEOUT * 1000))
+
+
+def _google_search():
+    # Imported here because googli gets its client from this module
+    from googli import SearchClient
+
+    client = SearchClient()
+    atexit.register(client.close)
+    return client
+
+
+_backends = {
+    "gemini": {"google": GeminiClient},
+    "mistral": {"mistral": MistralClient},
+    "search": {"google": _google_search},
+}
+_selected = {"gemini": GEMINI_BACKEND, "mistral": MISTRAL_BACKEND, "search": SEARCH_BACKEND}
+# kind -> (pid, client)
+_clients = {}
+_lock = threading.Lock()
+
+
+def register_backend(kind, name, factory):
+    """Make factory available as backend name for kind"""
+    _backends[kind][name] = factory
+
+
+def use_backend(kind, name):
+    """Switch kind to a registered backend; its client is created on next use"""
+    if name not in _backends[kind]:
+        raise ValueError(f"Unknown {kind} backend {name!r}; registered: {', '.join(_backends[kind])}")
+    with _lock:
+        _selected[kind] = name
+        _clients.pop(kind, None)
+
+
+def set_provider(kind, client, name="custom"):
+    """Use an existing client for kind in this process"""
+    with _lock:
+        _selected[kind] = name
+        _clients[kind] = (os.getpid(), client)
+
+
+def peek_provider(kind):
+    """Return the client of kind if this process has created it, without creating it"""
+    entry = _clients.get(kind)
+    return entry[1] if entry is not None and entry[0] == os.getpid() else None
+
+
+def get_provider(kind):
+    """Return the process-wide client of kind, creating it on first use and after a fork"""
+    client = peek_provider(kind)
+    if client is not None:
+        return client
+    with _lock:
+        entry = _clients.get(kind)
+        if entry is None or entry[0] != os.getpid():
+            name = _selected[kind]
+            if name not in _backends[kind]:
+                raise ValueError(f"Unknown {kind} backend {name!r}; registered: {', '.join(_backends[kind])}")
+            started = time.perf_counter()
+            entry = (os.getpid(), _backends[kind][name]())
+            _clients[kind] = entry
+            logger.info(
+                "Provider client created", kind=kind, backend=name,
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            )
+        return entry[1]
+
+
+def warm_providers():
+    """Create every provider client up front so the first request doesn't pay for it"""
+    for kind in KINDS:
+        try:
+            get_provider(kind)
+        except Exception as e:
+            logger.error("Could not create provider client", kind=kind, backend=_selected[kind], error=str(e))
+
+
+def provider_stats():
+    """Backend and readiness of each provider in this process; makes no network calls"""
+    return {kind: {"backend": _selected[kind], "ready": peek_provider(kind) is not None} for kind in KINDS}
+
+
+def check_providers(timeout=HEALTH_CHECK_TIMEOUT):
+    """
+    Call every provider's check() concurrently and report how each went
+
+    Each check makes one small request to its service (the search check
+    spends one query of the quota).
+    """
+    def check(kind):
+        started = time.perf_counter()
+        get_provider(kind).check()
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    executor = ThreadPoolExecutor(max_workers=len(KINDS), thread_name_prefix="health")
+    futures = {kind: executor.submit(check, kind) for kind in KINDS}
+    wait(futures.values(), timeout=timeout)
+    executor.shutdown(wait=False)
+    report = {}
+    for kind, future in futures.items():
+        report[kind] = {"backend": _selected[kind]}
+        if not future.done():
+            report[kind].update(ok=False, error=f"No answer within {timeout:g}s")
+        elif future.exception() is not None:
+            report[kind].update(ok=False, error=str(future.exception()))
+        else:
+            report[kind].update(ok=True, latency_ms=future.result())
+    return report
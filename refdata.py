@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import html
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from fuzzy import build_trigram_sections, collect_entries
+from metrics import get_logger
+
+DATA_DIR = "data"
+ARTIFACT_PATH = os.path.join(DATA_DIR, "reference.bin")
+
+# Bump whenever the cleaning rules or the binary layout change
+ARTIFACT_VERSION = 3
+MAGIC = b"FLREF\x00"
+
+# Source CSV and the cleaned columns kept from it. Columns listed in "searchable"
+# additionally get a case-folded copy that lookups can scan in place.
+REFERENCE_SOURCES = {
+    "scogs": {
+        "file": "FDA--SCOGS.csv",
+        "columns": ["GRAS Substance", "Other Names", "CAS Reg. No. or other ID CODE", "Year of Report", "SCOGS Type of Conclusion"],
+        "searchable": ["GRAS Substance", "Other Names"],
+    },
+    "monographs": {
+        "file": "monographs.csv",
+        "columns": ["CAS No.", "Agent", "Group"],
+        "searchable": ["Agent"],
+    },
+    "roc": {
+        "file": "roc15_casrn_index.csv",
+        "columns": ["CASRN", "NAME OR SYNONYM", "Listing in the 15th RoC"],
+        "searchable": ["NAME OR SYNONYM"],
+    },
+    "fda_substances": {
+        "file": "FDA--FoodSubstances.csv",
+        "columns": ["CAS Reg No (or other ID)", "Substance", "Other Names", "Used for (Technical Effect)"],
+        "searchable": ["Substance", "Other Names"],
+    },
+    "ins": {
+        "file": "ins_numbers.csv",
+        "columns": ["INS No.", "Name", "CAS No.", "Functional class"],
+        "searchable": [],
+    },
+}
+
+# Separates rows inside a column blob; never appears in cleaned values
+ROW_SEPARATOR = b"\x00"
+# Joins list-like cells such as "&diams; ACACIA<br />&diams; GUM ARABIC"
+VALUE_SEPARATOR = "; "
+
+logger = get_logger("refdata")
+
+_excel_text_pattern = re.compile(r'^=T\("(.*)"\)$', re.DOTALL)
+_line_break_pattern = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+_loaded = None
+
+
+def clean_value(value):
+    """Strip spreadsheet and HTML residue from a single CSV cell"""
+    if not isinstance(value, str):
+        return ""
+    value = value.strip()
+    excel_text = _excel_text_pattern.match(value)
+    if excel_text:
+        value = excel_text.group(1)
+    value = value.replace("&diams;", "")
+    parts = [html.unescape(part).strip().rstrip(",").strip() for part in _line_break_pattern.split(value)]
+    return VALUE_SEPARATOR.join(part for part in parts if part).replace("\x00", "")
+
+
+def source_paths(data_dir=DATA_DIR):
+    return [os.path.join(data_dir, spec["file"]) for spec in REFERENCE_SOURCES.values()]
+
+
+def source_checksum(data_dir=DATA_DIR):
+    """SHA-256 over every source CSV plus the artifact version"""
+    digest = hashlib.sha256(f"v{ARTIFACT_VERSION}".encode())
+    for path in source_paths(data_dir):
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _source_signature(data_dir):
+    signature = []
+    for path in source_paths(data_dir):
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _encode_column(values):
+    """Encode values as a separator-joined blob plus uint32 row start offsets"""
+    starts = array("I")
+    blob = bytearray()
+    for value in values:
+        starts.append(len(blob))
+        blob += value.encode("utf-8")
+        blob += ROW_SEPARATOR
+    starts.append(len(blob))
+    return bytes(blob), starts.tobytes()
+
+
+def build_artifact(data_dir=DATA_DIR, output_path=ARTIFACT_PATH):
+    """
+    Clean the reference CSVs and write them into one versioned binary artifact
+
+    Layout: MAGIC, uint32 header length, JSON header, then 8-byte aligned sections.
+    Every column is a UTF-8 blob of separator-terminated values and a uint32 array
+    of row start offsets, so readers can slice values straight out of the mapping.
+    """
+    # pandas is only needed to compile the artifact, not to serve lookups
+    import pandas as pd
+
+    started = time.perf_counter()
+    checksum = source_checksum(data_dir)
+    sections = []
+    offset = 0
+    tables = {}
+    cleaned = {}
+
+    def add_section(data):
+        nonlocal offset
+        padding = -offset % 8
+        sections.append(b"\x00" * padding + data)
+        offset += padding
+        section = {"offset": offset, "length": len(data)}
+        offset += len(data)
+        return section
+
+    for table, spec in REFERENCE_SOURCES.items():
+        df = pd.read_csv(os.path.join(data_dir, spec["file"]), usecols=spec["columns"], dtype=str)
+        columns = {}
+        cleaned[table] = {}
+        for column in spec["columns"]:
+            values = [clean_value(value) for value in df[column].tolist()]
+            cleaned[table][column] = values
+            blob, starts = _encode_column(values)
+            columns[column] = {"values": add_section(blob), "starts": add_section(starts)}
+            if column in spec["searchable"]:
+                blob, starts = _encode_column([value.lower() for value in values])
+                columns[column]["folded"] = add_section(blob)
+                columns[column]["folded_starts"] = add_section(starts)
+        tables[table] = {"rows": len(df), "columns": columns}
+
+    # Trigram index for fuzzy name matching, see fuzzy.FuzzyIndex
+    table_order = list(REFERENCE_SOURCES)
+    entries = collect_entries(cleaned, table_order, VALUE_SEPARATOR)
+    fuzzy_spec = {"tables_order": table_order, "entries": len(entries)}
+    for name, data in build_trigram_sections(entries).items():
+        fuzzy_spec[name] = add_section(data)
+    blob, starts = _encode_column([name for _, _, name in entries])
+    fuzzy_spec["names"] = {"values": add_section(blob), "starts": add_section(starts)}
+
+    header = json.dumps({
+        "version": ARTIFACT_VERSION,
+        "source_checksum": checksum,
+        "byteorder": sys.byteorder,
+        "built_at": time.time(),
+        "tables": tables,
+        "fuzzy": fuzzy_spec,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    data_start = len(prefix) + (-len(prefix) % 8)
+
+    # Write next to the target and rename, so workers never map a half-written file
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix.ljust(data_start, b"\x00"))
+        for section in sections:
+            f.write(section)
+    os.replace(tmp_path, output_path)
+
+    logger.info(
+        "Built reference artifact", path=output_path, bytes=os.path.getsize(output_path),
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    return output_path
+
+
+class MappedColumn:
+    """One column of a mapped reference table"""
+
+    def __init__(self, buffer, data_start, spec):
+        self.buffer = buffer
+        self.start = data_start + spec["values"]["offset"]
+        self.starts = _uint32_view(buffer, data_start, spec["starts"])
+        self.folded_start = None
+        if "folded" in spec:
+            self.folded_start = data_start + spec["folded"]["offset"]
+            self.folded_end = self.folded_start + spec["folded"]["length"]
+            self.folded_starts = _uint32_view(buffer, data_start, spec["folded_starts"])
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def value(self, row):
+        return self.buffer[self.start + self.starts[row]:self.start + self.starts[row + 1] - 1].decode("utf-8")
+
+    def values(self):
+        return [self.value(row) for row in range(len(self))]
+
+    def find_row(self, folded_name):
+        """Return the first row whose case-folded value contains folded_name, or None"""
+        position = self.buffer.find(folded_name.encode("utf-8"), self.folded_start, self.folded_end)
+        if position == -1:
+            return None
+        return bisect_right(self.folded_starts, position - self.folded_start) - 1
+
+
+class ReferenceTable:
+    def __init__(self, name, rows, columns):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __len__(self):
+        return self.rows
+
+
+class ReferenceData:
+    """Read-only view of a memory-mapped reference artifact"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            # The mapping stays valid after the file is closed; the pages are
+            # shared through the page cache by every worker that maps the file
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a reference artifact")
+        (header_length,) = struct.unpack_from("<I", self.buffer, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self.buffer[header_start:header_start + header_length])
+        data_start = header_start + header_length + (-(header_start + header_length) % 8)
+
+        self.data_start = data_start
+        self.path = path
+        self.version = self.header["version"]
+        self.source_checksum = self.header["source_checksum"]
+        self.tables = {
+            name: ReferenceTable(
+                name,
+                spec["rows"],
+                {column: MappedColumn(self.buffer, data_start, column_spec)
+                 for column, column_spec in spec["columns"].items()},
+            )
+            for name, spec in self.header["tables"].items()
+        }
+        self.stats = {"load_started": None, "load_ms": None, "first_lookup_ms": None}
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def section(self, spec):
+        """Return a zero-copy view of a raw section described in the header"""
+        start = self.data_start + spec["offset"]
+        return memoryview(self.buffer)[start:start + spec["length"]]
+
+    def column(self, spec):
+        return MappedColumn(self.buffer, self.data_start, spec)
+
+    def is_compatible(self):
+        return self.version == ARTIFACT_VERSION and self.header.get("byteorder") == sys.byteorder
+
+    def mark_first_lookup(self):
+        """Report the time from cold start to the first answered lookup, once"""
+        if self.stats["first_lookup_ms"] is None and self.stats["load_started"] is not None:
+            self.stats["first_lookup_ms"] = (time.perf_counter() - self.stats["load_started"]) * 1000
+            logger.info(
+                "Reference data cold start to first lookup",
+                first_lookup_ms=round(self.stats["first_lookup_ms"], 1), load_ms=round(self.stats["load_ms"], 1),
+            )
+
+
+def _uint32_view(buffer, data_start, section):
+    start = data_start + section["offset"]
+    return memoryview(buffer)[start:start + section["length"]].cast("I")
+
+
+def _open_artifact(path, checksum):
+    """Map path if it exists and was built from sources with the given checksum"""
+    if not os.path.exists(path):
+        return None
+    try:
+        reference_data = ReferenceData(path)
+    except (ValueError, struct.error, json.JSONDecodeError) as e:
+        logger.warning("Ignoring unreadable reference artifact", path=path, error=str(e))
+        return None
+    if reference_data.is_compatible() and reference_data.source_checksum == checksum:
+        return reference_data
+    return None
+
+
+def load_reference_data(data_dir=DATA_DIR, artifact_path=ARTIFACT_PATH):
+    """
+    Return the mapped reference data, compiling the artifact if needed
+
+    The mapping is cached per process. Sources are re-checksummed only when their
+    size or mtime changes, and the artifact is rebuilt and remapped only when that
+    checksum no longer matches the one it was built from.
+    """
+    global _loaded
+    signature = _source_signature(data_dir)
+    if _loaded is not None and _loaded[0] == signature:
+        return _loaded[1]
+
+    load_started = time.perf_counter()
+    checksum = source_checksum(data_dir)
+    if _loaded is not None and _loaded[1].source_checksum == checksum:
+        _loaded = (signature, _loaded[1])
+        return _loaded[1]
+
+    reference_data = _open_artifact(artifact_path, checksum)
+    if reference_data is None:
+        logger.info("Reference artifact missing or stale, rebuilding", path=artifact_path)
+        build_artifact(data_dir, artifact_path)
+        reference_data = ReferenceData(artifact_path)
+
+    reference_data.stats["load_started"] = load_started
+    reference_data.stats["load_ms"] = (time.perf_counter() - load_started) * 1000
+    _loaded = (signature, reference_data)
+    return reference_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the reference CSVs into a memory-mappable artifact")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="clean the CSVs and write the artifact")
+    build.add_argument("--data-dir", default=DATA_DIR)
+    build.add_argument("--output", default=ARTIFACT_PATH)
+
+    info = subparsers.add_parser("info", help="describe an existing artifact")
+    info.add_argument("--data-dir", default=DATA_DIR)
+    info.add_argument("--artifact", default=ARTIFACT_PATH)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_artifact(args.data_dir, args.output)
+    else:
+        reference_data = ReferenceData(args.artifact)
+        fresh = reference_data.is_compatible() and reference_data.source_checksum == source_checksum(args.data_dir)
+        print(f"Artifact: {args.artifact} (version {reference_data.version}, {'up to date' if fresh else 'stale'})")
+        print(f"Source checksum: {reference_data.source_checksum}")
+        for name, table in reference_data.tables.items():
+            print(f"  {name}: {len(table)} rows, columns: {', '.join(table.columns)}")
+
+
+if __name__ == "__main__":
+    main()
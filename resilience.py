@@ -0,0 +1,254 @@
+"""
+Deadlines, hedged requests and circuit breakers for calls to external providers.
+
+- Every analysis runs under an overall budget (REQUEST_BUDGET). Stages and
+  provider calls get the smaller of their own timeout and the time left, so
+  a slow early stage can't push the request past its budget.
+- Calls to providers listed in HEDGE_PROVIDERS start a second, identical
+  attempt once the first has run longer than the provider's recent p95
+  latency, and use whichever answers first.
+- Each provider has a circuit breaker. After BREAKER_FAILURES consecutive
+  failures, calls fail immediately with CircuitOpenError for
+  BREAKER_RESET_AFTER seconds, then a single trial call decides whether it
+  closes again. Optional stages check available() and skip the provider
+  instead.
+"""
+import collections
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from metrics import BREAKER_OPEN, HEDGED_CALLS, get_logger
+
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", "300"))
+# Default per-call timeouts in seconds, overridable with PROVIDER_TIMEOUT_<NAME>
+PROVIDER_TIMEOUTS = {"gemini": 120, "mistral": 90, "search": 15, "blinkit": 60, "images": 15}
+HEDGE_PROVIDERS = {name.strip() for name in os.getenv("HEDGE_PROVIDERS", "").split(",") if name.strip()}
+# Latency samples a provider needs before its p95 is trusted for hedging
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = 200
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_AFTER = float(os.getenv("BREAKER_RESET_AFTER", "30"))
+
+logger = get_logger("resilience")
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the call could be made"""
+
+
+class CircuitOpenError(Exception):
+    """A provider's circuit breaker is open, so the call was not attempted"""
+
+
+@contextmanager
+def request_deadline(seconds=REQUEST_BUDGET):
+    """Run the block under a time budget; nested budgets never extend an outer one"""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current request's budget, or None outside a request"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded(timeout):
+    """
+    The smaller of timeout and the time left in the request
+
+    Raises:
+        DeadlineExceeded: If no time is left
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request time budget exhausted")
+    return left if timeout is None else min(timeout, left)
+
+
+def provider_timeout(name):
+    default = PROVIDER_TIMEOUTS.get(name)
+    return float(os.getenv(f"PROVIDER_TIMEOUT_{name.upper()}", default)) if default is not None else None
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one provider"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, fraction):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call"""
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET_AFTER):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def available(self):
+        """Whether a call would be attempted right now, without claiming the trial call"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_running)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+        retry_in = max(0.0, self.reset_after - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"{self.name} is unavailable after repeated failures; retrying in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit closed", provider=self.name)
+                BREAKER_OPEN.set(0, provider=self.name)
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                logger.warning("Circuit opened", provider=self.name, failures=self.failures)
+                BREAKER_OPEN.set(1, provider=self.name)
+
+    def release(self):
+        """Give up a claimed trial call that was cancelled rather than failed"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+_breakers = {}
+_latencies = collections.defaultdict(LatencyTracker)
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_stats():
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def _hedged(name, func, timeout):
+    if timeout is None:
+        # Unbounded calls have no budget to share with a second attempt
+        return func(timeout)
+    delay = _latencies[name].quantile(0.95)
+    executor = _get_hedge_executor()
+    context = contextvars.copy_context()
+    first = executor.submit(context.copy().run, func, timeout)
+    if delay is None or delay >= timeout:
+        return first.result()
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    attempts = [first, executor.submit(context.copy().run, func, timeout - delay)]
+    HEDGED_CALLS.inc(provider=name)
+    logger.info("Hedging slow call", provider=name, after_s=round(delay, 2))
+    error = None
+    deadline = time.monotonic() + timeout
+    while attempts:
+        done, _ = wait(attempts, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            attempts.remove(future)
+            if future.exception() is None:
+                # The other attempt finishes in the background; its result is dropped
+                return future.result()
+            error = future.exception()
+    if error is not None:
+        raise error
+    raise TimeoutError(f"{name} did not answer within {timeout:g}s")
+
+
+def call_provider(name, func, timeout=None):
+    """
+    Call a provider through its circuit breaker, within the request deadline
+
+    func receives the timeout in seconds it must respect. Calls to providers
+    in HEDGE_PROVIDERS are hedged once they run past the provider's p95.
+
+    Raises:
+        CircuitOpenError: If the provider's breaker is open
+        DeadlineExceeded: If the request has no time left
+    """
+    timeout = bounded(timeout if timeout is not None else provider_timeout(name))
+    breaker = get_breaker(name)
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        result = _hedged(name, func, timeout) if name in HEDGE_PROVIDERS else func(timeout)
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record_success()
+    _latencies[name].record(time.perf_counter() - started)
+    return result
+
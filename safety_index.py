@@ -0,0 +1,134 @@
+# (reference table, name column, CAS column, result column, message) in the order
+# lookup_ingredient_safety has always reported them
+SAFETY_SOURCES = [
+    ("scogs", "GRAS Substance", "CAS Reg. No. or other ID CODE", "SCOGS Type of Conclusion", "FDA SCOGS Status: {}"),
+    ("monographs", "Agent", "CAS No.", "Group", "IARC Classification: Group {}"),
+    ("roc", "NAME OR SYNONYM", "CASRN", "Listing in the 15th RoC", "Report on Carcinogens Status: {}"),
+]
+
+NO_CLASSIFICATION = "No safety classification found in reference databases"
+
+# CAS column of every reference table a fuzzy match can point into
+CAS_COLUMNS = {
+    "scogs": "CAS Reg. No. or other ID CODE",
+    "monographs": "CAS No.",
+    "roc": "CASRN",
+    "fda_substances": "CAS Reg No (or other ID)",
+    "ins": "CAS No.",
+}
+
+
+class TableIndex:
+    """
+    Substring and CAS index over a single reference table.
+
+    The reference artifact stores every searchable column case-folded as one
+    separator-joined blob, so a case-insensitive "contains" query is a single
+    find over the mapped bytes instead of a regex scan over every row. Rows are
+    laid out in table order, so the first hit is also the first matching row,
+    which is the row the old DataFrame lookup reported.
+    """
+
+    def __init__(self, table, name_column, cas_column, result_column, message):
+        self.source = table.name
+        self.names = table[name_column]
+        self.results = table[result_column]
+        self.message = message
+
+        # First row wins, same as .iloc[0] on the old boolean mask
+        self.cas_rows = {}
+        for row, cas_number in enumerate(table[cas_column].values()):
+            if cas_number and cas_number not in self.cas_rows:
+                self.cas_rows[cas_number] = row
+
+    def find_row(self, folded_name, cas_number=None):
+        """Return the first row whose name contains folded_name or whose CAS equals cas_number"""
+        rows = []
+        if folded_name:
+            row = self.names.find_row(folded_name)
+            if row is not None:
+                rows.append(row)
+        if cas_number is not None and cas_number.strip() in self.cas_rows:
+            rows.append(self.cas_rows[cas_number.strip()])
+        return min(rows) if rows else None
+
+    def classify(self, folded_name, cas_number=None):
+        row = self.find_row(folded_name, cas_number)
+        if row is None:
+            return None
+        return self.classify_row(row)
+
+    def classify_row(self, row):
+        return self.message.format(self.results.value(row))
+
+
+class SafetyIndex:
+    """Prebuilt lookup structure over the SCOGS, IARC monographs and RoC tables"""
+
+    def __init__(self, tables, reference_data=None):
+        self.tables = tables
+        self.reference_data = reference_data
+
+    def lookup(self, ingredient_name, cas_number=None):
+        """Look up safety information for one ingredient"""
+        folded_name = normalize_name(ingredient_name)
+        safety_info = []
+        for table in self.tables:
+            classification = table.classify(folded_name, cas_number)
+            if classification is not None:
+                safety_info.append(classification)
+        return safety_info if safety_info else [NO_CLASSIFICATION]
+
+    def lookup_entry(self, table, row):
+        """
+        Safety information for a specific reference row, e.g. a fuzzy match
+
+        The row's own classification is reported when it comes from one of the
+        safety tables; its CAS number is then looked up in the others.
+        """
+        cas_number = self.reference_data[table][CAS_COLUMNS[table]].value(row) or None
+        safety_info = []
+        for table_index in self.tables:
+            if table_index.source == table:
+                classification = table_index.classify_row(row)
+            else:
+                classification = table_index.classify(None, cas_number)
+            if classification is not None:
+                safety_info.append(classification)
+        return safety_info
+
+    def lookup_many(self, ingredients, cas_numbers=None):
+        """
+        Look up safety information for a whole ingredient list in one call
+
+        Args:
+            ingredients (list): Ingredient names as extracted from the label
+            cas_numbers (dict): Optional mapping of ingredient name to CAS number
+
+        Returns:
+            dict: Dictionary with ingredients as keys and their safety information as values
+        """
+        cas_numbers = cas_numbers or {}
+        results = {
+            ingredient: self.lookup(ingredient, cas_numbers.get(ingredient))
+            for ingredient in ingredients
+        }
+        if self.reference_data is not None:
+            self.reference_data.mark_first_lookup()
+        return results
+
+
+def normalize_name(ingredient_name):
+    """Case-fold an ingredient name the way the index stores reference names"""
+    if not isinstance(ingredient_name, str):
+        return ""
+    return ingredient_name.lower()
+
+
+def build_safety_index(reference_data):
+    """Build a SafetyIndex over the mapped tables returned by refdata.load_reference_data"""
+    tables = [
+        TableIndex(reference_data[source], name_column, cas_column, result_column, message)
+        for source, name_column, cas_column, result_column, message in SAFETY_SOURCES
+    ]
+    return SafetyIndex(tables, reference_data)
@@ -0,0 +1,51 @@
+import pytest
+
+import batch
+
+PRODUCTS = {
+    "https://example.com/a": ["Sugar", "Wheat Flour"],
+    "https://example.com/b": ["SUGAR", "WHEAT FLOUR", "Salt"],
+}
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    searched = []
+
+    def fake_search(terms, stats=None):
+        searched.append(list(terms))
+        return {term: [{"title": f"About {term.lower()}"}] for term in terms}
+
+    monkeypatch.setattr(batch, "configure_clients", lambda: {"gemini": None, "mistral": None})
+    monkeypatch.setattr(batch, "get_safety_index", lambda: None)
+    monkeypatch.setattr(batch, "_extract_item", lambda item, clients: {
+        "product_name": item["url"], "extracted": {"ingredients": PRODUCTS[item["url"]]},
+    })
+    monkeypatch.setattr(batch, "lookup_ingredients_safety", lambda ingredients, parsed: {i: [] for i in ingredients})
+    monkeypatch.setattr(batch, "analyze_extracted_data", lambda client, product_data: {})
+    monkeypatch.setattr(batch, "analyze_google_sync", fake_search)
+    return searched
+
+
+def search_results(result):
+    return result["data"]["extracted_data"]["ingredient_search_results"]
+
+
+def test_search_results_match_each_products_spelling(fakes):
+    results = batch.analyze_batch([{"url": url} for url in PRODUCTS])["results"]
+    assert fakes == [["Sugar", "Wheat Flour", "Salt"]]
+    assert set(search_results(results[0])) == {"Sugar", "Wheat Flour"}
+    assert set(search_results(results[1])) == {"SUGAR", "WHEAT FLOUR", "Salt"}
+    assert search_results(results[1])["SUGAR"] == [{"title": "About sugar"}]
+
+
+def test_shared_failure_falls_back_to_each_item(fakes, monkeypatch):
+    def failing_safety(ingredients, parsed):
+        if "Salt" in ingredients:
+            raise RuntimeError("lookup failed")
+        return {i: [] for i in ingredients}
+
+    monkeypatch.setattr(batch, "lookup_ingredients_safety", failing_safety)
+    results = batch.analyze_batch([{"url": url} for url in PRODUCTS])["results"]
+    assert results[0]["success"] and set(search_results(results[0])) == {"Sugar", "Wheat Flour"}
+    assert results[1] == {"success": False, "error": "lookup failed", "source": "https://example.com/b"}
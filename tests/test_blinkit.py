@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import string
+from contextlib import contextmanager
+
+import pytest
+import requests
+from selenium.common.exceptions import WebDriverException
+
+import blinkit
+import resilience
+from blinkit import parse_product_html
+from driver_pool import DriverPoolTimeout
+from resilience import CircuitBreaker
+
+FIXTURE = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "fixtures", "blinkit_product.html")
+URL = "https://blinkit.com/prn/britannia-fruit-cake/prid/100000"
+IMAGE_URLS = [
+    f"https://cdn.grofers.com/cdn-cgi/image/f=auto,fit=scale-down,q=70,metadata=none,w=1800/app/images/products/{k}.jpg"
+    for k in range(3)
+]
+
+
+def product_page(name="Britannia Fruit Cake", image_urls=IMAGE_URLS):
+    with open(FIXTURE) as f:
+        template = string.Template(f.read())
+    return template.substitute(
+        name=name, url=URL, product_id="100000", first_image=image_urls[0], images=json.dumps(image_urls),
+    )
+
+
+def test_reads_name_and_images_from_json_ld():
+    assert parse_product_html(product_page()) == ("Britannia Fruit Cake", IMAGE_URLS)
+
+
+def test_falls_back_to_open_graph_tags():
+    page = re.sub(r'<script type="application/ld\+json">.*?</script>', "", product_page(), flags=re.DOTALL)
+    assert parse_product_html(page) == ("Britannia Fruit Cake", IMAGE_URLS[:1])
+
+
+def test_page_without_product_data():
+    assert parse_product_html("<html><body><div id=\"app\"></div></body></html>") == (None, [])
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+
+class FakeSession:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    def get(self, url, timeout=None):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+class FakePool:
+    def __init__(self, error=None):
+        self.error = error
+
+    @contextmanager
+    def driver(self):
+        if self.error is not None:
+            raise self.error
+        yield None
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("blinkit", failures=1, reset_after=60)
+    monkeypatch.setattr(resilience, "_breakers", {"blinkit": breaker})
+    monkeypatch.setattr(blinkit, "extract_image_urls", lambda driver, url: (None, []))
+    return breaker
+
+
+def scrape(monkeypatch, outcome, pool=None):
+    monkeypatch.setattr(blinkit, "get_http_session", lambda: FakeSession(outcome))
+    monkeypatch.setattr(blinkit, "get_driver_pool", lambda: pool or FakePool())
+    return blinkit.scrape_product("https://blinkit.com/prn/unknown-product")
+
+
+def test_page_without_images_does_not_trip_breaker(monkeypatch, breaker):
+    assert scrape(monkeypatch, FakeResponse(404))["image_urls"] == []
+    assert scrape(monkeypatch, FakeResponse(200, "<html></html>"))["image_urls"] == []
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
+
+
+def test_busy_driver_pool_does_not_trip_breaker(monkeypatch, breaker):
+    with pytest.raises(DriverPoolTimeout):
+        scrape(monkeypatch, FakeResponse(200, "<html></html>"), FakePool(DriverPoolTimeout("busy")))
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
+
+
+@pytest.mark.parametrize("outcome", [FakeResponse(503), requests.ConnectionError("refused")])
+def test_outages_trip_breaker(monkeypatch, breaker, outcome):
+    assert scrape(monkeypatch, outcome)["image_urls"] == []
+    assert breaker.state == "open"
+
+
+def test_browser_errors_trip_breaker(monkeypatch, breaker):
+    with pytest.raises(WebDriverException):
+        scrape(monkeypatch, FakeResponse(404), FakePool(WebDriverException("chrome crashed")))
+    assert breaker.state == "open"
@@ -0,0 +1,36 @@
+import json
+
+from bulk import iter_records, read_checkpoint
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+def test_non_object_and_invalid_lines_become_errors(tmp_path):
+    input_path = tmp_path / "input.jsonl"
+    write_lines(input_path, ['{"url": "https://example.com/a"}', "[1, 2]", "not json", '"text"', ""])
+    records = list(iter_records(input_path, set()))
+    assert [item_id for item_id, _ in records] == ["https://example.com/a", "line:2", "line:3", "line:4"]
+    assert records[1][1] == {"error": "Record must be a JSON object"}
+    assert records[2][1]["error"].startswith("Invalid JSON")
+
+
+def test_resume_skips_error_lines_already_reported(tmp_path):
+    input_path = tmp_path / "input.jsonl"
+    output_path = tmp_path / "output.jsonl"
+    write_lines(input_path, ['{"url": "https://example.com/a"}', "[1, 2]", "not json"])
+    write_lines(output_path, [
+        json.dumps({"id": item_id, "success": False, "error": record.get("error")})
+        for item_id, record in iter_records(input_path, set())
+    ])
+    assert list(iter_records(input_path, read_checkpoint(output_path))) == []
+
+
+def test_checkpoint_skips_foreign_and_truncated_lines(tmp_path):
+    output_path = tmp_path / "output.jsonl"
+    output_path.write_text('{"id": "a", "success": true}\n[1]\n{"success": true}\n{"id": "b", "success": false}\n{"id": "c", "succ')
+    assert read_checkpoint(output_path) == {"a", "b"}
+    assert read_checkpoint(output_path, retry_failed=True) == {"a"}
+    # The partial last line is cut off so appended results start on a fresh line
+    assert output_path.read_text().endswith("false}\n")
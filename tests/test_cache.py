@@ -0,0 +1,49 @@
+import pytest
+
+import cache
+from cache import DiskCache
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    return DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+
+
+def test_hits_and_misses_are_counted_per_namespace(disk_cache):
+    disk_cache.set("google:salt", ["result"])
+    assert disk_cache.get("google:salt") == ["result"]
+    assert disk_cache.get("google:sugar") is None
+    assert disk_cache.get("gemini:abc") is None
+    stats = disk_cache.stats()
+    assert stats["entries"] == 1
+    assert stats["google"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert stats["gemini"] == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+
+
+def test_recent_reads_do_not_write(disk_cache):
+    disk_cache.set("google:salt", ["result"])
+    connection = disk_cache._connection()
+    changes = connection.total_changes
+    for _ in range(5):
+        disk_cache.get("google:salt")
+        disk_cache.get("google:sugar")
+    assert connection.total_changes == changes
+
+
+def test_expired_entries_are_misses(disk_cache):
+    disk_cache.set("google:salt", ["result"], ttl=-1)
+    assert disk_cache.get("google:salt") is None
+
+
+def test_eviction_runs_every_nth_write(disk_cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_EVICT_EVERY", 5)
+    disk_cache.set("google:expired", ["result"], ttl=-1)
+    for k in range(3):
+        disk_cache.set(f"google:{k}", [k])
+    assert disk_cache.stats()["entries"] == 4
+    # Reading entry 0 makes entry 1 the least recently read one
+    monkeypatch.setattr(cache, "CACHE_ACCESS_RESOLUTION", 0)
+    disk_cache.get("google:0")
+    disk_cache.set("google:3", [3])
+    assert disk_cache.stats()["entries"] == 3
+    assert [disk_cache.get(f"google:{k}") for k in range(4)] == [[0], None, [2], [3]]
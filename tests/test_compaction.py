@@ -0,0 +1,52 @@
+from compaction import compact_product_data, rank_snippets
+
+SHARED = "Maltodextrin may raise blood sugar quickly in people with diabetes"
+
+
+def results(*snippets):
+    return [{"title": "", "snippet": snippet, "link": ""} for snippet in snippets]
+
+
+def test_snippet_cut_from_one_query_is_kept_under_another():
+    search_results = {
+        "glucose": results(
+            "Glucose safety and health risk research studies",
+            "Glucose daily intake limit approved by fssai and fda",
+            SHARED,
+        ),
+        "maltodextrin": results(SHARED),
+    }
+    ranked, duplicates = rank_snippets(search_results, limit=2)
+    assert len(ranked["glucose"]) == 2 and SHARED + "." not in ranked["glucose"]
+    assert ranked["maltodextrin"] == [SHARED + "."]
+    assert duplicates == 0
+
+
+def test_snippet_kept_under_one_query_is_dropped_from_the_next():
+    ranked, duplicates = rank_snippets({"a": results(SHARED), "b": results(SHARED, "Other health study")}, limit=2)
+    assert ranked == {"a": [SHARED + "."], "b": ["Other health study."]}
+    assert duplicates == 1
+
+
+def test_smaller_limits_rerank_across_queries():
+    product_data = {
+        "ingredients": ["Glucose", "Maltodextrin"],
+        "ingredient_search_results": {
+            "glucose": results("Glucose safety and health risk research studies", SHARED),
+            "maltodextrin": results(SHARED),
+        },
+    }
+    data, stats = compact_product_data(product_data, budget=10 ** 6, snippets_per_ingredient=1)
+    assert data["ingredient_research"]["maltodextrin"] == [SHARED + "."]
+    assert stats["snippets_kept"] == 2
+
+
+def test_safety_lines_are_only_shortened_over_budget():
+    long_line = "IARC Classification: Group 2B; " + "Report on Carcinogens Status: reasonably anticipated " * 6
+    product_data = {"ingredients": ["Aspartame"], "safety_classifications": {"Aspartame": [long_line]}}
+    data, stats = compact_product_data(product_data, budget=10 ** 6)
+    assert data["safety_classifications"]["Aspartame"] == long_line.strip()
+    assert not stats["over_budget"]
+
+    data, _ = compact_product_data(product_data, budget=1)
+    assert len(data["safety_classifications"]["Aspartame"]) == 120
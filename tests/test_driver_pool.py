@@ -0,0 +1,51 @@
+import pytest
+
+from driver_pool import DriverPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def execute_script(self, script):
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeFactory:
+    """Launches fake drivers, failing the launch numbered fail_at"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.drivers = []
+
+    def __call__(self):
+        if len(self.drivers) + 1 == self.fail_at:
+            raise RuntimeError("browser failed to launch")
+        driver = FakeDriver()
+        self.drivers.append(driver)
+        return driver
+
+
+def test_start_fills_the_pool():
+    factory = FakeFactory()
+    pool = DriverPool(factory, size=3, timeout=0.1).start()
+    assert pool.stats()["idle"] == 3
+    assert not any(driver.quit_called for driver in factory.drivers)
+
+
+def test_failed_start_quits_started_drivers():
+    factory = FakeFactory(fail_at=3)
+    pool = DriverPool(factory, size=3, timeout=0.1)
+    with pytest.raises(RuntimeError):
+        pool.start()
+    assert len(factory.drivers) == 2
+    assert all(driver.quit_called for driver in factory.drivers)
+    assert pool.stats()["idle"] == 0
+
+    # The reserved slots are free again, so borrowers can launch drivers themselves
+    factory.fail_at = None
+    with pool.driver() as driver:
+        assert driver is factory.drivers[-1]
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+import googli
+import resilience
+from googli import SearchClient, analyze_google_sync
+
+
+class FakeCache:
+    """Search cache stub that records which thread each call ran on"""
+
+    def __init__(self, entries):
+        self.entries = dict(entries)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread().name)
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.threads.append(threading.current_thread().name)
+        self.entries[key] = value
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_search(query, request_id=None):
+        return [{"title": f"About {query}"}]
+
+    client = SearchClient()
+    monkeypatch.setattr(client, "_search", fake_search)
+    monkeypatch.setattr(googli, "get_search_client", lambda: client)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    yield client
+    client.close()
+
+
+def test_cache_calls_stay_off_the_client_loop(client, monkeypatch):
+    cache = FakeCache({"google:sugar": [{"title": "Cached sugar"}]})
+    monkeypatch.setattr(googli, "get_search_cache", lambda: cache)
+    stats = {}
+    results = analyze_google_sync(["Sugar", "Wheat-Flour"], stats)
+    assert results == {"Sugar": [{"title": "Cached sugar"}], "Wheat-Flour": [{"title": "About wheat flour"}]}
+    assert cache.entries["google:wheat flour"] == [{"title": "About wheat flour"}]
+    assert stats["cache_hits"] == 1 and stats["fetched"] == 1
+    assert cache.threads and "google-search" not in cache.threads
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, QueueFull
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def set_column(queue, job_id, column, value):
+    queue._connection().execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (value, job_id))
+
+
+def test_concurrent_workers_never_claim_the_same_job(queue):
+    job_ids = {queue.submit("url", f"https://example.com/{k}")[0]["id"] for k in range(40)}
+    # Separate queue objects, like separate worker processes, each claiming from several threads
+    workers = [JobQueue(queue.path) for _ in range(2)]
+    claimed = []
+    lock = threading.Lock()
+
+    def work(worker):
+        while True:
+            job = worker.claim()
+            if job is None:
+                return
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in workers for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+    assert queue.stats()[RUNNING] == 40
+
+
+def test_claim_takes_the_oldest_job(queue):
+    first, _ = queue.submit("url", "https://example.com/1")
+    queue.submit("url", "https://example.com/2")
+    assert queue.claim() == {"id": first["id"], "kind": "url", "source": "https://example.com/1"}
+    assert queue.get(first["id"])["status"] == RUNNING
+
+
+def test_stale_job_is_requeued_and_then_failed(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job, _ = queue.submit("url", "https://example.com/1")
+    assert queue.claim()["id"] == job["id"]
+    set_column(queue, job["id"], "heartbeat_at", time.time() - jobs.JOB_STALE_AFTER - 1)
+    assert queue.claim()["id"] == job["id"]
+    assert queue.get(job["id"])["attempts"] == 2
+
+    set_column(queue, job["id"], "heartbeat_at", time.time() - jobs.JOB_STALE_AFTER - 1)
+    assert queue.claim() is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == FAILED and failed["error"] == "Worker stopped responding"
+
+
+def test_heartbeat_keeps_a_running_job(queue):
+    job, _ = queue.submit("url", "https://example.com/1")
+    queue.claim()
+    set_column(queue, job["id"], "heartbeat_at", time.time() - jobs.JOB_STALE_AFTER + 5)
+    assert queue.claim() is None
+    set_column(queue, job["id"], "heartbeat_at", time.time() - jobs.JOB_STALE_AFTER - 1)
+    queue.heartbeat(job["id"])
+    assert queue.claim() is None
+    assert queue.get(job["id"])["status"] == RUNNING
+
+
+def test_dedupe_inside_and_outside_the_window(queue):
+    job, created = queue.submit("url", "https://blinkit.com/prn/a/prid/1", "blinkit:1")
+    assert created
+    # Pending and running jobs are shared
+    assert queue.submit("url", "https://blinkit.com/prn/b/prid/1", "blinkit:1") == (queue.get(job["id"]), False)
+    queue.claim()
+    queue.finish(job["id"], result={"success": True})
+    assert queue.submit("url", "https://blinkit.com/prn/a/prid/1", "blinkit:1")[0]["id"] == job["id"]
+
+    set_column(queue, job["id"], "finished_at", time.time() - jobs.JOB_DEDUPE_WINDOW - 1)
+    again, created = queue.submit("url", "https://blinkit.com/prn/a/prid/1", "blinkit:1")
+    assert created and again["id"] != job["id"]
+
+
+def test_failed_jobs_are_not_reused(queue):
+    job, _ = queue.submit("url", "https://example.com/1", "url:https://example.com/1")
+    queue.claim()
+    queue.finish(job["id"], error="Scrape failed")
+    again, created = queue.submit("url", "https://example.com/1", "url:https://example.com/1")
+    assert created and again["status"] == QUEUED
+
+
+def test_queue_full(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_QUEUE_MAX_DEPTH", 2)
+    first, _ = queue.submit("url", "https://example.com/1", "url:https://example.com/1")
+    queue.submit("url", "https://example.com/2")
+    with pytest.raises(QueueFull):
+        queue.submit("url", "https://example.com/3")
+    # A submission matching a pending job is still answered
+    assert queue.submit("url", "https://example.com/1", "url:https://example.com/1") == (queue.get(first["id"]), False)
+    queue.claim()
+    queue.finish(first["id"], result={"success": True})
+    assert queue.submit("url", "https://example.com/3")[1]
+    assert queue.stats()[QUEUED] + queue.stats()[RUNNING] == 2
+    assert queue.stats()[SUCCEEDED] == 1
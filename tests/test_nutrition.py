@@ -0,0 +1,54 @@
+import pytest
+
+from nutrition import parse_amount, row_unit, score_label
+
+
+def test_bare_number_uses_unit_in_row_name():
+    facts = score_label({"Energy (kJ)": "2175", "Salt (g)": "1.2", "Vitamin D (mcg)": "2"})
+    nutrients = facts["nutrients"]
+    assert nutrients["Energy"]["amount"] == pytest.approx(2175 / 4.184, abs=0.01)
+    assert nutrients["Energy"]["daily_value_pct"] == pytest.approx(26.0)
+    # Salt is converted to sodium: 1.2 g salt is 480 mg sodium
+    assert nutrients["Sodium"]["amount"] == pytest.approx(480.0)
+    assert nutrients["Vitamin D"]["amount"] == pytest.approx(2.0)
+
+
+def test_trailing_unit_in_row_name():
+    facts = score_label({"Sodium mg": "300", "Protein g": "5"})
+    assert facts["nutrients"]["Sodium"]["amount"] == pytest.approx(300.0)
+    assert facts["nutrients"]["Protein"]["amount"] == pytest.approx(5.0)
+
+
+def test_bare_number_without_row_unit_uses_nutrient_unit():
+    facts = score_label({"Sodium": "300", "Total Fat": "10"})
+    assert facts["nutrients"]["Sodium"]["amount"] == pytest.approx(300.0)
+    assert facts["nutrients"]["Fat"]["amount"] == pytest.approx(10.0)
+
+
+def test_unit_in_value_wins_over_row_name():
+    facts = score_label({"Energy (kJ)": "1695 kJ / 405 kcal"})
+    assert facts["nutrients"]["Energy"]["amount"] == pytest.approx(405.0)
+
+
+def test_row_unit_of_other_dimension_is_unrecognized():
+    facts = score_label({"Protein (kcal)": "5"})
+    assert "Protein" not in facts["nutrients"]
+    assert facts["unrecognized"] == ["Protein (kcal)"]
+
+
+@pytest.mark.parametrize("name, unit", [
+    ("Energy (kJ)", "kj"),
+    ("Salt (g)", "g"),
+    ("Sodium ( mg )", "mg"),
+    ("Vitamin B12 (µg)", "µg"),
+    ("Energy kcal", "kcal"),
+    ("Total Sugars", None),
+    ("Omega", None),
+])
+def test_row_unit(name, unit):
+    assert row_unit(name) == unit
+
+
+def test_parse_amount_thousands_and_decimal_comma():
+    assert parse_amount("1,200mg") == (1200.0, "mass")
+    assert parse_amount("0,5 g") == (500.0, "mass")
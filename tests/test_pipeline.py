@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pipeline
+from pipeline import Stage, StageError, StageGraph
+from resilience import request_deadline
+
+
+@pytest.fixture
+def one_worker(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(pipeline, "_executor", executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+def sleeper(seconds, ran=None):
+    def func(**kwargs):
+        if ran is not None:
+            ran.append(seconds)
+        time.sleep(seconds)
+        return seconds
+    return func
+
+
+def test_stages_overlap_and_pass_results():
+    graph = StageGraph([
+        Stage("a", sleeper(0.1)),
+        Stage("b", sleeper(0.1)),
+        Stage("c", lambda a, b: a + b, deps=("a", "b")),
+    ])
+    started = time.perf_counter()
+    results, timings = graph.run_sync()
+    assert results["c"] == pytest.approx(0.2)
+    assert time.perf_counter() - started < 0.19
+    assert set(timings) == {"a", "b", "c"}
+
+
+def test_timeout_counts_from_when_the_stage_starts(one_worker):
+    graph = StageGraph([Stage("slow", sleeper(0.3), timeout=1), Stage("quick", sleeper(0.01), timeout=0.2)])
+    results, _ = graph.run_sync()
+    assert results == {"slow": 0.3, "quick": 0.01}
+
+
+def test_stage_timeout(one_worker):
+    graph = StageGraph([Stage("slow", sleeper(0.3), timeout=0.05, default=None)])
+    results, _ = graph.run_sync()
+    assert results == {"slow": None}
+
+
+def test_queued_stage_is_dropped_when_the_deadline_runs_out(one_worker):
+    ran = []
+    graph = StageGraph([Stage("slow", sleeper(0.3), timeout=1), Stage("queued", sleeper(0.01, ran), timeout=1)])
+    with request_deadline(0.1):
+        with pytest.raises(StageError):
+            graph.run_sync()
+    time.sleep(0.3)
+    assert ran == []
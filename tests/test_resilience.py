@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, bounded, call_provider, remaining, request_deadline,
+)
+
+RESET_AFTER = 0.05
+
+
+class FakeProvider:
+    """Provider stub that fails its first `failures` calls and records the timeouts it was given"""
+
+    def __init__(self, failures=0, latency=0.0):
+        self.failures = failures
+        self.latency = latency
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            self.timeouts.append(timeout)
+            failing = len(self.timeouts) <= self.failures
+            latency = self.latency if len(self.timeouts) == 1 else 0.0
+        time.sleep(latency)
+        if failing:
+            raise RuntimeError("provider failed")
+        return "ok"
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("fake", failures=2, reset_after=RESET_AFTER)
+    monkeypatch.setattr(resilience, "_breakers", {"fake": breaker})
+    return breaker
+
+
+def open_breaker(provider):
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            call_provider("fake", provider, timeout=1)
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    provider = FakeProvider(failures=10)
+    open_breaker(provider)
+    assert breaker.state == "open" and not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        call_provider("fake", provider, timeout=1)
+    assert len(provider.timeouts) == 2
+
+
+def test_success_resets_failure_count(breaker):
+    provider = FakeProvider(failures=1)
+    with pytest.raises(RuntimeError):
+        call_provider("fake", provider, timeout=1)
+    assert call_provider("fake", provider, timeout=1) == "ok"
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
+
+
+def test_half_open_trial_success_closes(breaker):
+    provider = FakeProvider(failures=2)
+    open_breaker(provider)
+    time.sleep(RESET_AFTER)
+    assert breaker.state == "half_open" and breaker.available()
+    assert call_provider("fake", provider, timeout=1) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_trial(breaker):
+    open_breaker(FakeProvider(failures=2))
+    time.sleep(RESET_AFTER)
+    breaker.before_call()
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.release()
+    assert breaker.available()
+
+
+def test_half_open_trial_failure_reopens(breaker):
+    provider = FakeProvider(failures=3)
+    open_breaker(provider)
+    time.sleep(RESET_AFTER)
+    with pytest.raises(RuntimeError):
+        call_provider("fake", provider, timeout=1)
+    assert breaker.state == "open"
+
+
+def test_bounded_outside_a_request():
+    assert remaining() is None
+    assert bounded(5) == 5
+    assert bounded(None) is None
+
+
+def test_bounded_by_the_request_deadline():
+    with request_deadline(1):
+        assert 0 < bounded(10) <= 1
+        assert 0 < bounded(None) <= 1
+        assert bounded(0.5) == 0.5
+        # A nested budget never extends the outer one
+        with request_deadline(10):
+            assert remaining() <= 1
+
+
+def test_exhausted_deadline_skips_the_call(breaker):
+    provider = FakeProvider()
+    with request_deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            bounded(5)
+        with pytest.raises(DeadlineExceeded):
+            call_provider("fake", provider, timeout=5)
+    assert provider.timeouts == []
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_provider_receives_bounded_timeout(breaker):
+    provider = FakeProvider()
+    with request_deadline(1):
+        call_provider("fake", provider, timeout=30)
+    assert 0 < provider.timeouts[0] <= 1
+
+
+@pytest.fixture
+def hedged(monkeypatch, breaker):
+    monkeypatch.setattr(resilience, "HEDGE_PROVIDERS", {"fake"})
+    tracker = resilience.LatencyTracker()
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        tracker.record(0.01)
+    monkeypatch.setitem(resilience._latencies, "fake", tracker)
+
+
+def test_slow_call_is_hedged(hedged):
+    provider = FakeProvider(latency=1)
+    started = time.monotonic()
+    assert call_provider("fake", provider, timeout=2) == "ok"
+    assert time.monotonic() - started < 0.5
+    assert len(provider.timeouts) == 2
+
+
+def test_hedged_call_without_timeout(hedged):
+    provider = FakeProvider()
+    assert call_provider("fake", provider) == "ok"
+    assert provider.timeouts == [None]
+
+
+def test_search_deadline_does_not_trip_search_breaker(monkeypatch):
+    from googli import SearchClient
+
+    breaker = CircuitBreaker("search", failures=1, reset_after=60)
+    monkeypatch.setattr(resilience, "_breakers", {"search": breaker})
+    client = SearchClient()
+    try:
+        with request_deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(DeadlineExceeded):
+                asyncio.run(client._search("salt"))
+    finally:
+        client.close()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
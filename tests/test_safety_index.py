@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+import pytest
+
+from refdata import DATA_DIR, REFERENCE_SOURCES, ReferenceData, build_artifact, clean_value
+from safety_index import NO_CLASSIFICATION, SAFETY_SOURCES, build_safety_index
+
+
+@pytest.fixture(scope="module")
+def reference_data(tmp_path_factory):
+    path = build_artifact(DATA_DIR, str(tmp_path_factory.mktemp("refdata") / "reference.bin"))
+    return ReferenceData(path)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    """The cleaned safety tables as DataFrames, as the old lookup scanned them"""
+    frames = {}
+    for source, *_ in SAFETY_SOURCES:
+        spec = REFERENCE_SOURCES[source]
+        frame = pd.read_csv(os.path.join(DATA_DIR, spec["file"]), dtype=str)
+        frames[source] = pd.DataFrame({column: frame[column].map(clean_value) for column in spec["columns"]})
+    return frames
+
+
+def dataframe_lookup(frames, ingredient_name, cas_number=None):
+    """The DataFrame str.contains lookup SafetyIndex replaced, matching names literally"""
+    safety_info = []
+    for source, name_column, cas_column, result_column, message in SAFETY_SOURCES:
+        frame = frames[source]
+        match = frame[
+            frame[name_column].str.contains(ingredient_name, case=False, na=False, regex=False) |
+            (frame[cas_column] == cas_number)
+        ]
+        if not match.empty:
+            safety_info.append(message.format(match.iloc[0][result_column]))
+    return safety_info if safety_info else [NO_CLASSIFICATION]
+
+
+def sample_names(frames):
+    names = ["sugar", "Sodium", "GUM", "citric acid", "Red 40", "not an ingredient", "(E330)", "x"]
+    for source, name_column, *_ in SAFETY_SOURCES:
+        column = [name for name in frames[source][name_column] if name.isascii()]
+        for name in column[::max(1, len(column) // 15)]:
+            names.append(name)
+            names.append(name.split()[0].upper())
+    return names
+
+
+def test_name_lookups_match_dataframe_scan(reference_data, frames):
+    index = build_safety_index(reference_data)
+    for name in sample_names(frames):
+        assert index.lookup(name) == dataframe_lookup(frames, name), name
+
+
+def test_cas_lookups_match_dataframe_scan(reference_data, frames):
+    index = build_safety_index(reference_data)
+    cas_numbers = [cas for cas in frames["monographs"]["CAS No."] if cas][::40] + ["0000-00-0"]
+    for cas_number in cas_numbers:
+        assert index.lookup("not an ingredient", cas_number) == dataframe_lookup(frames, "not an ingredient", cas_number)
+
+
+def test_lookup_many_answers_every_ingredient(reference_data, frames):
+    index = build_safety_index(reference_data)
+    names = ["sugar", "salt", "not an ingredient"]
+    assert index.lookup_many(names) == {name: dataframe_lookup(frames, name) for name in names}